@@ -1,9 +1,6 @@
 import logging
 
 import streamlit as st
-from snowflake.core import Root
-from snowflake.cortex import Complete
-from snowflake.snowpark import Session
 
 # Import utility functions
 from util.login_page import login_page
@@ -66,6 +63,9 @@ def initialize_session():
             "schema": st.secrets["rag_connection"]["schema"],
         }
         try:
+            # Imported on first use to keep cold starts fast
+            from snowflake.snowpark import Session
+
             st.session_state.session = Session.builder.configs(connection_params).create()
             logging.info("Snowflake session created successfully.")
         except Exception as e:
@@ -465,6 +465,8 @@ def complete(model, prompt, session=None):
     """
     logging.info(f"Generating completion with model: {model}")
     try:
+        from snowflake.cortex import Complete
+
         response = Complete(model, prompt, session=session).replace("$", "\$")
         logging.info("Completion generated successfully.")
         return response
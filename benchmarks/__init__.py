@@ -0,0 +1 @@
+"""Offline performance benchmarks. Run each module with ``python -m benchmarks.<name>``."""
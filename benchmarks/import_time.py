@@ -0,0 +1,84 @@
+"""
+Check the import time of the app entry points against a budget.
+
+Imports each module in a fresh interpreter with ``python -X importtime``, parses
+the per-module timings and reports the cumulative import time and the heaviest
+imports. Exits with status 1 if any module exceeds the budget or pulls in a module
+that must stay lazy (the Snowflake packages), so it can gate CI.
+
+Usage:
+    python -m benchmarks.import_time [--budget-ms 1000] [--top 10] [streamlite_app app]
+"""
+import argparse
+import re
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Sequence, Tuple
+
+REPO_ROOT = Path(__file__).resolve().parent.parent
+
+# Packages the entry points must only import on first use
+LAZY_PACKAGES = ("snowflake",)
+
+_LINE = re.compile(r"^import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s+)(\S+)\s*$")
+
+
+def parse_importtime(output: str) -> Dict[str, Tuple[int, int]]:
+    """Parse ``-X importtime`` output into ``{module: (self_us, cumulative_us)}``."""
+    timings = {}
+    for line in output.splitlines():
+        match = _LINE.match(line)
+        if match:
+            timings[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return timings
+
+
+def measure_import(module: str) -> Dict[str, Tuple[int, int]]:
+    """Import ``module`` from the repository root in a fresh interpreter and return its import timings."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=False,
+    )
+    timings = parse_importtime(result.stderr)
+    if result.returncode != 0 or module not in timings:
+        raise RuntimeError(f"Importing {module} failed:\n{result.stderr[-2000:]}")
+    return timings
+
+
+def check_module(module: str, budget_ms: float, top: int = 10) -> List[str]:
+    """Print ``module``'s import cost and return a list of budget or laziness violations."""
+    timings = measure_import(module)
+    total_ms = timings[module][1] / 1000
+    print(f"{module}: {total_ms:.1f}ms cumulative (budget {budget_ms:.0f}ms)")
+    for name, (_, cumulative) in sorted(timings.items(), key=lambda item: -item[1][1])[1 : top + 1]:
+        print(f"  {cumulative / 1000:8.1f}ms  {name}")
+
+    problems = []
+    if total_ms > budget_ms:
+        problems.append(f"{module} imports in {total_ms:.1f}ms, over the {budget_ms:.0f}ms budget")
+    eager = sorted(name for name in timings if name.split(".")[0] in LAZY_PACKAGES)
+    if eager:
+        problems.append(f"{module} imports {', '.join(eager[:3])} at load time")
+    return problems
+
+
+def main(argv: Sequence[str] = None) -> int:
+    """Check every module and return the exit status."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("modules", nargs="*", default=["streamlite_app", "app"], help="modules to import")
+    parser.add_argument("--budget-ms", type=float, default=1000, help="cumulative import time budget per module")
+    parser.add_argument("--top", type=int, default=10, help="heaviest imports to list")
+    args = parser.parse_args(argv)
+
+    problems = [problem for module in args.modules for problem in check_module(module, args.budget_ms, args.top)]
+    for problem in problems:
+        print(f"FAIL: {problem}")
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,321 @@
+"""
+Load test the app with many simulated users at once.
+
+Each simulated user is a Streamlit ``AppTest`` session that logs in through the
+login form and then asks ``--turns`` chat questions; up to ``--concurrency``
+users are active at a time. The Snowflake modules are replaced by the
+``util.local_cortex`` stand-in with realistic latency, so the run needs no
+network: searches run over a synthetic corpus and completions take a
+log-normally distributed time around ``--complete-ms`` to the first token plus
+``--tokens-per-second`` generation, failing for ``--fail-rate`` of the calls.
+
+The report covers throughput, per-turn and per-stage p50/p95/p99 (stages come
+from the request traces), the error and shed rates, session state per user, RSS
+growth per user and the peak thread count. With thresholds given it exits with
+status 1 when one is exceeded, so it can gate CI.
+
+Usage:
+    python -m benchmarks.load [--users 40] [--concurrency 10] [--turns 3] [--complete-ms 600]
+        [--max-p95-ms 5000] [--max-error-rate 0.01] [--max-state-kb 256]
+"""
+import argparse
+import random
+import resource
+import statistics
+import sys
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, contextmanager
+from typing import Dict, List, Optional
+from unittest.mock import patch
+
+from benchmarks.reruns import APP_PATH, SECRETS, install_local_cortex
+from benchmarks.search_filters import percentile
+from util.local_cortex import make_corpus
+
+QUESTIONS = [
+    "What is an index fund?",
+    "How does compound interest work?",
+    "Should I pay off debt before investing?",
+    "How much should I keep in an emergency fund?",
+    "What is a bond ladder?",
+    "How do dividends get taxed?",
+    "What does diversification protect against?",
+    "Is a mortgage better paid off early?",
+]
+
+ERROR_REPLIES = ("An error occurred.", "An error occurred while processing your request.")
+
+
+def load_secrets(users: int, turns: int, workers: int) -> Dict:
+    """Return the benchmark secrets with tracing on and room for every request's trace."""
+    secrets = {section: dict(values) if isinstance(values, dict) else values for section, values in SECRETS.items()}
+    secrets["tracing"] = {"enabled": True, "keep_traces": users * turns * 2}
+    secrets["generation"] = {"workers": workers, "max_queue": users, "poll_interval_seconds": 0.05}
+    return secrets
+
+
+class ThreadSampler:
+    """Samples the live thread count on a daemon thread and keeps the peak."""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._loop, name="thread-sampler", daemon=True)
+
+    def _loop(self) -> None:
+        while not self._stop.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+    def __enter__(self) -> "ThreadSampler":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def simulate_user(user: int, turns: int, secrets: Dict) -> Dict:
+    """
+    Log one simulated user in and ask ``turns`` questions.
+
+    Returns:
+        The user's login and turn times in milliseconds, turn outcomes and session state bytes
+    """
+    from streamlit.testing.v1 import AppTest
+
+    from streamlite_app import CHAT_HISTORY_KEYS, HIGH_DEMAND_MESSAGE, approx_state_size
+
+    result = {"login_ms": None, "turn_ms": [], "errors": 0, "shed": 0, "state_bytes": 0}
+    # No per-app secrets: concurrent_app_tests installs them process-wide
+    app = AppTest.from_file(APP_PATH, default_timeout=60)
+    app.session_state["page"] = "login"
+    start = time.perf_counter()
+    app.run()
+    app.text_input[0].input(secrets["cred"]["email"])
+    app.text_input[1].input(secrets["cred"]["password"])
+    app.button[0].click().run()
+    if app.exception or app.session_state["page"] != "main":
+        result["errors"] += turns
+        return result
+    app.run()
+    result["login_ms"] = (time.perf_counter() - start) * 1000
+
+    rng = random.Random(user)
+    for _ in range(turns):
+        before = history_length(app, CHAT_HISTORY_KEYS)
+        start = time.perf_counter()
+        app.chat_input[0].set_value(rng.choice(QUESTIONS)).run()
+        result["turn_ms"].append((time.perf_counter() - start) * 1000)
+        replies = [element.value for element in app.markdown]
+        if app.exception or any(reply in ERROR_REPLIES for reply in replies):
+            result["errors"] += 1
+        elif HIGH_DEMAND_MESSAGE in replies:
+            result["shed"] += 1
+        elif history_length(app, CHAT_HISTORY_KEYS) != before + 2:
+            result["errors"] += 1
+
+    state = app.session_state._state
+    result["state_bytes"] = sum(approx_state_size(state[key]) for key in state.filtered_state)
+    return result
+
+
+def history_length(app, keys) -> int:
+    """Return the number of messages in the session's chat histories."""
+    state = app.session_state._state
+    return sum(len(state[key]) for key in keys if key in state)
+
+
+def rss_kb() -> int:
+    """Peak resident set size of this process in KiB."""
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return usage // 1024 if sys.platform == "darwin" else usage
+
+
+def stage_latencies(traces) -> Dict[str, List[float]]:
+    """Return the durations, in milliseconds, of each span name across ``traces``."""
+    from util.request_profile import stage_rows
+
+    stages = defaultdict(list)
+    for trace in traces:
+        for row in stage_rows(trace):
+            stages[row["name"]].append(row["duration_ms"])
+    return stages
+
+
+@contextmanager
+def concurrent_app_tests(secrets: Dict):
+    """
+    Let ``AppTest`` sessions run at the same time in this process.
+
+    ``AppTest`` assumes one session at a time. Every run installs its own mock
+    Streamlit runtime, secrets and config options in process globals and removes
+    them when it ends, compiles the script again (concurrent ``compile`` calls can
+    fail on Python 3.11), and all sessions share one session id. For the duration
+    of the block the secrets and options are set once, the runtime lookup falls
+    back to the last installed mock runtime, the script is compiled once, as by
+    the Streamlit server, and each session gets its own id.
+    """
+    import streamlit as st
+    from streamlit import config
+    from streamlit.runtime import Runtime
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.secrets import Secrets
+    from streamlit.testing.v1.local_script_runner import LocalScriptRunner
+
+    installed = []
+
+    def instance(cls):
+        if cls._instance is not None:
+            installed[:] = [cls._instance]
+        if installed:
+            return installed[0]
+        raise RuntimeError("Runtime hasn't been created!")
+
+    compiled = {}
+    compile_lock = threading.Lock()
+    get_bytecode = ScriptCache.get_bytecode
+
+    def get_shared_bytecode(self, script_path):
+        with compile_lock:
+            if script_path not in compiled:
+                compiled[script_path] = get_bytecode(self, script_path)
+            return compiled[script_path]
+
+    init_runner = LocalScriptRunner.__init__
+
+    def init_runner_with_session_id(self, script_path, session_state, *args, **kwargs):
+        init_runner(self, script_path, session_state, *args, **kwargs)
+        # An AppTest keeps its session state object across runs
+        self._session_id = f"load-session-{id(session_state):x}"
+
+    saved_secrets, saved_app_test = st.secrets, config.get_option("global.appTest")
+    st.secrets = Secrets()
+    st.secrets._secrets = secrets
+    config.set_option("global.appTest", True)
+    try:
+        with ExitStack() as stack:
+            stack.enter_context(patch.object(Runtime, "instance", classmethod(instance)))
+            stack.enter_context(
+                patch.object(Runtime, "exists", classmethod(lambda cls: cls._instance is not None or bool(installed)))
+            )
+            stack.enter_context(patch.object(ScriptCache, "get_bytecode", get_shared_bytecode))
+            stack.enter_context(patch.object(LocalScriptRunner, "__init__", init_runner_with_session_id))
+            yield
+    finally:
+        st.secrets = saved_secrets
+        config.set_option("global.appTest", saved_app_test)
+
+
+def run_load(users: int, concurrency: int, turns: int, workers: int = 8) -> Dict:
+    """
+    Run ``users`` simulated users, ``concurrency`` at a time, against the installed fakes.
+
+    Returns:
+        Summary with throughput, latency percentiles, rates, memory and thread counts
+    """
+    from util.tracing import tracer
+
+    secrets = load_secrets(users, turns, workers)
+    rss_before = rss_kb()
+    start = time.perf_counter()
+    with concurrent_app_tests(secrets), ThreadSampler() as threads:
+        with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="user") as executor:
+            results = list(executor.map(lambda user: simulate_user(user, turns, secrets), range(users)))
+    elapsed = time.perf_counter() - start
+
+    turn_ms = [ms for result in results for ms in result["turn_ms"]]
+    attempted = users * turns
+    errors = sum(result["errors"] for result in results)
+    shed = sum(result["shed"] for result in results)
+    stages = {"login": [result["login_ms"] for result in results if result["login_ms"] is not None], "turn": turn_ms}
+    stages.update(stage_latencies(tracer.recent()))
+    return {
+        "elapsed_s": elapsed,
+        "turns_per_s": len(turn_ms) / elapsed if elapsed else 0.0,
+        "stages": {name: summarize(samples) for name, samples in stages.items() if samples},
+        "error_rate": errors / attempted if attempted else 0.0,
+        "shed_rate": shed / attempted if attempted else 0.0,
+        "state_kb_per_user": statistics.mean(result["state_bytes"] for result in results) / 1024 if results else 0.0,
+        "rss_kb_per_user": (rss_kb() - rss_before) / users if users else 0.0,
+        "peak_threads": threads.peak,
+    }
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """Return the count and p50/p95/p99 of ``samples``."""
+    return {
+        "count": len(samples),
+        "p50": percentile(samples, 50),
+        "p95": percentile(samples, 95),
+        "p99": percentile(samples, 99),
+    }
+
+
+def check(
+    summary: Dict, max_p95_ms: Optional[float], max_error_rate: Optional[float], max_state_kb: Optional[float]
+) -> List[str]:
+    """Return a message for each threshold the summary exceeds."""
+    failures = []
+    turn = summary["stages"].get("turn")
+    if max_p95_ms is not None and turn and turn["p95"] > max_p95_ms:
+        failures.append(f"turn p95 {turn['p95']:.0f}ms exceeds {max_p95_ms:.0f}ms")
+    if max_error_rate is not None and summary["error_rate"] > max_error_rate:
+        failures.append(f"error rate {summary['error_rate']:.3f} exceeds {max_error_rate:.3f}")
+    if max_state_kb is not None and summary["state_kb_per_user"] > max_state_kb:
+        failures.append(f"session state {summary['state_kb_per_user']:.1f}KiB per user exceeds {max_state_kb:.1f}KiB")
+    return failures
+
+
+def main() -> None:
+    """Run the load test, print the report and exit with status 1 if a threshold is exceeded."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=40, help="simulated users")
+    parser.add_argument("--concurrency", type=int, default=10, help="users active at once")
+    parser.add_argument("--turns", type=int, default=3, help="questions asked per user")
+    parser.add_argument("--workers", type=int, default=8, help="answer generation workers")
+    parser.add_argument("--complete-ms", type=float, default=600.0, help="median Complete latency")
+    parser.add_argument("--tokens-per-second", type=float, default=0.0, help="Complete generation rate, 0 for instant")
+    parser.add_argument("--search-ms", type=float, default=80.0, help="Cortex Search round trip")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="fraction of Complete calls that fail")
+    parser.add_argument("--corpus-rows", type=int, default=2000, help="rows in the synthetic search corpus")
+    parser.add_argument("--max-p95-ms", type=float, help="fail if the turn p95 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, help="fail if the error rate exceeds this")
+    parser.add_argument("--max-state-kb", type=float, help="fail if the session state per user exceeds this")
+    args = parser.parse_args()
+
+    install_local_cortex(
+        corpus=make_corpus(args.corpus_rows),
+        search_latency=args.search_ms / 1000,
+        latency=args.complete_ms / 1000,
+        latency_sigma=0.35,
+        tokens_per_second=args.tokens_per_second,
+        error_rate=args.fail_rate,
+    )
+    summary = run_load(args.users, args.concurrency, args.turns, args.workers)
+
+    print(
+        f"users={args.users} concurrency={args.concurrency} turns={args.turns}  "
+        f"elapsed={summary['elapsed_s']:.1f}s  throughput={summary['turns_per_s']:.2f} turns/s"
+    )
+    for name, stats in summary["stages"].items():
+        print(
+            f"  {name:<28} n={stats['count']:5d}  p50={stats['p50']:8.1f}ms  p95={stats['p95']:8.1f}ms  p99={stats['p99']:8.1f}ms"
+        )
+    print(
+        f"error_rate={summary['error_rate']:.3f}  shed_rate={summary['shed_rate']:.3f}  "
+        f"state={summary['state_kb_per_user']:.1f}KiB/user  rss={summary['rss_kb_per_user']:.0f}KiB/user  "
+        f"peak_threads={summary['peak_threads']}"
+    )
+    failures = check(summary, args.max_p95_ms, args.max_error_rate, args.max_state_kb)
+    for failure in failures:
+        print(f"FAIL {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+"""
+Measure the cost of Streamlit reruns of the app.
+
+Runs ``streamlite_app.py`` under Streamlit's ``AppTest`` with the Snowflake
+modules replaced by the ``util.local_cortex`` stand-in with no latency, so only
+the script's own work is timed. For each scenario it reports the wall time per rerun
+and the size of the elements the rerun sends to the browser: the element count,
+their serialized bytes and the bytes spent on ``<style>`` blocks.
+
+Usage:
+    python -m benchmarks.reruns [--reruns 20] [--turns 200]
+"""
+import argparse
+import statistics
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+from benchmarks.search_filters import percentile
+from util.local_cortex import LocalCortex, install
+
+APP_PATH = str(Path(__file__).resolve().parent.parent / "streamlite_app.py")
+
+SECRETS = {
+    "base_prompts": {
+        "financial_literacy": "You are a financial education expert.",
+        "investment": "You are an investment advisor.",
+        "ai_agents": "You are an AI-powered financial analysis agent.",
+    },
+    "cred": {"email": "user@example.com", "password": "password"},
+    "myconnection": {"account": "a", "user": "u", "password": "p", "warehouse": "w", "database": "d", "schema": "s"},
+    "warmup": {"enabled": False},
+}
+
+
+def install_local_cortex(**options) -> LocalCortex:
+    """Route the app's Snowflake imports to a ``LocalCortex`` built with ``options``."""
+    return install(LocalCortex(**options))
+
+
+def payload(node) -> Tuple[int, int, int]:
+    """Return element count, serialized bytes and ``<style>`` bytes under an AppTest tree node."""
+    children = getattr(node, "children", None)
+    if isinstance(children, dict):
+        totals = [payload(child) for child in children.values()]
+        return tuple(sum(values) for values in zip(*totals)) if totals else (0, 0, 0)
+    proto = getattr(node, "proto", None)
+    size = proto.ByteSize() if proto is not None and hasattr(proto, "ByteSize") else 0
+    body = getattr(proto, "body", "")
+    return 1, size, size if isinstance(body, str) and "<style>" in body else 0
+
+
+def new_app(page: str):
+    """Return an ``AppTest`` for the app on ``page``, logged in for the main page."""
+    from streamlit.testing.v1 import AppTest
+
+    app = AppTest.from_file(APP_PATH, default_timeout=30)
+    app.secrets.update(SECRETS)
+    app.session_state["page"] = page
+    return app
+
+
+def long_transcript(turns: int) -> List[Dict]:
+    """Return a chat history of ``turns`` questions and cited answers."""
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"Question {turn} about index funds?"})
+        messages.append({"role": "assistant", "content": f"Answer {turn}. " * 20, "citations": [f"Chunk {turn}"] * 3})
+    return messages
+
+
+def measure(label: str, app, action: Callable, reruns: int) -> Dict[str, float]:
+    """Run ``action(app)`` ``reruns`` times after a first run and print per-rerun cost."""
+    app.run()
+    times: List[float] = []
+    for _ in range(reruns):
+        start = time.perf_counter()
+        action(app)
+        times.append((time.perf_counter() - start) * 1000)
+        if app.exception:
+            raise RuntimeError(f"{label}: {app.exception[0].value}")
+    elements, size, style = payload(app._tree)
+    print(
+        f"{label:<14} p50={percentile(times, 50):7.2f}ms  p95={percentile(times, 95):7.2f}ms  "
+        f"mean={statistics.mean(times):7.2f}ms  elements={elements:4d}  bytes={size:6d}  style_bytes={style:5d}"
+    )
+    return {"p50": percentile(times, 50), "elements": elements, "bytes": size, "style_bytes": style}
+
+
+def main() -> None:
+    """Run each rerun scenario and print one line per scenario."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--reruns", type=int, default=20, help="reruns measured per scenario")
+    parser.add_argument("--turns", type=int, default=200, help="turns in the long transcript scenario")
+    args = parser.parse_args()
+
+    install_local_cortex()
+    measure("landing", new_app("landing"), lambda app: app.run(), args.reruns)
+    measure("main", new_app("main"), lambda app: app.run(), args.reruns)
+    long_chat = new_app("main")
+    long_chat.session_state["fin_lit_messages"] = long_transcript(args.turns)
+    measure(f"long_chat_{args.turns}", long_chat, lambda app: app.run(), args.reruns)
+    measure("chat_submit", new_app("main"), lambda app: app.chat_input[0].set_value("What is an index fund?").run(), args.reruns)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Benchmark Cortex Search filter pushdown against client-side filtering.
+
+Uses the local search stand-in over a synthetic corpus. "pushdown" sends the
+profile filter with the query so the service narrows candidates before ranking;
+"client" over-fetches unfiltered results and discards non-matching rows locally,
+which is what the app did before filters were passed through.
+
+Usage:
+    python -m benchmarks.search_filters [--rows 20000] [--queries 200] [--limit 5]
+"""
+import argparse
+import random
+import statistics
+import time
+from typing import Callable, Dict, List
+
+from util.local_cortex import VOCABULARY, make_corpus
+from util.local_search import LocalCortexSearchService
+from util.search_filters import build_search_filter, matches_filter
+
+
+def percentile(samples: List[float], pct: float) -> float:
+    """Return the ``pct`` percentile of ``samples``."""
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def run(label: str, fn: Callable[[str], int], queries: List[str]) -> None:
+    """Time ``fn`` over ``queries`` and print latency percentiles and hit counts."""
+    latencies, hits = [], []
+    for query in queries:
+        start = time.perf_counter()
+        hits.append(fn(query))
+        latencies.append((time.perf_counter() - start) * 1000)
+    print(
+        f"{label:<10} p50={percentile(latencies, 50):7.2f}ms  p95={percentile(latencies, 95):7.2f}ms  "
+        f"mean={statistics.mean(latencies):7.2f}ms  avg_hits={statistics.mean(hits):.2f}"
+    )
+
+
+def main() -> None:
+    """Run the benchmark and print one line per mode."""
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=20000, help="corpus size")
+    parser.add_argument("--queries", type=int, default=200, help="number of queries per mode")
+    parser.add_argument("--limit", type=int, default=5, help="results requested per query")
+    parser.add_argument("--overfetch", type=int, default=10, help="client-side over-fetch multiplier")
+    parser.add_argument("--per-result-ms", type=float, default=0.2, help="simulated transfer time per returned row")
+    args = parser.parse_args()
+
+    corpus = make_corpus(args.rows)
+    service = LocalCortexSearchService(
+        corpus,
+        attributes=("section", "audience", "topic", "source"),
+        per_result_latency=args.per_result_ms / 1000,
+    )
+    rng = random.Random(1)
+    queries = [" ".join(rng.sample(VOCABULARY, 3)) for _ in range(args.queries)]
+    search_filter = build_search_filter(section="investment", audience="Conservative", topic=["Retirement"])
+
+    def unfiltered(query: str) -> int:
+        return len(service.search(query, columns=["CHUNK"], limit=args.limit).results)
+
+    def pushdown(query: str) -> int:
+        return len(service.search(query, columns=["CHUNK"], filter=search_filter, limit=args.limit).results)
+
+    def client(query: str) -> int:
+        columns = ["CHUNK", "section", "audience", "topic"]
+        results = service.search(query, columns=columns, limit=args.limit * args.overfetch).results
+        return len([row for row in results if matches_filter(row, search_filter)][: args.limit])
+
+    print(f"corpus={args.rows} rows, queries={args.queries}, limit={args.limit}, filter={search_filter}")
+    run("unfiltered", unfiltered, queries)
+    run("client", client, queries)
+    run("pushdown", pushdown, queries)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,20 +6,21 @@ import json
 import logging
 import os
 import time
+from collections import Counter
 from datetime import datetime
-from typing import Dict, List
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
 
 import numpy as np
 import pandas as pd
 from dotenv import load_dotenv
-from snowflake.core import Root
-from snowflake.cortex import Complete
-from snowflake.snowpark.session import Session
 from trulens.apps.custom import TruCustomApp, instrument
 from trulens.connectors.snowflake import SnowflakeConnector
 from trulens.core import Feedback, Select, TruSession
 from trulens.providers.cortex.provider import Cortex
 
+from util.local_cortex import LocalCortex, load_corpus
+from util.session_pool import ManagedSession, SessionPool
+
 # Configure logging
 logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
 logger = logging.getLogger(__name__)
@@ -38,6 +39,19 @@ connection_params = {
     "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE"),
 }
 
+# CORTEX_BACKEND=local runs retrieval and completions offline against util.local_cortex,
+# over the JSON lines corpus LOCAL_CORTEX_CORPUS if set; TruLens feedback still needs Snowflake
+if os.getenv("CORTEX_BACKEND", "snowflake") == "local":
+    local_cortex = LocalCortex(
+        corpus=load_corpus(os.environ["LOCAL_CORTEX_CORPUS"]) if os.getenv("LOCAL_CORTEX_CORPUS") else None,
+        latency=float(os.getenv("LOCAL_CORTEX_LATENCY_MS", "0")) / 1000,
+    )
+    Root, Complete, Session = local_cortex.Root, local_cortex.Complete, local_cortex.Session
+else:
+    from snowflake.core import Root
+    from snowflake.cortex import Complete
+    from snowflake.snowpark.session import Session
+
 # Global variables for TruLens
 tru_snowflake_connector = None
 tru_session = None
@@ -53,8 +67,13 @@ def initialize_trulens(snowpark_session: Session) -> None:
 class CortexSearchRetriever:
     """Retriever class for Cortex search service."""
 
-    def __init__(self, snowpark_session: Session, limit_to_retrieve: int = 4):
-        """Initialize with Snowpark session and retrieval limit."""
+    def __init__(self, snowpark_session: Union[Session, "ConnectionManager"], limit_to_retrieve: int = 4):
+        """
+        Initialize with a Snowpark session and retrieval limit.
+
+        Given the run's ``ConnectionManager`` instead of a session, each search runs on
+        its current session, so searches keep working after it reconnects.
+        """
         self._snowpark_session = snowpark_session
         self._limit_to_retrieve = limit_to_retrieve
 
@@ -69,19 +88,11 @@ class CortexSearchRetriever:
             List of retrieved document texts
         """
         try:
-            cortex_search_service = (
-                Root()
-                .databases[os.getenv("SNOWFLAKE_DATABASE")]
-                .schemas[os.getenv("SNOWFLAKE_SCHEMA")]
-                .cortex_search_services[os.getenv("SNOWFLAKE_CORTEX_SEARCH_SERVICE")]
-            )
-
             logger.info(f"Searching with query: {query}")
-            resp = cortex_search_service.search(
-                query=query,
-                columns=["CHUNK"],
-                limit=self._limit_to_retrieve,
-            )
+            if isinstance(self._snowpark_session, ConnectionManager):
+                resp = self._snowpark_session.run(self._search(query), "retriever")
+            else:
+                resp = self._search(query)(self._snowpark_session)
 
             if resp and hasattr(resp, "results"):
                 return [curr["CHUNK"] for curr in resp.results]
@@ -93,6 +104,20 @@ class CortexSearchRetriever:
             logger.error(f"Error during retrieval: {str(e)}")
             return []
 
+    def _search(self, query: str) -> Callable[[Session], Any]:
+        """Return a function searching the Cortex search service for ``query`` on a session."""
+
+        def search(snowpark_session: Session) -> Any:
+            cortex_search_service = (
+                Root(snowpark_session)
+                .databases[os.getenv("SNOWFLAKE_DATABASE")]
+                .schemas[os.getenv("SNOWFLAKE_SCHEMA")]
+                .cortex_search_services[os.getenv("SNOWFLAKE_CORTEX_SEARCH_SERVICE")]
+            )
+            return cortex_search_service.search(query=query, columns=["CHUNK"], limit=self._limit_to_retrieve)
+
+        return search
+
 
 def create_snowpark_session():
     try:
@@ -105,14 +130,113 @@ def create_snowpark_session():
         return None
 
 
-class RAG_from_scratch:
-    def __init__(self):
-        """Initialize RAG with Cortex search."""
+class ConnectionManager:
+    """
+    Snowflake connections shared by one evaluation run.
+
+    The retriever, completions, TruLens connector and feedback provider all use one
+    Snowpark session, opened on first use and reconnected if it expires. Work done
+    through ``run`` always gets the current session; the TruLens connector and feedback
+    providers hold a session, so ``trulens`` and ``provider`` rebuild them after a
+    reconnect and callers should fetch them from the manager rather than keep them.
+    With ``pool_size`` above 1, ``run`` spreads calls over a pool of that many sessions
+    so they can run in parallel. Use as a context manager to close the sessions and
+    log reuse metrics at the end of the run.
+    """
+
+    def __init__(self, pool_size: int = 1):
+        """
+        Initialize without connecting.
+
+        Args:
+            pool_size: Sessions available to ``run`` for parallel work
+        """
+        self._primary = ManagedSession(self._connect)
+        self._pool = SessionPool(self._connect, min_size=0, max_size=pool_size) if pool_size > 1 else None
+        self._providers: Dict[str, Tuple[Session, Cortex]] = {}
+        self._trulens_session: Optional[Session] = None
+        self.logins = 0
+        self.calls: Counter = Counter()
+        self.tru_snowflake_connector = None
+        self.tru_session = None
+
+    def _connect(self) -> Session:
+        """Open a Snowpark session, raising if the login fails."""
         snowpark_session = create_snowpark_session()
-        initialize_trulens(snowpark_session)
-        self.retriever = CortexSearchRetriever(snowpark_session=snowpark_session, limit_to_retrieve=4)
-        self.tru_snowflake_connector = tru_snowflake_connector
-        self.tru_session = tru_session
+        if snowpark_session is None:
+            raise ConnectionError("Could not create Snowpark session")
+        self.logins += 1
+        return snowpark_session
+
+    def session(self) -> Session:
+        """Return the shared session as of now; it is replaced when the session reconnects."""
+        return self._primary.session
+
+    def run(self, call: Callable[[Session], Any], consumer: str = "run") -> Any:
+        """
+        Return ``call(session)`` on a pooled session if configured, else the shared one.
+
+        The call is counted against ``consumer`` and retried on a new session if the
+        current one turns out to have expired.
+        """
+        self.calls[consumer] += 1
+        if self._pool is not None:
+            return self._pool.run(call)
+        return self._primary.run(call)
+
+    def trulens(self):
+        """Return the TruLens connector and session, created once per Snowpark session."""
+        snowpark_session = self.session()
+        if self.tru_session is None or self._trulens_session is not snowpark_session:
+            initialize_trulens(snowpark_session)
+            self.tru_snowflake_connector, self.tru_session = tru_snowflake_connector, tru_session
+            self._trulens_session = snowpark_session
+        return self.tru_snowflake_connector, self.tru_session
+
+    def provider(self, model: str = "mistral-large2") -> Cortex:
+        """Return the Cortex feedback provider for ``model``, created once per Snowpark session."""
+        snowpark_session = self.session()
+        if model not in self._providers or self._providers[model][0] is not snowpark_session:
+            self._providers[model] = (snowpark_session, Cortex(snowpark_session, model))
+        return self._providers[model][1]
+
+    def stats(self) -> Dict[str, Any]:
+        """Return logins, calls per consumer and reconnects."""
+        stats = {"logins": self.logins, "calls": dict(self.calls), "reconnects": self._primary.reconnects}
+        if self._pool is not None:
+            stats["pool"] = self._pool.stats()
+        return stats
+
+    def close(self) -> None:
+        """Close every session opened for the run."""
+        self._primary.close()
+        if self._pool is not None:
+            self._pool.close()
+        logger.info(f"Closed Snowpark sessions: {self.stats()}")
+
+    def __enter__(self) -> "ConnectionManager":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+
+class RAG_from_scratch:
+    def __init__(self, connections: Optional[ConnectionManager] = None):
+        """Initialize RAG with Cortex search on the run's shared connections."""
+        self.connections = connections or ConnectionManager()
+        self.connections.trulens()
+        self.retriever = CortexSearchRetriever(snowpark_session=self.connections, limit_to_retrieve=4)
+
+    @property
+    def tru_snowflake_connector(self):
+        """The TruLens connector on the run's current session."""
+        return self.connections.trulens()[0]
+
+    @property
+    def tru_session(self):
+        """The TruLens session on the run's current session."""
+        return self.connections.trulens()[1]
 
     @instrument
     def retrieve_context(self, query: str) -> List[str]:
@@ -139,7 +263,7 @@ class RAG_from_scratch:
           {query}
           Answer:
         """
-        result = Complete("mistral-large2", prompt)
+        result = self.connections.run(lambda session: Complete("mistral-large2", prompt, session=session), "completion")
         return str(result) if result is not None else ""
 
     @instrument
@@ -150,13 +274,13 @@ class RAG_from_scratch:
         return str(result) if result is not None else ""
 
 
-def main():
+def main(connections: Optional[ConnectionManager] = None):
     """Main function to test the Cortex search retriever."""
+    owned = connections is None
+    connections = connections or ConnectionManager()
     try:
-        snowpark_session = create_snowpark_session()
-
         # Initialize retriever
-        retriever = CortexSearchRetriever(snowpark_session=snowpark_session)
+        retriever = CortexSearchRetriever(snowpark_session=connections)
 
         # Test queries
         test_queries = [
@@ -183,18 +307,17 @@ def main():
     except Exception as e:
         logger.error(f"Error in main: {str(e)}")
     finally:
-        if "snowpark_session" in locals():
-            snowpark_session.close()
-            logger.info("Closed Snowpark session")
+        if owned:
+            connections.close()
 
 
-def feedback_function():
+def feedback_function(connections: Optional[ConnectionManager] = None):
     """Evaluate search results using TruLens feedback."""
+    owned = connections is None
+    connections = connections or ConnectionManager()
     try:
-        snowpark_session = create_snowpark_session()
-        # Fix: Pass snowpark_session instead of connection
-        provider = Cortex(snowpark_session, "mistral-large2")
-        initialize_trulens(snowpark_session)
+        provider = connections.provider("mistral-large2")
+        connections.trulens()
 
         f_groundedness = (
             Feedback(provider.groundedness_measure_with_cot_reasons, name="Groundedness")
@@ -213,9 +336,8 @@ def feedback_function():
     except Exception as e:
         logger.error(f"Error in feedback_function: {str(e)}")
     finally:
-        if "snowpark_session" in locals():
-            snowpark_session.close()
-            logger.info("Closed Snowpark session")
+        if owned:
+            connections.close()
 
 
 def convert_to_serializable(obj):
@@ -291,67 +413,72 @@ def save_evaluation_results_detailed(evaluation_results, filename="evaluation_re
 
 
 if __name__ == "__main__":
-    main()
-    rag = RAG_from_scratch()
-
-    feedback_function()
-
-    # Define prompts list
-    prompts = [
-        "What is financial literacy?",
-        "what are the key factors in financial literacy?",
-    ]
-
-    # Initialize results storage
-    all_results: Dict[str, List] = {
-        "timestamps": [],
-        "queries": [],
-        "responses": [],
-        "latencies": [],
-        "costs": [],
-        "groundedness_scores": [],
-        "context_relevance_scores": [],
-        "answer_relevance_scores": [],
-    }
-
-    # Process each prompt
-    for prompt in prompts:
-        start_time = time.time()
-
-        # Get response from RAG
-        response = rag.query(prompt)
-
-        # Calculate metrics
-        latency = time.time() - start_time
-
-        # Store results
-        timestamp = datetime.now().isoformat()
-        all_results["timestamps"].append(timestamp)
-        all_results["queries"].append(prompt)
-        all_results["responses"].append(response)
-        all_results["latencies"].append(latency)
-
-        # Default values for metrics
-        all_results["groundedness_scores"].append(0.0)
-        all_results["context_relevance_scores"].append(0.0)
-        all_results["answer_relevance_scores"].append(0.0)
-        all_results["costs"].append(0.0)
-
-        # Get TruLens feedback if available
-        if tru_session:
-            try:
-                feedback = tru_session.get_records_and_feedback()
-                if feedback and len(feedback) > 0:
-                    latest_feedback = feedback[-1]
-                    if isinstance(latest_feedback, dict):
-                        metrics = latest_feedback.get("metrics", {})
-                        all_results["groundedness_scores"][-1] = float(metrics.get("groundedness", 0.0))
-                        all_results["context_relevance_scores"][-1] = float(metrics.get("context_relevance", 0.0))
-                        all_results["answer_relevance_scores"][-1] = float(metrics.get("answer_relevance", 0.0))
-                        all_results["costs"][-1] = float(metrics.get("total_cost", 0.0))
-            except Exception as e:
-                logger.error(f"Error processing feedback: {str(e)}")
-
-    # Save results
-    if all_results:
-        save_evaluation_results(all_results, "cortex_evaluation_results")
+    # One login for the whole run, shared by retrieval, completion, TruLens and feedback
+    connections = ConnectionManager(pool_size=int(os.getenv("EVAL_POOL_SIZE", "1")))
+    try:
+        main(connections)
+        rag = RAG_from_scratch(connections)
+
+        feedback_function(connections)
+
+        # Define prompts list
+        prompts = [
+            "What is financial literacy?",
+            "what are the key factors in financial literacy?",
+        ]
+
+        # Initialize results storage
+        all_results: Dict[str, List] = {
+            "timestamps": [],
+            "queries": [],
+            "responses": [],
+            "latencies": [],
+            "costs": [],
+            "groundedness_scores": [],
+            "context_relevance_scores": [],
+            "answer_relevance_scores": [],
+        }
+
+        # Process each prompt
+        for prompt in prompts:
+            start_time = time.time()
+
+            # Get response from RAG
+            response = rag.query(prompt)
+
+            # Calculate metrics
+            latency = time.time() - start_time
+
+            # Store results
+            timestamp = datetime.now().isoformat()
+            all_results["timestamps"].append(timestamp)
+            all_results["queries"].append(prompt)
+            all_results["responses"].append(response)
+            all_results["latencies"].append(latency)
+
+            # Default values for metrics
+            all_results["groundedness_scores"].append(0.0)
+            all_results["context_relevance_scores"].append(0.0)
+            all_results["answer_relevance_scores"].append(0.0)
+            all_results["costs"].append(0.0)
+
+            # Get TruLens feedback if available
+            if rag.tru_session:
+                try:
+                    feedback = rag.tru_session.get_records_and_feedback()
+                    if feedback and len(feedback) > 0:
+                        latest_feedback = feedback[-1]
+                        if isinstance(latest_feedback, dict):
+                            metrics = latest_feedback.get("metrics", {})
+                            all_results["groundedness_scores"][-1] = float(metrics.get("groundedness", 0.0))
+                            all_results["context_relevance_scores"][-1] = float(metrics.get("context_relevance", 0.0))
+                            all_results["answer_relevance_scores"][-1] = float(metrics.get("answer_relevance", 0.0))
+                            all_results["costs"][-1] = float(metrics.get("total_cost", 0.0))
+                except Exception as e:
+                    logger.error(f"Error processing feedback: {str(e)}")
+
+        # Save results
+        if all_results:
+            save_evaluation_results(all_results, "cortex_evaluation_results")
+    finally:
+        connections.close()
@@ -1,20 +1,63 @@
+import hashlib
+import hmac
+import json
 import logging
+import pickle
+import sys
+import threading
+from collections import deque
 
 import streamlit as st
-from snowflake.core import Root
-from snowflake.cortex import Complete
-from snowflake.snowpark import Session
+from streamlit.runtime import Runtime
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+from util.admission import OverloadedError
 
 # Import utility functions
+from util.cache_backends import KeyValueCacheBackend, SQLiteCacheBackend, TieredCache
+from util.cache_snapshot import CacheSnapshotter
+from util.conversation_context import DELTA, REUSE, ConversationContextMemory
+from util.conversation_store import SnowflakeConversationStore, SQLiteConversationStore
+from util.generation import GenerationPool, current_job
+from util.idle_sessions import IdleSessionManager
+from util.local_cortex import LocalCortex, install, load_corpus, make_corpus
 from util.login_page import login_page
+from util.metrics import MetricsRegistry, TraceMetrics, start_http_server
+from util.page_styles import page_stylesheet
+from util.prefetch import FollowUpPredictor, RetrievalPrefetcher
+from util.prompts import PromptRegistry
+from util.request_profile import format_waterfall, profile_trace
+from util.retrieval_cache import RetrievalCache, make_key
+from util.search_filters import build_search_filter
+from util.session_pool import SessionPool
 from util.signup_page import signup_page
-
-# Configure logging
-logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(message)s")
+from util.structured_logging import configure_logging
+from util.tracing import JsonLinesExporter, approx_tokens, traced, tracer
+from util.transcript import ChatTranscript, prompt_history
+from util.warmup import start_warmup
 
 # Define the model to use
 MODEL_NAME = "mistral-large2"
 
+# Cortex Search services used by the app sections
+CORTEX_SEARCH_SERVICES = ["EDU_SERVICE", "FIN_SERVICE"]
+
+# Returned by ``complete`` when the model call fails; never cached
+COMPLETION_ERROR = "An error occurred."
+
+# Shown when a question is turned away under load
+HIGH_DEMAND_MESSAGE = "Econo Genie is in high demand right now. Please try your question again in a minute."
+
+# Profile fields pushed down to Cortex Search as attribute filters, keyed by attribute column
+PROFILE_FILTER_ATTRIBUTES = {
+    "section": "current_section",
+    "audience": "risk_profile",
+    "topic": "financial_goals",
+}
+
+# App section of each chat interface
+FEATURE_SECTIONS = {"fin_lit": "financial_literacy", "investment": "investment", "ai_agent": "ai_agents"}
+
 # Define chat icons/avatars
 icons = {"user": "👤", "assistant": "🤖", "system": "ℹ️"}
 
@@ -26,55 +69,523 @@ st.set_page_config(
     initial_sidebar_state="expanded",
 )
 
-# Use Streamlit's built-in theme configuration
-st.markdown(
-    """
-    <style>
-        /* Minimal custom styling */
-        .stButton>button {
-            width: 100%;
-            margin-top: 1rem;
-        }
-        .stForm {
-            padding: 1rem;
-            border-radius: 0.5rem;
-        }
-        /* Hide Streamlit branding */
-        #MainMenu {visibility: hidden;}
-        footer {visibility: hidden;}
-        header {visibility: hidden;}
-    </style>
-""",
-    unsafe_allow_html=True,
-)
 
+def inject_page_css(page):
+    """
+    Emit the page's merged stylesheet as a single element.
+
+    Streamlit drops elements a rerun does not emit, so this runs on every rerun;
+    the stylesheet itself is built once per process.
+    """
+    st.markdown(page_stylesheet(page), unsafe_allow_html=True)
+
+
+def get_setting(section, key, default=None):
+    """
+    Read an optional setting from ``st.secrets[section][key]``, falling back to ``default``.
+    """
+    try:
+        return st.secrets[section].get(key, default)
+    except (KeyError, FileNotFoundError):
+        return default
+
+
+@st.cache_resource
+def get_shared_cache_backend():
+    """
+    Shared cache tier behind the in-process caches, configured under ``[cache]`` in secrets.
+
+    ``shared = "sqlite"`` shares entries between the server processes of a host
+    through the file at ``shared_path``; ``shared = "kv"`` shares them between
+    replicas through the Redis-compatible store at ``shared_url`` (requires the
+    ``redis`` package). Returns None, keeping caches in-process, by default or
+    if the backend cannot be opened.
+    """
+    kind = get_setting("cache", "shared")
+    try:
+        if kind == "sqlite":
+            return SQLiteCacheBackend(
+                get_setting("cache", "shared_path", "cache.db"), max_entries=get_setting("cache", "shared_max_entries", 100000)
+            )
+        if kind == "kv":
+            import redis
+
+            return KeyValueCacheBackend(
+                redis.Redis.from_url(get_setting("cache", "shared_url")),
+                prefix=get_setting("cache", "shared_prefix", "econo-genie:"),
+            )
+    except Exception as e:
+        logging.warning("Could not open the %s shared cache, caching in-process only: %s", kind, e)
+    return None
+
+
+def new_tiered_cache(namespace, max_entries, ttl_seconds):
+    """
+    Create a process-wide cache with an in-process LRU tier and the shared tier, if configured.
+    """
+    return TieredCache(
+        namespace,
+        RetrievalCache(max_entries=max_entries, ttl_seconds=ttl_seconds),
+        get_shared_cache_backend(),
+        ttl_seconds=ttl_seconds,
+    )
+
+
+@st.cache_resource
+def get_retrieval_cache():
+    """
+    Process-wide cache of Cortex Search results, shared by all sessions.
+    """
+    return new_tiered_cache(
+        "retrieval",
+        get_setting("cache", "retrieval_max_entries", 1024),
+        get_setting("cache", "retrieval_ttl_seconds", 600),
+    )
 
-# Helper function to initialize the Snowflake session once
-def initialize_session():
+
+@st.cache_resource
+def get_rewrite_cache():
+    """
+    Process-wide cache of chat history rewrites of questions into search queries.
+    """
+    return new_tiered_cache(
+        "rewrite",
+        get_setting("cache", "rewrite_max_entries", 1024),
+        get_setting("cache", "rewrite_ttl_seconds", 3600),
+    )
+
+
+@st.cache_resource
+def get_completion_cache():
     """
-    Initialize a Snowflake session for the Streamlit application.
+    Process-wide cache of answers keyed on model and full prompt; ``completions = true`` under ``[cache]`` enables it.
     """
-    logging.info("Initializing Snowflake session.")
-    if "session" not in st.session_state:
-        logging.info("Snowflake session not found in session state, creating a new one.")
-        connection_params = {
-            "account": st.secrets["myconnection"]["account"],
-            "user": st.secrets["myconnection"]["user"],
-            "password": st.secrets["myconnection"]["password"],
-            "warehouse": st.secrets["myconnection"]["warehouse"],
-            "database": st.secrets["myconnection"]["database"],
-            "schema": st.secrets["myconnection"]["schema"],
-        }
+    if not get_setting("cache", "completions", False):
+        return None
+    return new_tiered_cache(
+        "completion",
+        get_setting("cache", "completion_max_entries", 512),
+        get_setting("cache", "completion_ttl_seconds", 3600),
+    )
+
+
+@st.cache_resource
+def get_follow_up_predictor():
+    """
+    Process-wide follow-up predictor, seeded from the configured conversation log.
+    """
+    predictor = FollowUpPredictor()
+    log_path = get_setting("prefetch", "follow_up_log")
+    if log_path:
         try:
-            st.session_state.session = Session.builder.configs(connection_params).create()
-            logging.info("Snowflake session created successfully.")
-        except Exception as e:
-            logging.error(f"Error creating Snowflake session: {e}")
-            st.error("Failed to connect to Snowflake. Please check your credentials.")
-            return None
-    else:
-        logging.info("Snowflake session found in session state.")
-    return st.session_state.session
+            predictor.load_log(log_path)
+        except (OSError, ValueError) as e:
+            logging.warning("Could not load follow-up log %s: %s", log_path, e)
+    return predictor
+
+
+@st.cache_resource
+def get_prefetcher():
+    """
+    Process-wide background prefetcher that warms the retrieval cache.
+    """
+    return RetrievalPrefetcher(get_retrieval_cache(), max_workers=get_setting("prefetch", "max_workers", 2))
+
+
+@st.cache_resource
+def get_generation_pool():
+    """
+    Process-wide answer generation pool, configured under ``[generation]`` in secrets.
+
+    ``workers`` caps the answers, and so the Cortex calls, generated at once. At
+    most ``max_queue`` more wait for a worker, short follow-ups first, and a
+    waiting answer is given up after ``max_queue_seconds``.
+    """
+    return GenerationPool(
+        max_workers=get_setting("generation", "workers", 8),
+        max_queue=get_setting("generation", "max_queue", 32),
+        priority_burst=get_setting("generation", "priority_burst", 3),
+        max_queue_seconds=get_setting("generation", "max_queue_seconds", 60),
+    )
+
+
+@st.cache_resource
+def get_prompt_registry():
+    """
+    Chat prompt templates compiled once from ``st.secrets["base_prompts"]``.
+    """
+    return PromptRegistry(st.secrets["base_prompts"])
+
+
+def get_connection_params():
+    """
+    Return the Snowflake connection parameters from secrets.
+    """
+    return {
+        "account": st.secrets["myconnection"]["account"],
+        "user": st.secrets["myconnection"]["user"],
+        "password": st.secrets["myconnection"]["password"],
+        "warehouse": st.secrets["myconnection"]["warehouse"],
+        "database": st.secrets["myconnection"]["database"],
+        "schema": st.secrets["myconnection"]["schema"],
+    }
+
+
+@st.cache_resource
+def get_local_cortex():
+    """
+    Route Snowflake calls to the offline ``util.local_cortex`` stand-in, once per process.
+
+    Enabled with ``backend = "local"`` under ``[cortex]`` in secrets, to develop and
+    benchmark without network access; returns None otherwise. Searches run over
+    the JSON lines file ``corpus_path``, or a synthetic corpus of ``corpus_rows``
+    rows, and ``search_latency_ms``, ``latency_ms``, ``latency_sigma``,
+    ``tokens_per_second``, ``error_rate`` and ``seed`` shape the simulated calls.
+    """
+    if get_setting("cortex", "backend", "snowflake") != "local":
+        return None
+    corpus_path = get_setting("cortex", "corpus_path")
+    seed = get_setting("cortex", "seed", 0)
+    return install(
+        LocalCortex(
+            corpus=load_corpus(corpus_path) if corpus_path else make_corpus(get_setting("cortex", "corpus_rows", 1000), seed),
+            search_latency=get_setting("cortex", "search_latency_ms", 0) / 1000,
+            latency=get_setting("cortex", "latency_ms", 0) / 1000,
+            latency_sigma=get_setting("cortex", "latency_sigma", 0.0),
+            tokens_per_second=get_setting("cortex", "tokens_per_second", 0.0),
+            error_rate=get_setting("cortex", "error_rate", 0.0),
+            seed=seed,
+        )
+    )
+
+
+def create_snowflake_session():
+    """
+    Create a new Snowpark session. Used by the session pool to open connections.
+    """
+    logging.info("Creating a new Snowflake session.")
+    # Snowflake modules are imported on first use to keep cold starts fast
+    from snowflake.snowpark import Session
+
+    return Session.builder.configs(get_connection_params()).create()
+
+
+@st.cache_resource
+def get_session_pool():
+    """
+    Process-wide pool of Snowpark sessions shared by every browser session.
+    """
+    pool = SessionPool(
+        create_snowflake_session,
+        min_size=get_setting("session_pool", "min_size", 1),
+        max_size=get_setting("session_pool", "max_size", 8),
+        idle_timeout=get_setting("session_pool", "idle_timeout_seconds", 300),
+        checkout_timeout=get_setting("session_pool", "checkout_timeout_seconds", 30),
+        validate_after=get_setting("session_pool", "validate_after_seconds", 60),
+        keepalive_interval=get_setting("session_pool", "keepalive_interval_seconds", 900),
+    )
+    pool.start_reaper(interval=get_setting("session_pool", "reap_interval_seconds", 60))
+    return pool
+
+
+def warm_snowflake_sessions():
+    """
+    Open the pool's minimum sessions on a background thread after login.
+
+    Disabled with ``warm_on_login = false`` under ``[session_pool]`` in secrets.
+    """
+    if not get_setting("session_pool", "warm_on_login", True):
+        return
+    try:
+        get_session_pool().prewarm_async()
+    except Exception as e:
+        logging.warning("Could not start Snowflake warm-up: %s", e)
+
+
+def build_warmup_steps():
+    """
+    Return the process warm-up steps configured under ``[warmup]`` in secrets.
+
+    Prompts are compiled, pooled sessions opened and the search services probed.
+    ``resume_warehouse = true`` adds a tiny completion to resume the warehouse, and
+    ``top_questions`` pre-populates the retrieval cache for every search service.
+    """
+    pool = get_session_pool()
+    cache = get_retrieval_cache()
+    runners = {name: make_pooled_search_runner(pool, name) for name in CORTEX_SEARCH_SERVICES}
+    columns, limit = ["CHUNK"], get_setting("warmup", "limit", 5)
+
+    def probe_services():
+        for run in runners.values():
+            run("warm up", columns, {}, 1)
+        return f"{len(runners)} services resolved"
+
+    def resume_warehouse():
+        from snowflake.cortex import Complete
+
+        pool.run(lambda session: Complete(MODEL_NAME, "Reply with OK.", session=session))
+
+    def seed_cache(questions):
+        seeded = 0
+        for question in questions:
+            for name, run in runners.items():
+                key = make_key(name, question, columns, {}, limit)
+                if key in cache:
+                    # Restored from a snapshot
+                    continue
+                context, results = run(question, columns, {}, limit)
+                if results:
+                    cache.put(key, (context, results))
+                    seeded += 1
+        return f"{seeded} cache entries"
+
+    steps = [
+        ("prompts", lambda: f"{len(get_prompt_registry().sections)} sections"),
+        ("sessions", lambda: f"{pool.prewarm()} sessions opened"),
+        ("services", probe_services),
+    ]
+    if get_setting("warmup", "resume_warehouse", False):
+        steps.append(("warehouse", resume_warehouse))
+    top_questions = list(get_setting("warmup", "top_questions", []))
+    if top_questions:
+        steps.append(("cache", lambda: seed_cache(top_questions)))
+    return steps
+
+
+@st.cache_resource
+def setup_logging():
+    """
+    Configure structured logging from ``[logging]`` in secrets, once per process.
+
+    Records are written as JSON lines by a background thread (``json = false`` for
+    plain text), with messages and fields capped at ``max_field_chars`` and only one
+    in ``debug_sample_every`` DEBUG records kept.
+    """
+    return configure_logging(
+        level=logging.getLevelName(str(get_setting("logging", "level", "INFO")).upper()),
+        json_format=get_setting("logging", "json", True),
+        max_field_chars=get_setting("logging", "max_field_chars", 1000),
+        debug_sample_every=get_setting("logging", "debug_sample_every", 10),
+        queue_size=get_setting("logging", "queue_size", 10000),
+    )
+
+
+@st.cache_resource
+def configure_tracing():
+    """
+    Configure the process-wide tracer from ``[tracing]`` in secrets, once per process.
+
+    ``enabled = true`` records a trace per chat request; ``export_path`` appends each
+    trace to a file as OpenTelemetry JSON lines.
+    """
+    export_path = get_setting("tracing", "export_path")
+    tracer.configure(
+        # Metrics are recorded from finished traces, so they also need the tracer
+        enabled=get_setting("tracing", "enabled", False) or get_setting("metrics", "enabled", False),
+        exporter=JsonLinesExporter(export_path) if export_path else None,
+        keep=get_setting("tracing", "keep_traces", 100),
+    )
+    return tracer
+
+
+@st.cache_resource
+def get_conversation_store():
+    """
+    Process-wide persistent chat history configured under ``[history_store]``, or None.
+
+    ``backend = "sqlite"`` (default) keeps messages in the database at ``path``;
+    ``backend = "snowflake"`` writes them to ``table`` through the session pool.
+    Disabled unless ``enabled = true``.
+    """
+    if not get_setting("history_store", "enabled", False):
+        return None
+    options = {
+        "batch_size": get_setting("history_store", "batch_size", 100),
+        "flush_interval": get_setting("history_store", "flush_interval_seconds", 0.5),
+    }
+    if get_setting("history_store", "backend", "sqlite") == "snowflake":
+        return SnowflakeConversationStore(
+            get_session_pool().run, table=get_setting("history_store", "table", "CHAT_MESSAGES"), **options
+        )
+    return SQLiteConversationStore(get_setting("history_store", "path", "chat_history.db"), **options)
+
+
+# Session state that idle sessions drop; each is rebuilt on the next script run
+IDLE_RELEASE_KEYS = ("service_metadata", "retrieval_context", "debug_traces")
+CHAT_HISTORY_KEYS = ("fin_lit_messages", "investment_messages", "ai_agent_messages")
+
+
+def approx_state_size(value):
+    """
+    Return the approximate memory held by a session state value, in bytes.
+    """
+    if isinstance(value, ChatTranscript):
+        return value.memory_bytes
+    try:
+        return len(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))
+    except Exception:
+        return sys.getsizeof(value)
+
+
+def release_idle_session(state, history_persisted=False, keep_messages=20):
+    """
+    Free what an idle browser session holds and return the bytes reclaimed.
+
+    Rebuildable metadata is dropped, and the chat histories are dropped when the
+    conversation store has them (they reload on the next visit) or trimmed to
+    their last ``keep_messages`` messages.
+    Runs at the start of the session's first script run after it went idle.
+    """
+    reclaimed = 0
+    for key in IDLE_RELEASE_KEYS:
+        if key in state:
+            reclaimed += approx_state_size(state[key])
+            del state[key]
+
+    for key in CHAT_HISTORY_KEYS:
+        if key not in state:
+            continue
+        messages = state[key]
+        before = approx_state_size(messages)
+        if history_persisted:
+            del state[key]
+            reclaimed += before
+        elif isinstance(messages, ChatTranscript) and len(messages) > keep_messages:
+            trimmed = ChatTranscript.from_dicts(
+                [message.to_dict() for message in messages.window(keep_messages)],
+                max_messages=messages.max_messages,
+                max_bytes=messages.max_bytes,
+                spill_dir=messages.spill_dir,
+            )
+            messages.clear()
+            state[key] = trimmed
+            reclaimed += before - trimmed.memory_bytes
+    return reclaimed
+
+
+def session_is_active(session_id):
+    """
+    Return False once Streamlit has discarded the browser session ``session_id``; safe on any thread.
+    """
+    # Without a runtime (tests, bare mode) nothing is ever discarded
+    return not Runtime.exists() or Runtime.instance().is_active_session(session_id)
+
+
+@st.cache_resource
+def get_idle_session_manager():
+    """
+    Process-wide reaper for browser sessions idle longer than ``[idle_sessions] idle_timeout_seconds``.
+    """
+    manager = IdleSessionManager(session_is_active, idle_timeout=get_setting("idle_sessions", "idle_timeout_seconds", 1800))
+    manager.start(interval=get_setting("idle_sessions", "reap_interval_seconds", 60))
+    return manager
+
+
+def track_session_activity():
+    """
+    Record that this browser session is active, for the idle session reaper.
+
+    If the reaper released the session while it was idle, its state is freed here,
+    on its own script thread, before the run rebuilds what it needs.
+    Disabled with ``enabled = false`` under ``[idle_sessions]`` in secrets.
+    """
+    ctx = get_script_run_ctx()
+    if ctx is None or not get_setting("idle_sessions", "enabled", True):
+        return
+    history_persisted = get_conversation_store() is not None
+    keep_messages = get_setting("idle_sessions", "keep_messages", 20)
+    get_idle_session_manager().touch(
+        ctx.session_id, lambda: release_idle_session(st.session_state, history_persisted, keep_messages)
+    )
+
+
+@st.cache_resource
+def start_metrics():
+    """
+    Start the Prometheus metrics endpoint configured under ``[metrics]``, once per process.
+
+    ``enabled = true`` serves request rate, stage latency, Cortex error, session pool,
+    retrieval cache and chat history metrics at ``http://address:port/metrics``
+    (default ``127.0.0.1:9464``). Returns the registry, or None when disabled.
+    """
+    if not get_setting("metrics", "enabled", False):
+        return None
+    registry = MetricsRegistry()
+    tracer.add_listener(TraceMetrics(registry))
+    pool = get_session_pool()
+    cache = get_retrieval_cache()
+    registry.gauge("app_pool_sessions", "Open Snowflake sessions in the pool", func=lambda: pool.stats()["size"])
+    registry.gauge("app_pool_sessions_in_use", "Pooled Snowflake sessions checked out", func=lambda: pool.stats()["in_use"])
+    registry.gauge("app_retrieval_cache_entries", "Entries in the retrieval cache", func=lambda: len(cache))
+    registry.gauge(
+        "app_retrieval_cache_shared_hits",
+        "Retrieval cache hits served by the shared tier",
+        func=lambda: cache.stats()["shared_hits"],
+    )
+    generation = get_generation_pool()
+    registry.gauge("app_generations_in_flight", "Answers waiting or being generated", func=generation.in_flight)
+    registry.gauge(
+        "app_generations_waiting", "Answers waiting for a generation worker", func=lambda: generation.stats()["waiting"]
+    )
+    registry.gauge("app_generations_shed", "Answers turned away because of high demand", func=lambda: generation.stats()["shed"])
+    idle_sessions = get_idle_session_manager()
+    registry.gauge(
+        "app_browser_sessions", "Browser sessions tracked by the idle reaper", func=lambda: idle_sessions.stats()["tracked"]
+    )
+    registry.gauge(
+        "app_idle_reclaimed_bytes",
+        "Approximate bytes freed from idle sessions",
+        func=lambda: idle_sessions.stats()["bytes_reclaimed"],
+    )
+    store = get_conversation_store()
+    if store is not None:
+        registry.gauge(
+            "app_history_store_pending", "Chat messages queued for the conversation store", func=lambda: store.stats()["pending"]
+        )
+    try:
+        start_http_server(
+            registry, port=get_setting("metrics", "port", 9464), address=get_setting("metrics", "address", "127.0.0.1")
+        )
+    except OSError as e:
+        logging.warning("Could not start metrics endpoint: %s", e)
+    return registry
+
+
+@st.cache_resource
+def restore_cache_snapshots():
+    """
+    Restore the process-wide caches from their snapshots and keep snapshotting them, once per process.
+
+    Enabled with ``enabled = true`` under ``[snapshot]`` in secrets. Snapshots are
+    written to ``directory`` every ``interval_seconds`` and at exit. Retrieval
+    snapshots taken for another ``corpus_version``, and answer snapshots taken for
+    another corpus version or set of prompt templates, are discarded. Returns the
+    snapshotter, or None when disabled.
+    """
+    if not get_setting("snapshot", "enabled", False):
+        return None
+    corpus_version = str(get_setting("snapshot", "corpus_version", ""))
+    snapshotter = CacheSnapshotter(get_setting("snapshot", "directory", "cache-snapshots"))
+    snapshotter.register("retrieval", get_retrieval_cache(), {"corpus_version": corpus_version})
+    # Rewrites are keyed on the model and the full rewrite prompt already
+    snapshotter.register("rewrite", get_rewrite_cache())
+    completions = get_completion_cache()
+    if completions is not None:
+        fingerprint = {"corpus_version": corpus_version, "prompt_hash": get_prompt_registry().fingerprint}
+        snapshotter.register("completion", completions, fingerprint)
+    snapshotter.load_all()
+    snapshotter.start(interval=get_setting("snapshot", "interval_seconds", 300))
+    return snapshotter
+
+
+@st.cache_resource
+def get_warmup_report():
+    """
+    Start the process warm-up on the first script run and return its progress report.
+    """
+    logging.info("Starting process warm-up.")
+    # Building the steps reads secrets and resolves the pool, so it runs on the warm-up thread too
+    return start_warmup(build_warmup_steps)
 
 
 # Main page function
@@ -82,41 +593,8 @@ def main_page():
     """
     Main page of the Streamlit application.
     """
-    logging.info("Displaying main page.")
-
-    # Custom CSS for sidebar
-    st.markdown(
-        """
-        <style>
-        .sidebar-button {
-            background-color: #4B8BBE;
-            color: white;
-            border: none;
-            border-radius: 4px;
-            padding: 0.5rem 1rem;
-            margin: 0.5rem 0;
-            width: 100%;
-            text-align: left;
-        }
-        .sidebar .stButton>button {
-            background-color: #4B8BBE;
-            color: white;
-            border: none;
-            border-radius: 4px;
-            padding: 8px 16px;
-            width: 100%;
-            margin: 4px 0;
-            text-align: left;
-            font-size: 16px;
-        }
-        .sidebar .stButton>button:hover {
-            background-color: #3D7BA8;
-            border: none;
-        }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+    logging.debug("Rendering main page.")
+    inject_page_css("main")
 
     # Add navigation bar with improved spacing
     nav_col1, nav_col2, nav_col3 = st.columns([6, 2, 2])
@@ -153,25 +631,6 @@ def main_page():
 
     # Add profile section with improved spacing
     with st.expander("Your Investment Profile", expanded=True):
-        st.markdown(
-            """
-            <style>
-                div[data-testid="stExpander"] div[role="button"] p {
-                    font-size: 1.1rem;
-                    margin-bottom: 0.5rem;
-                }
-                div.row-widget.stRadio > div {
-                    flex-direction: column;
-                    gap: 0.5rem;
-                }
-                div.row-widget.stMultiSelect > div {
-                    margin-top: 0.5rem;
-                }
-            </style>
-        """,
-            unsafe_allow_html=True,
-        )
-
         col1, col2, col3 = st.columns(3)
 
         with col1:
@@ -219,7 +678,7 @@ def main_page():
             st.session_state.financial_goals = goals
         if "investment_horizon" not in st.session_state:
             st.session_state.investment_horizon = horizon
-        logging.info(f"User profile - Risk: {risk_profile}, Goals: {goals}, Horizon: {horizon}")
+        logging.debug("User profile - Risk: %s, Goals: %s, Horizon: %s", risk_profile, goals, horizon)
 
     st.markdown("---")
 
@@ -247,20 +706,6 @@ def main_page():
 
         st.markdown("---")
 
-        # Add logout button at the bottom of sidebar
-        st.markdown(
-            """
-            <style>
-            [data-testid="stSidebarNav"] {
-                background-image: linear-gradient(#4B8BBE, #3D7BA8);
-                color: white;
-                padding: 1rem;
-                margin-top: auto;
-            }
-            </style>
-            """,
-            unsafe_allow_html=True,
-        )
         if st.button("🚪 Logout", key="sidebar_logout"):
             logging.info("Sidebar logout button clicked, logging out user and navigating to landing page")
             st.session_state.clear()
@@ -271,8 +716,10 @@ def main_page():
     if "current_section" not in st.session_state:
         st.session_state.current_section = "financial_literacy"
 
-    # Initialize chat histories if not exists
+    # Initialize chat histories and search service metadata if not exists;
+    # an idle session may have released them since the last run
     init_messages()
+    init_service_metadata()
 
     # Main content area with separate chat interfaces
     if st.session_state.current_section == "financial_literacy":
@@ -319,18 +766,12 @@ def main_page():
         display_chat_interface("ai_agent", "Ask for AI-powered analysis...")
 
     # Initialize session state variables if not set
-    init_service_metadata()
     init_config_options()
-    init_messages()
-
-    # Define icons for the chat messages
-    icons = {"assistant": "❄️", "user": "👤"}
 
-    # Display chat messages from history on app rerun
-    if "messages" in st.session_state and st.session_state.messages:
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"], avatar=icons[message["role"]]):
-                st.markdown(message["content"])
+    # Opt-in performance panel; rendered last so it includes this rerun's request
+    if debug_panel_enabled():
+        with st.sidebar:
+            render_debug_panel()
 
 
 def display_chat_interface(feature_key, placeholder_text):
@@ -345,186 +786,532 @@ def display_chat_interface(feature_key, placeholder_text):
     else:  # ai_agent
         messages = st.session_state.ai_agent_messages
 
-    # Display chat messages
-    for message in messages:
-        with st.chat_message(message["role"], avatar=icons[message["role"]]):
-            st.markdown(message["content"])
+    # Display the most recent turns; older ones stay behind a "load earlier" control
+    render_chat_window(feature_key, messages)
+
+    # An answer in flight survives reruns; the session keeps polling it
+    pending_key = f"{feature_key}_pending_answer"
+    job = st.session_state.get(pending_key)
 
     # Chat input
     if question := st.chat_input(placeholder_text):
-        # Display user message
-        with st.chat_message("user", avatar=icons["user"]):
-            st.markdown(question.replace("$", "\$"))
-
-        # Add to feature-specific history
-        if feature_key == "fin_lit":
-            st.session_state.fin_lit_messages.append({"role": "user", "content": question})
-        elif feature_key == "investment":
-            st.session_state.investment_messages.append({"role": "user", "content": question})
-        else:  # ai_agent
-            st.session_state.ai_agent_messages.append({"role": "user", "content": question})
-
-        # Generate response
-        with st.chat_message("assistant", avatar=icons["assistant"]):
-            message_placeholder = st.empty()
+        if job is not None and job.key != answer_key(feature_key, question):
+            st.toast("Please wait for the current answer before asking another question.")
+        elif job is None:
+            # Display user message
+            with st.chat_message("user", avatar=icons["user"]):
+                st.markdown(question.replace("$", "\$"))
+
+            # Turn the question away before it enters the history if the queue is full
+            if not get_generation_pool().accepting():
+                show_high_demand()
+                return
+
+            # Learn which questions tend to follow each other
+            previous_question = next((m["content"] for m in reversed(messages) if m["role"] == "user"), None)
+            if previous_question:
+                get_follow_up_predictor().record(previous_question, question)
+
+            # Short follow-ups in an ongoing conversation are answered first under load
+            follow_up = len(messages) > 0 and approx_tokens(question) <= get_setting("generation", "follow_up_max_tokens", 16)
+
+            # Add to feature-specific history, where the prompt's chat history reads it;
+            # it is only stored for later visits once it has been answered
+            save_message(feature_key, messages, {"role": "user", "content": question}, persist=False)
+
             try:
-                prompt, results = create_prompt(question)
-                with st.spinner("Thinking..."):
-                    generated_response = complete(
-                        MODEL_NAME,
-                        prompt,
-                        session=st.session_state.session,
-                    )
-
-                    # Add citations if available
-                    if results:
-                        markdown_table = "###### References \n\n| Content |\n|--------|\n"
-                        for result in results:
-                            if isinstance(result, dict) and "CHUNK" in result:
-                                chunk = result["CHUNK"]
-                            elif isinstance(result, (list, tuple)) and len(result) > 0:
-                                chunk = str(result[0])
-                            else:
-                                continue
-                            markdown_table += f"| {chunk} |\n"
-                        generated_response += "\n\n" + markdown_table
-
-                    message_placeholder.markdown(generated_response)
-
-                    # Add to feature-specific history
-                    if feature_key == "fin_lit":
-                        st.session_state.fin_lit_messages.append({"role": "assistant", "content": generated_response})
-                    elif feature_key == "investment":
-                        st.session_state.investment_messages.append({"role": "assistant", "content": generated_response})
-                    else:  # ai_agent
-                        st.session_state.ai_agent_messages.append({"role": "assistant", "content": generated_response})
-
-            except Exception as e:
-                error_msg = "An error occurred while processing your request."
-                message_placeholder.markdown(error_msg)
-                logging.error(f"Error during chat completion: {e}")
+                job = submit_answer(feature_key, question, messages, priority=follow_up)
+            except OverloadedError as e:
+                logging.warning("Shedding chat request: %s", e)
+                discard_question(messages)
+                show_high_demand()
+                return
+            st.session_state[pending_key] = job
+
+    if job is not None:
+        with st.chat_message("assistant", avatar=icons["assistant"]):
+            await_answer(feature_key, messages, job)
 
 
-def init_messages():
+def answer_key(feature_key, question):
+    """
+    Identify a question asked in a section of this browser session, so double submits share one answer.
+
+    Only the exact question text (trimmed) counts as the same question: rewording, negating
+    or reordering it asks something else.
+    """
+    ctx = get_script_run_ctx()
+    return (ctx.session_id if ctx is not None else None, feature_key, question.strip())
+
+
+def show_high_demand():
+    """
+    Tell the user their question was turned away because too many answers are waiting.
+    """
+    with st.chat_message("assistant", avatar=icons["assistant"]):
+        st.markdown(HIGH_DEMAND_MESSAGE)
+
+
+def submit_answer(feature_key, question, messages, priority=False):
+    """
+    Queue the answer to ``question`` on the generation pool and return its job.
+
+    ``messages`` is the section's transcript, ending with the question.
+    ``priority`` lets a short follow-up start ahead of other waiting questions.
+    Raises ``OverloadedError`` when the pool's queue is full.
+
+    The worker has no script run context: everything the answer depends on is
+    captured from the session here, so switching section while the answer waits
+    or runs does not change its prompt, search service or chat history.
+    """
+    request = capture_chat_request(FEATURE_SECTIONS[feature_key], messages)
+    stored_messages = len(messages)
+    return get_generation_pool().submit(
+        answer_key(feature_key, question),
+        lambda: generate_answer(feature_key, question, stored_messages, request),
+        priority=priority,
+    )
+
+
+def capture_chat_request(section, messages):
+    """
+    Return the session settings and chat history answering a question in ``section`` depends on.
+
+    ``messages`` is the section's transcript. The returned dict does not refer to
+    ``st.session_state``, so the answer can be generated on any thread from it.
+    """
+    num_messages = st.session_state.num_chat_messages
+    chat_history = recent_history(messages, num_messages)
+    history_text, history_tokens = prompt_history(messages, len(chat_history))
+    return {
+        "section": section,
+        "service": st.session_state.get("selected_cortex_search_service"),
+        "filter": get_search_filter(),
+        "limit": st.session_state.num_retrieved_chunks,
+        "model": st.session_state.model_name,
+        "use_chat_history": st.session_state.use_chat_history,
+        "chat_history": chat_history,
+        "history_text": history_text,
+        "history_tokens": history_tokens,
+        "context_memory": get_context_memory(),
+    }
+
+
+def generate_answer(feature_key, question, stored_messages, request):
+    """
+    Retrieve context for ``question`` and complete an answer, traced as one request.
+
+    Returns the assistant message with its citations kept apart from the answer,
+    so they render collapsed and stay out of prompts.
+    """
+    with tracer.trace(
+        "chat_request",
+        section=feature_key,
+        model=MODEL_NAME,
+        question_tokens=approx_tokens(question),
+        stored_messages=stored_messages,
+    ) as request_span:
+        job = current_job()
+        if job is not None:
+            job.trace = getattr(request_span, "trace", None)
+            request_span.set_attribute("queue_ms", round(job.queue_seconds * 1000, 3))
+        prompt, results = create_prompt(question, request)
+        answer = cached_complete(MODEL_NAME, prompt, get_completion_cache())
+        citations = [chunk for chunk in map(result_chunk, results or []) if chunk is not None]
+    return {"role": "assistant", "content": answer, "citations": citations}
+
+
+def await_answer(feature_key, messages, job):
+    """
+    Show progress until a pending answer is ready, then render it and add it to the history.
+
+    Progress, including the place in line while the answer waits for a worker, is
+    updated every ``poll_interval_seconds`` (``[generation]`` in secrets); each
+    update lets Streamlit interrupt the wait for a rerun, after which the next
+    run picks the same job up again.
+    """
+    message_placeholder = st.empty()
+    pool = get_generation_pool()
+    interval = get_setting("generation", "poll_interval_seconds", 0.25)
+    while not job.wait(interval):
+        position = pool.position(job)
+        if position:
+            message_placeholder.caption(f"High demand right now: your question is number {position} in line...")
+        else:
+            message_placeholder.caption(f"Thinking... {job.elapsed:.0f}s")
+    del st.session_state[f"{feature_key}_pending_answer"]
+
+    try:
+        assistant_message = job.result()
+    except OverloadedError as e:
+        message_placeholder.markdown(HIGH_DEMAND_MESSAGE)
+        logging.warning("Chat request waited too long: %s", e)
+        discard_question(messages)
+    except Exception as e:
+        message_placeholder.markdown("An error occurred while processing your request.")
+        logging.error("Error during chat completion: %s", e)
+        discard_question(messages)
+    else:
+        if job.errors:
+            st.error("An error occurred during completion. Check logs.")
+        message_placeholder.markdown(assistant_message["content"])
+        render_citations(assistant_message["citations"])
+
+        # Store the answered question with its answer, and add the answer to the feature-specific history
+        question = messages[-1] if len(messages) and messages[-1]["role"] == "user" else None
+        if question is not None:
+            persist_message(feature_key, {"role": "user", "content": question["content"]})
+        save_message(feature_key, messages, assistant_message)
+
+        # Warm the cache for the likely next question while the user reads
+        if question is not None:
+            prefetch_follow_ups(question["content"], assistant_message["content"])
+
+    # Keep the finished trace for this session's debug panel
+    if debug_panel_enabled():
+        remember_debug_trace(job)
+
+
+def debug_panel_enabled():
+    """
+    Return whether the performance debug panel is shown for this browser session.
+
+    Shown with ``?debug=<token>`` in the URL when ``token`` is set under ``[debug]`` in
+    secrets, or with ``?debug=1`` when ``allow_query_param = true`` is set there (for
+    local development: anyone can add it to the URL). Hidden by default.
+    """
+    requested = st.query_params.get("debug")
+    if not requested:
+        return False
+    token = get_setting("debug", "token")
+    if token and hmac.compare_digest(str(requested).encode(), str(token).encode()):
+        return True
+    return bool(get_setting("debug", "allow_query_param", False)) and requested in ("1", "true")
+
+
+def remember_debug_trace(request):
+    """
+    Keep the trace of a finished request for the debug panel, up to ``[debug] keep_requests`` per session.
+
+    ``request`` is the request's root span or its generation job.
+    """
+    trace = getattr(request, "trace", None)
+    if trace is None:
+        return
+    if "debug_traces" not in st.session_state:
+        st.session_state.debug_traces = deque(maxlen=get_setting("debug", "keep_requests", 10))
+    st.session_state.debug_traces.append(trace)
+
+
+def render_debug_panel():
+    """
+    Render stage timings, prompt tokens, retrieval and cache figures for this session's recent requests.
+
+    Reads the traces recorded by the tracer, so the requests must be traced
+    (``[tracing]`` or ``[metrics]`` enabled).
+    """
+    st.markdown("---")
+    st.markdown("### ⏱️ Performance")
+    if not tracer.enabled:
+        st.caption("Requests are not traced. Enable `[tracing]` or `[metrics]` in secrets.")
+        return
+    traces = list(st.session_state.get("debug_traces", []))
+    if not traces:
+        st.caption("No requests in this session yet.")
+        return
+    for trace in reversed(traces):
+        profile = profile_trace(trace)
+        tokens, retrieval, cache = profile["tokens"], profile["retrieval"], profile["cache"]
+        title = f"{profile['section']} · {profile['duration_ms']:.0f}ms" + (" · error" if profile["errors"] else "")
+        with st.expander(title, expanded=trace is traces[-1]):
+            st.code(format_waterfall(trace, width=20), language=None)
+            st.markdown(
+                f"**Model** {profile['model']}  \n"
+                f"**Prompt tokens** {tokens['prompt']} (question {tokens['question']}, history {tokens['history']}, "
+                f"context {tokens['context']}, instructions {tokens['instructions']}) · "
+                f"**completion** {tokens['completion']}  \n"
+                f"**Retrieval** {retrieval['plan']} · {retrieval['searches']} searches · {retrieval['chunks']} chunks · "
+                f"{retrieval['context_tokens']} context tokens  \n"
+                f"**Cache** {cache['hits']} hits, {cache['misses']} misses" + (" · prefetched" if cache["prefetched"] else "")
+            )
+            for stage, error in profile["errors"].items():
+                st.caption(f"{stage}: {error}")
+            st.caption(f"Trace {profile['trace_id']}")
+
+
+def render_chat_window(feature_key, messages):
+    """
+    Render the last ``window_turns`` turns of a chat (``[chat]`` in secrets, default 10).
+
+    Older messages are not rendered at all until "Load earlier messages" widens the
+    window, so rerun time does not grow with the length of the conversation.
+    """
+    step = get_setting("chat", "window_turns", 10)
+    window_key = f"{feature_key}_window_turns"
+    turns = st.session_state.get(window_key, step)
+
+    # A turn is a question and its answer
+    visible = messages[-2 * turns :]
+    hidden = len(messages) - len(visible)
+    if hidden > 0:
+        if st.button(f"Load earlier messages ({hidden} hidden)", key=f"{feature_key}_load_earlier"):
+            st.session_state[window_key] = turns + step
+            st.rerun()
+
+    for message in visible:
+        with st.chat_message(message["role"], avatar=icons[message["role"]]):
+            st.markdown(message["content"])
+            render_citations(message.get("citations"))
+
+
+def render_citations(citations):
+    """
+    Render an answer's citations as a reference table inside a collapsed expander.
+    """
+    if not citations:
+        return
+    with st.expander(f"References ({len(citations)})", expanded=False):
+        st.markdown("| Content |\n|--------|\n" + "".join(f"| {chunk} |\n" for chunk in citations))
+
+
+def new_chat_history(feature_key=None):
     """
-    Initialize the chat messages in the session state.
+    Create a section chat transcript capped in memory by ``[chat]`` settings in secrets.
+
+    At most ``memory_messages`` messages and ``memory_kb`` KiB stay in memory; older
+    turns are spilled to a file under ``spill_dir`` and read back when displayed.
+    With a conversation store, the transcript starts with the logged-in user's
+    last ``load_messages`` messages of the section.
     """
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    transcript = ChatTranscript(
+        max_messages=get_setting("chat", "memory_messages", 100),
+        max_bytes=get_setting("chat", "memory_kb", 256) * 1024,
+        spill_dir=get_setting("chat", "spill_dir"),
+    )
+    store, user_id = get_conversation_store(), st.session_state.get("email")
+    if store is not None and user_id and feature_key:
+        try:
+            transcript.extend(store.recent(user_id, feature_key, get_setting("history_store", "load_messages", 20)))
+            logging.info("Loaded %s %s messages from the conversation store", len(transcript), feature_key)
+        except Exception as e:
+            logging.warning("Could not load %s chat history: %s", feature_key, e)
+    return transcript
 
-    # Initialize feature-specific message histories
+
+def init_messages():
+    """
+    Initialize the feature-specific chat histories in the session state.
+    """
     if "fin_lit_messages" not in st.session_state:
-        st.session_state.fin_lit_messages = []
+        st.session_state.fin_lit_messages = new_chat_history("fin_lit")
     if "investment_messages" not in st.session_state:
-        st.session_state.investment_messages = []
+        st.session_state.investment_messages = new_chat_history("investment")
     if "ai_agent_messages" not in st.session_state:
-        st.session_state.ai_agent_messages = []
+        st.session_state.ai_agent_messages = new_chat_history("ai_agent")
 
 
-def get_chat_history():
+def save_message(feature_key, messages, message, persist=True):
     """
-    Retrieve the chat history from the session state based on current section.
+    Append a message to a section transcript and, with ``persist``, queue it for the conversation store.
+    """
+    messages.append(message)
+    if persist:
+        persist_message(feature_key, message)
+
+
+def persist_message(feature_key, message):
+    """
+    Queue a message for the conversation store, if one is configured and the user is logged in.
+    """
+    store, user_id = get_conversation_store(), st.session_state.get("email")
+    if store is not None and user_id:
+        store.append(user_id, feature_key, message)
+
+
+def discard_question(messages):
+    """
+    Remove the question a failed answer left at the end of a section transcript, so it is not shown unanswered.
+    """
+    if len(messages) and messages[-1]["role"] == "user":
+        messages.pop()
+
+
+def get_section_messages():
+    """
+    Return the current section's transcript from the session state, or an empty list.
     """
     if "current_section" not in st.session_state:
         return []
 
     section = st.session_state.current_section
     if section == "financial_literacy":
-        messages = st.session_state.fin_lit_messages
+        return st.session_state.fin_lit_messages
     elif section == "investment":
-        messages = st.session_state.investment_messages
+        return st.session_state.investment_messages
     else:  # ai_agents
-        messages = st.session_state.ai_agent_messages
+        return st.session_state.ai_agent_messages
 
-    num_messages = st.session_state.num_chat_messages
-    return messages[-num_messages:] if messages else []
+
+def get_chat_history():
+    """
+    Retrieve the chat history from the session state based on current section.
+    """
+    return recent_history(get_section_messages(), st.session_state.num_chat_messages)
 
 
-def create_prompt(user_question):
+def recent_history(messages, num_messages):
     """
-    Create a prompt for the chatbot based on the user's question and chat history.
+    Return the last ``num_messages`` messages of a transcript as role/content dicts.
     """
-    logging.info(f"Creating prompt with user question: {user_question}")
+    if not messages:
+        return []
+    if isinstance(messages, ChatTranscript):
+        return messages.history(num_messages)
+    # Citations are shown to the user but not fed back into prompts
+    return [{"role": message["role"], "content": message["content"]} for message in messages[-num_messages:]]
 
-    # Get section-specific chat history
-    chat_history = get_chat_history()
-    section = st.session_state.current_section
 
-    # Get the appropriate base prompt 
-    base_prompt = st.secrets["base_prompts"].get(section, st.secrets["base_prompts"][section])
+@traced()
+def create_prompt(user_question, request=None):
+    """
+    Create a prompt for the chatbot based on the user's question and chat history.
+
+    ``request`` holds the settings and history captured by ``capture_chat_request``;
+    without one they are read from the current section of the session state.
+    """
+    logging.info("Creating prompt with user question: %s", user_question)
+    if request is None:
+        request = capture_chat_request(st.session_state.current_section, get_section_messages())
+
+    # Section-specific chat history; transcripts serialize it from per-message caches
+    section, chat_history = request["section"], request["chat_history"]
+    history_text, history_tokens = request["history_text"], request["history_tokens"]
+
+    # The search service narrows candidates by the user's profile
+    service_name, search_filter, limit = request["service"], request["filter"], request["limit"]
+
+    # Close follow-ups reuse or extend the previous turn's hits for this section
+    context_memory = request["context_memory"]
+    search_scope = (service_name, json.dumps(search_filter, sort_keys=True))
+    plan = context_memory.plan(section, user_question, search_scope)
+    logging.info("Retrieval plan: %s", plan)
+
+    def search(query, limit=limit):
+        return query_cortex_search_service(query, columns=["CHUNK"], filter=search_filter, limit=limit, service_name=service_name)
+
+    # A prefetched follow-up skips both the history rewrite and the search
+    search_query = None
+    cached_search = (
+        None
+        if plan.action == REUSE
+        else get_cached_search(user_question, columns=["CHUNK"], filter=search_filter, service_name=service_name, limit=limit)
+    )
 
-    if st.session_state.use_chat_history and chat_history:
+    if plan.action == REUSE:
+        prompt_context, results = plan.previous.context, plan.previous.results
+    elif cached_search is not None:
+        logging.info("Using prefetched search results.")
+        prompt_context, results = cached_search
+    elif plan.action == DELTA:
+        # Search only the new terms, with a smaller limit, and merge with the previous hits
+        _, delta_results = search(plan.delta_query, limit=max(1, limit // 2))
+        prompt_context, results = merge_search_results(delta_results, plan.previous.results, limit)
+    elif request["use_chat_history"] and chat_history:
         # Create context-aware prompt
-        question_summary = make_chat_history_summary(chat_history, user_question)
-        prompt_context, results = query_cortex_search_service(question_summary, columns=["CHUNK"], filter={})
+        search_query = make_chat_history_summary(chat_history, user_question, model=request["model"])
+        prompt_context, results = search(search_query)
     else:
         # Create standalone prompt
-        prompt_context, results = query_cortex_search_service(user_question, columns=["CHUNK"], filter={})
+        prompt_context, results = search(user_question)
 
-    # Combine into final prompt
-    final_prompt = f"""[INST]
-    {base_prompt}
+    context_memory.remember(section, user_question, search_scope, prompt_context, results, plan, search_query)
 
-    <chat_history>
-    {chat_history if chat_history else "No previous context"}
-    </chat_history>
+    # Combine into final prompt using the section's compiled template
+    final_prompt = get_prompt_registry().render(
+        section,
+        chat_history=history_text,
+        context=prompt_context,
+        question=user_question,
+    )
+    tracer.current_span().set_attributes(
+        plan=plan.action,
+        prefetched=cached_search is not None,
+        history_messages=len(chat_history),
+        history_tokens=history_tokens,
+        chunks=len(results),
+        context_tokens=approx_tokens(prompt_context),
+        prompt_tokens=approx_tokens(final_prompt),
+    )
+
+    return final_prompt, results
 
-    <context>
-    {prompt_context}
-    </context>
 
-    <question>
-    {user_question}
-    </question>
-    [/INST]
+def service_filter_attributes(service_name):
     """
+    Return the attribute columns ``service_name`` can be filtered on, from ``[search_filters]`` in secrets.
 
-    return final_prompt, results
+    For example ``FIN_SERVICE = ["section", "audience"]``. Services that are not
+    listed are queried unfiltered, and attributes without a profile field in
+    ``PROFILE_FILTER_ATTRIBUTES`` are ignored.
+    """
+    attributes = list(get_setting("search_filters", service_name, []))
+    unknown = [attribute for attribute in attributes if attribute not in PROFILE_FILTER_ATTRIBUTES]
+    if unknown:
+        logging.warning("Ignoring filter attributes %s of %s: no profile field maps to them", unknown, service_name)
+    return [attribute for attribute in attributes if attribute in PROFILE_FILTER_ATTRIBUTES]
 
 
 def init_service_metadata():
     """
     Initialize service metadata for the Snowflake Cortex search services.
     """
+    if "service_metadata" in st.session_state:
+        logging.debug("Service metadata already present in session state.")
+        return
+
     logging.info("Initializing service metadata.")
-    if "service_metadata" not in st.session_state:
-        st.session_state.service_metadata = []
-
-        # Define EDU_SERVICE metadata
-        edu_service = {
-            "name": "EDU_SERVICE",
-            "description": "Financial education and literacy content",
-            "model": "mistral-large2",
-            "search_column": "CHUNK",
-        }
-
-        # Define FIN_SERVICE metadata
-        fin_service = {
-            "name": "FIN_SERVICE",
-            "description": "Investment recommendations and AI-powered analysis",
-            "model": "mistral-large2",
-            "search_column": "CHUNK",
-        }
-
-        st.session_state.service_metadata = [edu_service, fin_service]
-        logging.info(f"Service metadata initialized")
-
-        # Set default service based on current section
-        if "current_section" in st.session_state:
-            if st.session_state.current_section == "financial_literacy":
-                st.session_state.selected_cortex_search_service = "EDU_SERVICE"
-            else:  # investment or ai_agents
-                st.session_state.selected_cortex_search_service = "FIN_SERVICE"
-        else:
+
+    # Define EDU_SERVICE metadata
+    edu_service = {
+        "name": "EDU_SERVICE",
+        "description": "Financial education and literacy content",
+        "model": "mistral-large2",
+        "search_column": "CHUNK",
+        # Attribute columns the service indexes for filtering (see PROFILE_FILTER_ATTRIBUTES)
+        "filter_attributes": service_filter_attributes("EDU_SERVICE"),
+    }
+
+    # Define FIN_SERVICE metadata
+    fin_service = {
+        "name": "FIN_SERVICE",
+        "description": "Investment recommendations and AI-powered analysis",
+        "model": "mistral-large2",
+        "search_column": "CHUNK",
+        "filter_attributes": service_filter_attributes("FIN_SERVICE"),
+    }
+
+    st.session_state.service_metadata = [edu_service, fin_service]
+    logging.info("Service metadata initialized")
+
+    # Set default service based on current section
+    if "current_section" in st.session_state:
+        if st.session_state.current_section == "financial_literacy":
             st.session_state.selected_cortex_search_service = "EDU_SERVICE"
+        else:  # investment or ai_agents
+            st.session_state.selected_cortex_search_service = "FIN_SERVICE"
     else:
-        logging.info("Service metadata already present in session state.")
+        st.session_state.selected_cortex_search_service = "EDU_SERVICE"
 
 
 def init_config_options():
     """
     Initialize the configuration options for the Streamlit application.
     """
+    # Only a section change alters the options, so later reruns are no-ops
+    section = st.session_state.get("current_section")
+    if st.session_state.get("config_section", ()) == section:
+        logging.debug("Config options already initialized for section %s.", section)
+        return
     logging.info("Initializing config options.")
 
     # Set the model name and service based on current section
@@ -547,74 +1334,278 @@ def init_config_options():
     if "num_chat_messages" not in st.session_state:
         st.session_state.num_chat_messages = 5
 
+    st.session_state.config_section = section
     logging.info("Config options initialized successfully.")
 
 
-def query_cortex_search_service(query, columns=[], filter={}):
+def get_search_filter():
     """
-    Perform a search query on the selected Cortex search service.
+    Build the Cortex Search filter for the selected service from the user's profile.
+
+    Only attributes listed in the service's ``filter_attributes`` metadata are pushed
+    down, so services without attribute columns are queried unfiltered.
     """
-    logging.info(f"Querying cortex search service with query: {query}")
-    try:
-        if not hasattr(st.session_state, "cortex_search_service"):
-            logging.error("search service not initialized")
-            return "", []
+    service_name = st.session_state.get("selected_cortex_search_service")
+    metadata = next(
+        (service for service in st.session_state.get("service_metadata", []) if service["name"] == service_name),
+        {},
+    )
+    supported = metadata.get("filter_attributes", [])
+    attributes = {
+        attribute: st.session_state.get(state_key)
+        for attribute, state_key in PROFILE_FILTER_ATTRIBUTES.items()
+        if attribute in supported
+    }
+    return build_search_filter(attributes)
 
-        cortex_search_service = st.session_state.cortex_search_services[st.session_state.selected_cortex_search_service]
 
-        # Query the search service
-        search_response = cortex_search_service.search(
-            query,
-            columns=["CHUNK"],
-            limit=st.session_state.num_retrieved_chunks,
+def get_context_memory():
+    """
+    Return this session's per-section memory of the last turn's retrieval context.
+    """
+    if "retrieval_context" not in st.session_state:
+        st.session_state.retrieval_context = ConversationContextMemory(
+            reuse_threshold=get_setting("context_reuse", "reuse_threshold", 0.8),
+            delta_threshold=get_setting("context_reuse", "delta_threshold", 0.5),
+            max_reuses=get_setting("context_reuse", "max_reuses", 3),
         )
+    return st.session_state.retrieval_context
+
+
+def result_chunk(result):
+    """
+    Return the CHUNK text of a search result, or None if the result has no chunk.
+    """
+    if isinstance(result, dict) and "CHUNK" in result:
+        return result["CHUNK"]
+    if isinstance(result, (list, tuple)) and len(result) > 0:
+        # If result is a sequence, take the first element as CHUNK
+        return str(result[0])
+    return None
+
+
+def merge_search_results(new_results, previous_results, limit):
+    """
+    Merge new search results ahead of previous ones, dropping duplicate chunks.
+
+    Returns the context string and merged results, capped at ``limit``.
+    """
+    merged, chunks, seen = [], [], set()
+    for result in list(new_results) + list(previous_results):
+        chunk = result_chunk(result)
+        if chunk is None or chunk in seen:
+            continue
+        seen.add(chunk)
+        merged.append(result)
+        chunks.append(chunk)
+        if len(merged) >= limit:
+            break
+    return "\n".join(chunks), merged
+
+
+def get_search_runner(service_name):
+    """
+    Return a callable ``run(query, columns, filter, limit)`` that searches ``service_name``.
+
+    Each call borrows a pooled session and resolves the service on it. The
+    callable does not read session state, so it can run on other threads.
+    """
+    return make_pooled_search_runner(get_session_pool(), service_name)
+
+
+def make_pooled_search_runner(pool, service_name):
+    """
+    Return a callable ``run(query, columns, filter, limit)`` that searches ``service_name`` on pooled sessions.
+    """
+
+    def search_on(session, query, columns, filter, limit):
+        # Resolved per call, so creating the runner neither imports Snowflake nor reads secrets
+        from snowflake.core import Root
+
+        database = st.secrets["myconnection"]["database"]
+        schema = st.secrets["myconnection"]["schema"]
+        cortex_search_service = Root(session).databases[database].schemas[schema].cortex_search_services[service_name]
+        return search_cortex(cortex_search_service, query, columns, filter, limit)
+
+    def run(query, columns, filter, limit):
+        return pool.run(lambda session: search_on(session, query, columns, filter, limit))
+
+    return run
+
+
+def search_cortex(cortex_search_service, query, columns, filter, limit):
+    """
+    Run a search on a Cortex search service and return the context string and raw results.
+
+    Errors from the service are raised to the caller. This does not touch
+    ``st.session_state`` so it can run on background threads.
+    """
+    # Query the search service, pushing any filter down to it
+    search_kwargs = {"columns": columns, "limit": limit}
+    if filter:
+        search_kwargs["filter"] = filter
+    search_response = cortex_search_service.search(query, **search_kwargs)
+
+    if not search_response or not hasattr(search_response, "results"):
+        logging.warning("No search results found")
+        return "", []
+
+    # Extract chunks from results
+    results = search_response.results
+    chunks = []
+    for result in results:
+        chunk = result_chunk(result)
+        if chunk is None:
+            logging.warning("Unexpected result format: %s", type(result))
+            continue
+        chunks.append(chunk)
+
+    # Create context string
+    context = "\n".join(chunks) if chunks else ""
+
+    logging.info("Found %s context documents", len(chunks))
+    return context, results
+
 
-        if not search_response or not hasattr(search_response, "results"):
-            logging.warning("No search results found")
-            return "", []
-
-        # Extract chunks from results
-        results = search_response.results
-        chunks = []
-        for result in results:
-            if isinstance(result, dict) and "CHUNK" in result:
-                chunks.append(result["CHUNK"])
-            elif isinstance(result, (list, tuple)) and len(result) > 0:
-                # If result is a sequence, take the first element as CHUNK
-                chunks.append(str(result[0]))
-            else:
-                logging.warning(f"Unexpected result format: {type(result)}")
-                continue
-
-        # Create context string
-        context = "\n".join(chunks) if chunks else ""
-
-        logging.info(f"Found {len(chunks)} context documents")
+def get_cached_search(query, columns=[], filter={}, service_name=None, limit=None):
+    """
+    Return cached ``(context, results)`` for a query on ``service_name``, by default the selected service, or None.
+    """
+    service_name = service_name or st.session_state.get("selected_cortex_search_service")
+    limit = limit or st.session_state.get("num_retrieved_chunks")
+    return get_retrieval_cache().get(make_key(service_name, query, list(columns) or ["CHUNK"], filter, limit))
+
+
+@traced()
+def query_cortex_search_service(query, columns=[], filter={}, limit=None, service_name=None):
+    """
+    Perform a search query on a Cortex search service, by default the selected one.
+
+    ``columns`` defaults to the CHUNK column; a non-empty ``filter`` expression is
+    passed through so the service filters candidates before ranking them.
+    ``limit`` defaults to the configured number of retrieved chunks.
+    With both ``service_name`` and ``limit`` given, no session state is read.
+    Non-empty results are served from and stored in the process-wide retrieval cache.
+    """
+    logging.info("Querying cortex search service with query: %s", query)
+    try:
+        service_name = service_name or st.session_state.selected_cortex_search_service
+        columns = list(columns) or ["CHUNK"]
+        limit = limit or st.session_state.num_retrieved_chunks
+
+        cache = get_retrieval_cache()
+        cache_key = make_key(service_name, query, columns, filter, limit)
+        span = tracer.current_span()
+        span.set_attributes(service=service_name, limit=limit, filtered=bool(filter))
+        cached = cache.get(cache_key)
+        if cached is not None:
+            logging.info("Retrieval cache hit")
+            span.set_attributes(cache="hit", chunks=len(cached[1]), context_tokens=approx_tokens(cached[0]))
+            return cached
+
+        context, results = get_search_runner(service_name)(query, columns, filter, limit)
+        if results:
+            cache.put(cache_key, (context, results))
+        span.set_attributes(cache="miss", chunks=len(results), context_tokens=approx_tokens(context))
         return context, results
 
     except Exception as e:
-        logging.error(f"Error querying cortex search service: {e}")
+        logging.error("Error querying cortex search service: %s", e)
+        tracer.current_span().set_attribute("error", str(e))
         return "", []
 
 
+def prefetch_follow_ups(question, answer):
+    """
+    Warm the retrieval cache for likely follow-up questions in the background.
+
+    Enabled with ``enabled = true`` under ``[prefetch]`` in secrets. Each session
+    may start at most ``session_budget`` prefetch searches over its lifetime.
+    """
+    if not get_setting("prefetch", "enabled", False):
+        return
+
+    budget = st.session_state.get("prefetch_budget", get_setting("prefetch", "session_budget", 20))
+    if budget <= 0:
+        return
+
+    # Capture request settings here; prefetch threads cannot read session state
+    service_name = st.session_state.selected_cortex_search_service
+    search = get_search_runner(service_name)
+    columns, search_filter, limit = ["CHUNK"], get_search_filter(), st.session_state.num_retrieved_chunks
+
+    def fetch(query):
+        context, results = search(query, columns, search_filter, limit)
+        return (context, results) if results else None
+
+    queries = get_follow_up_predictor().predict(question, answer, limit=get_setting("prefetch", "per_turn", 4))
+    started = get_prefetcher().schedule(
+        queries,
+        key=lambda query: make_key(service_name, query, columns, search_filter, limit),
+        fetch=fetch,
+        budget=budget,
+    )
+    st.session_state.prefetch_budget = budget - started
+    logging.info("Scheduled %s follow-up prefetches, %s left in session budget", started, budget - started)
+
+
+@traced()
 def complete(model, prompt, session=None):
     """
     Generate a completion response using the specified model and prompt.
+
+    Without an explicit ``session`` a session is checked out for the call.
     """
-    logging.info(f"Generating completion with model: {model}")
+    logging.info("Generating completion with model: %s", model)
     try:
-        response = Complete(model, prompt, session=session).replace("$", "\$")
+        from snowflake.cortex import Complete
+
+        if session is None:
+            response = get_session_pool().run(lambda session: Complete(model, prompt, session=session))
+        else:
+            response = Complete(model, prompt, session=session)
+        response = response.replace("$", "\$")
+        tracer.current_span().set_attributes(
+            model=model, prompt_tokens=approx_tokens(prompt), completion_tokens=approx_tokens(response)
+        )
         logging.info("Completion generated successfully.")
         return response
     except Exception as e:
-        logging.error(f"Error during completion: {e}")
-        st.error("An error occurred during completion. Check logs.")
-        return "An error occurred."
+        logging.error("Error during completion: %s", e)
+        tracer.current_span().set_attribute("error", str(e))
+        job = current_job()
+        if job is None:
+            st.error("An error occurred during completion. Check logs.")
+        else:
+            # Shown by the session when it collects the answer
+            job.errors.append(str(e))
+        return COMPLETION_ERROR
+
 
+def cached_complete(model, prompt, cache):
+    """
+    Return ``complete(model, prompt)``, served from and stored in ``cache`` when one is given.
 
-def make_chat_history_summary(chat_history, question):
+    Entries are keyed on the model and a hash of the full prompt; failed completions are not cached.
+    """
+    if cache is None:
+        return complete(model, prompt)
+    key = (model, hashlib.sha256(prompt.encode("utf-8")).hexdigest())
+    response = cache.get(key)
+    tracer.current_span().set_attribute("completion_cache", "miss" if response is None else "hit")
+    if response is None:
+        response = complete(model, prompt)
+        if response != COMPLETION_ERROR:
+            cache.put(key, response)
+    return response
+
+
+@traced()
+def make_chat_history_summary(chat_history, question, model=None):
     """
     Create a prompt to generate a query based on chat history and the current question.
+
+    ``model`` defaults to the session's model.
     """
     logging.info("Creating chat history summary prompt.")
     prompt = f"""
@@ -632,76 +1623,16 @@ def make_chat_history_summary(chat_history, question):
         [/INST]
     """
     logging.info("Chat history summary prompt created, using LLM to process")
-    return complete(st.session_state.model_name, prompt, session=st.session_state.session)
+    rewrite_cache = get_rewrite_cache() if get_setting("cache", "rewrites", True) else None
+    return cached_complete(model or st.session_state.model_name, prompt, rewrite_cache)
 
 
 def landing_page():
     """
     Landing page of the Streamlit application that introduces the app and its features.
     """
-    logging.info("Displaying landing page.")
-    # Set up the page layout
-
-    # Custom CSS for styling (without hardcoding colors)
-    st.markdown(
-        """
-        <style>
-            /* Center align text and buttons */
-            .stButton>button {
-                width: 100%;
-                margin-top: 1rem;
-                font-weight: bold;
-                border-radius: 0.5rem;
-                padding: 0.5rem 1rem;
-            }
-            /* Hide Streamlit branding */
-            #MainMenu {visibility: hidden;}
-            footer {visibility: hidden;}
-            header {visibility: hidden;}
-            /* Add spacing between sections */
-            .section {
-                margin-bottom: 2rem;
-            }
-            /* Custom font size for headers */
-            h1 {
-                font-size: 2.5rem;
-                text-align: center;
-            }
-            h2 {
-                font-size: 1.8rem;
-                margin-bottom: 1rem;
-            }
-            h3 {
-                font-size: 1.5rem;
-                margin-bottom: 0.5rem;
-            }
-            p {
-                font-size: 1.1rem;
-                line-height: 1.6;
-            }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
-
-    # Landing page header
-    st.markdown(
-        """
-        <style>
-            .landing-header {
-                text-align: center;
-                padding: 2rem 0;
-            }
-            .welcome-stats {
-                padding: 1rem;
-                border-radius: 10px;
-                background-color: #FFFFFF;
-                margin: 1rem 0;
-            }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
+    logging.debug("Rendering landing page.")
+    inject_page_css("landing")
 
     # Landing page header
     st.markdown(
@@ -735,26 +1666,6 @@ def landing_page():
 
     st.markdown("---")
 
-    # Custom CSS for landing page buttons
-    st.markdown(
-        """
-        <style>
-            .stButton>button {
-                font-size: 16px;
-                padding: 2px 10px;
-                border-radius: 4px;
-                height: 35px;
-                width: 100%;
-                margin: 0;
-            }
-            .button-col {
-                display: flex;
-                justify-content: center;
-            }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
     # welcome message
     st.markdown(
         """
@@ -826,52 +1737,6 @@ def landing_page():
             st.rerun()
 
     st.markdown("---")
-    # Custom CSS for styling
-    st.markdown(
-        """
-        <style>
-            /* Center align text and buttons */
-            .stButton>button {
-                width: 100%;
-                margin-top: 1rem;
-                background-color: #4B8BBE;
-                color: white;
-                font-weight: bold;
-                border-radius: 0.5rem;
-                padding: 0.5rem 1rem;
-            }
-            .stButton>button:hover {
-                background-color: #306998;
-            }
-            /* Hide Streamlit branding */
-            #MainMenu {visibility: hidden;}
-            footer {visibility: hidden;}
-            header {visibility: hidden;}
-            /* Add spacing between sections */
-            .section {
-                margin-bottom: 2rem;
-            }
-            /* Custom font size for headers */
-            h1 {
-                font-size: 2.5rem;
-                text-align: center;
-            }
-            h2 {
-                font-size: 1.8rem;
-                margin-bottom: 1rem;
-            }
-            h3 {
-                font-size: 1.5rem;
-                margin-bottom: 0.5rem;
-            }
-            p {
-                font-size: 1.1rem;
-                line-height: 1.6;
-            }
-        </style>
-        """,
-        unsafe_allow_html=True,
-    )
 
 
 # Main function to handle page flow
@@ -879,31 +1744,43 @@ def main():
     """
     Main function to handle the page flow of the Streamlit application.
     """
+    setup_logging()
+    track_session_activity()
     logging.info("Starting the application.")
     if "page" not in st.session_state:
         st.session_state.page = "landing"
         logging.info("No page found in session state, defaulting to landing page.")
 
-    # Initialize session here
-    if "session" not in st.session_state:
-        session = initialize_session()
-        if not session:
-            return  # Stop if session cannot be initialized
+    # Before anything imports Snowflake
+    get_local_cortex()
+    configure_tracing()
+    start_metrics()
+    restore_cache_snapshots()
+
+    # Warm connections, services and caches once per process, in the background
+    if get_setting("warmup", "enabled", True):
+        get_warmup_report()
 
+    # Snowflake is not touched here: landing, login and signup render without a
+    # connection, and the chat path borrows a pooled session on first use.
     if st.session_state.page == "landing":
         logging.info("Displaying landing page.")
         landing_page()
     elif st.session_state.page == "login":
         logging.info("Displaying login page.")
+        inject_page_css("login")
         login_page(st, st.secrets["cred"]["email"], st.secrets["cred"]["password"])
     elif st.session_state.page == "signup":
         logging.info("Displaying signup page.")
+        inject_page_css("signup")
         signup_page(st)
     else:
         # Corrected the multiple logging of the main page by checking if the page has changed in session.
         if "previous_page" not in st.session_state or st.session_state.previous_page != "main":
             logging.info("Displaying main page.")
             st.session_state.previous_page = "main"  # Setting the previous page to main to avoid multiple logging.
+            # Just logged in: open connections while the user reads the page
+            warm_snowflake_sessions()
         main_page()
 
 
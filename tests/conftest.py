@@ -6,23 +6,31 @@ import os
 import pytest
 from dotenv import load_dotenv
 
+# Snowflake settings needed by tests marked ``snowflake``
+SNOWFLAKE_VARS = [
+    "SNOWFLAKE_ACCOUNT",
+    "SNOWFLAKE_USER",
+    "SNOWFLAKE_USER_PASSWORD",
+    "SNOWFLAKE_ROLE",
+    "SNOWFLAKE_DATABASE",
+    "SNOWFLAKE_SCHEMA",
+    "SNOWFLAKE_WAREHOUSE",
+    "SNOWFLAKE_CORTEX_SEARCH_SERVICE",
+]
+
+# Loaded before the test modules import the evaluator, which picks its backend at import;
+# tests run against the offline Cortex stand-in unless the environment asks for Snowflake
+load_dotenv()
+os.environ.setdefault("CORTEX_BACKEND", "local")
+
 
 @pytest.fixture(autouse=True)
-def load_env():
-    """Load environment variables before each test."""
+def load_env(request):
+    """Load environment variables before each test; skip ``snowflake`` tests without credentials."""
     load_dotenv()
 
-    # Verify required environment variables are set
-    required_vars = [
-        "SNOWFLAKE_ACCOUNT",
-        "SNOWFLAKE_USER",
-        "SNOWFLAKE_USER_PASSWORD",
-        "SNOWFLAKE_ROLE",
-        "SNOWFLAKE_DATABASE",
-        "SNOWFLAKE_SCHEMA",
-        "SNOWFLAKE_WAREHOUSE",
-        "SNOWFLAKE_CORTEX_SEARCH_SERVICE",
-    ]
-
-    for var in required_vars:
-        assert os.getenv(var) is not None, f"Environment variable {var} is not set"
+    if request.node.get_closest_marker("snowflake") is None:
+        return
+    missing = [var for var in SNOWFLAKE_VARS if os.getenv(var) is None]
+    if missing:
+        pytest.skip(f"Snowflake credentials required: {', '.join(missing)} not set")
@@ -0,0 +1,30 @@
+"""Test cases for generation admission control."""
+import pytest
+
+from util.admission import AdmissionQueue, OverloadedError
+
+
+def test_follow_ups_go_first_without_starving_others():
+    """Test priority ordering, FIFO within each class and the priority burst limit."""
+    queue = AdmissionQueue(max_queue=10, priority_burst=2)
+    for name in ("r1", "r2"):
+        queue.put(name)
+    for name in ("f1", "f2", "f3"):
+        queue.put(name, priority=True)
+
+    assert queue.order() == ["f1", "f2", "r1", "f3", "r2"]
+    assert queue.position("r1") == 3
+    assert queue.position("missing") == 0
+    assert [queue.take() for _ in range(6)] == ["f1", "f2", "r1", "f3", "r2", None]
+
+
+def test_full_queue_sheds():
+    """Test that requests beyond the bound are shed and counted, and withdrawn ones free a place."""
+    queue = AdmissionQueue(max_queue=2)
+    queue.put("a")
+    queue.put("b", priority=True)
+    with pytest.raises(OverloadedError):
+        queue.put("c")
+    assert queue.remove("a")
+    queue.put("c")
+    assert queue.stats() == {"waiting": 2, "queued": 2, "prioritized": 1, "shed": 1}
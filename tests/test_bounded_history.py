@@ -0,0 +1,114 @@
+"""Test cases for memory-capped chat histories."""
+import os
+import tracemalloc
+
+import pytest
+
+from util.bounded_history import BoundedHistory, SpillFile
+
+
+def turn(index):
+    """Return a question and a cited answer of roughly 2 KB."""
+    return [
+        {"role": "user", "content": f"Question {index} about index funds?"},
+        {"role": "assistant", "content": f"Answer {index}. " * 40, "citations": [f"Chunk {index} " * 40] * 3},
+    ]
+
+
+def test_history_spills_oldest_messages(tmp_path):
+    """Test that only the newest messages stay in memory and the rest read back in order."""
+    history = BoundedHistory(max_messages=4, spill_dir=str(tmp_path))
+    for index in range(5):
+        history.extend(turn(index))
+
+    assert len(history) == 10
+    assert history.spilled == 6
+    assert history[0]["content"] == "Question 0 about index funds?"
+    assert history[-1]["content"].startswith("Answer 4.")
+    assert [message["content"] for message in history[4:7]] == [
+        "Question 2 about index funds?",
+        history[5]["content"],
+        "Question 3 about index funds?",
+    ]
+    assert list(history) == [message for index in range(5) for message in turn(index)]
+    assert next(reversed(history))["role"] == "assistant"
+    assert history[-4:] == turn(3) + turn(4)
+
+
+def test_byte_cap_keeps_the_newest_message(tmp_path):
+    """Test the byte cap and that an oversized message still stays in memory."""
+    history = BoundedHistory(max_messages=100, max_bytes=3000, spill_dir=str(tmp_path))
+    for index in range(3):
+        history.extend(turn(index))
+    assert history.memory_bytes <= 3000
+    assert len(history) == 6
+
+    history.append({"role": "assistant", "content": "x" * 10000})
+    assert history.spilled == 6
+    assert history[-1]["content"] == "x" * 10000
+
+
+def test_pop_removes_the_newest_message(tmp_path):
+    """Test that popping takes back the last append, even after older messages spilled."""
+    history = BoundedHistory(max_messages=2, spill_dir=str(tmp_path))
+    history.extend(turn(0))
+    history.append({"role": "user", "content": "Unanswered?"})
+    before = history.memory_bytes
+
+    assert history.pop() == {"role": "user", "content": "Unanswered?"}
+    assert len(history) == 2
+    assert history[-1]["role"] == "assistant"
+    assert history.memory_bytes < before
+
+    history.clear()
+    with pytest.raises(IndexError):
+        history.pop()
+
+
+def test_clear_deletes_spill_file(tmp_path):
+    """Test that clearing a history removes its spill file."""
+    history = BoundedHistory(max_messages=1, spill_dir=str(tmp_path))
+    history.extend(turn(0))
+    assert len(os.listdir(tmp_path)) == 1
+
+    history.clear()
+    assert len(history) == 0
+    assert os.listdir(tmp_path) == []
+
+
+def test_spill_file_reads_ranges(tmp_path):
+    """Test reading message ranges back from a spill file."""
+    spill = SpillFile(str(tmp_path))
+    spill.extend({"role": "user", "content": str(index)} for index in range(10))
+    assert [message["content"] for message in spill.read(3, 6)] == ["3", "4", "5"]
+    assert spill.read(8, 20) == [{"role": "user", "content": "8"}, {"role": "user", "content": "9"}]
+    spill.delete()
+    assert not os.path.exists(spill.path)
+
+
+def test_memory_per_session_stays_bounded(tmp_path):
+    """Test with tracemalloc that a long conversation does not grow memory past the cap."""
+    tracemalloc.start()
+    try:
+        history = BoundedHistory(max_messages=50, max_bytes=64 * 1024, spill_dir=str(tmp_path))
+        baseline = tracemalloc.get_traced_memory()[0]
+        for index in range(100):
+            history.extend(turn(index))
+        after_short = tracemalloc.get_traced_memory()[0] - baseline
+        for index in range(100, 1000):
+            history.extend(turn(index))
+        after_long = tracemalloc.get_traced_memory()[0] - baseline
+
+        unbounded = []
+        start = tracemalloc.get_traced_memory()[0]
+        for index in range(1000):
+            unbounded.extend(turn(index))
+        unbounded_size = tracemalloc.get_traced_memory()[0] - start
+    finally:
+        tracemalloc.stop()
+
+    assert len(history) == 2000
+    # Ten times the turns costs only the spill offsets (8 bytes per message)
+    assert after_long - after_short < 32 * 1024
+    assert after_long < 4 * 64 * 1024
+    assert unbounded_size > 10 * after_long
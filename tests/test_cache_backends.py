@@ -0,0 +1,100 @@
+"""Test cases for the tiered cache and its shared backends."""
+import pytest
+
+from util.cache_backends import (
+    CacheBackend,
+    KeyValueCacheBackend,
+    LocalKeyValueStore,
+    SQLiteCacheBackend,
+    TieredCache,
+    backend_key,
+)
+from util.retrieval_cache import RetrievalCache, make_key
+
+
+def replica(shared, namespace="retrieval"):
+    """Return a cache as one app replica would build it."""
+    return TieredCache(namespace, RetrievalCache(max_entries=10), shared, ttl_seconds=60, flush_interval=0.01)
+
+
+@pytest.fixture(params=["sqlite", "kv"])
+def shared(request, tmp_path):
+    if request.param == "sqlite":
+        return SQLiteCacheBackend(str(tmp_path / "cache.db"))
+    return KeyValueCacheBackend(LocalKeyValueStore())
+
+
+def test_replicas_share_entries_through_the_shared_tier(shared):
+    """Test write-behind to the shared tier and read-through into another replica's local tier."""
+    first, second = replica(shared), replica(shared)
+    key = make_key("EDU_SERVICE", "index funds", ["CHUNK"], {}, 3)
+    value = ("context", [{"CHUNK": "Index funds track a market index."}])
+
+    first.put(key, value)
+    first.flush()
+    assert second.get(key) == value
+    assert len(second) == 1  # kept locally after the read-through
+    assert second.get(key) == value
+    assert second.stats()["shared_hits"] == 1 and second.stats()["combined_hit_rate"] == 1.0
+
+    # Namespaces keep caches apart in one backend
+    assert replica(shared, namespace="rewrite").get(key) is None
+    first.close()
+    second.close()
+
+
+def test_sqlite_backend_evicts_oldest_entries(tmp_path):
+    """Test that the SQLite tier keeps at most ``max_entries`` entries, dropping the oldest written."""
+    backend = SQLiteCacheBackend(str(tmp_path / "cache.db"), max_entries=3)
+    for index in range(5):
+        backend.set_many([(f"key{index}", b"value")], ttl_seconds=60)
+    assert len(backend) == 3
+    assert backend.get("key0") is None and backend.get("key4") == b"value"
+
+    backend.set_many([("expired", b"value")], ttl_seconds=-1)
+    assert backend.get("expired") is None
+
+
+def test_shared_tier_failures_fall_back_to_local():
+    """Test that an unreachable shared tier only costs misses."""
+
+    class Unreachable(LocalKeyValueStore):
+        def get(self, key):
+            raise ConnectionError("connection refused")
+
+        def set(self, key, value, ex=None):
+            raise ConnectionError("connection refused")
+
+    cache = replica(KeyValueCacheBackend(Unreachable()))
+    cache.put("key", "value")
+    cache.flush()
+    assert cache.get("key") == "value"
+    assert cache.get("other") is None
+    assert cache.stats()["shared_errors"] == 2
+    cache.close()
+
+
+def test_undecodable_shared_entry_is_a_miss_and_dropped(shared):
+    """Test that an entry another version wrote, or a corrupt one, is deleted instead of raising."""
+    cache = replica(shared)
+    shared_key = backend_key("retrieval", "key")
+    shared.set_many([(shared_key, b"not a pickle")], 60)
+
+    assert cache.get("key") is None
+    assert shared.get(shared_key) is None
+    stats = cache.stats()
+    assert stats["decode_errors"] == 1
+    assert stats["shared_misses"] == 1
+    assert stats["shared_hits"] == 0
+    cache.close()
+
+
+def test_backends_must_implement_the_interface():
+    """Test that an incomplete backend cannot be created."""
+
+    class ReadOnlyBackend(CacheBackend):
+        def get(self, key):
+            return None
+
+    with pytest.raises(TypeError):
+        ReadOnlyBackend()
@@ -0,0 +1,95 @@
+"""Test cases for cache snapshots and warm restarts."""
+import os
+import sys
+import time
+import types
+
+import pytest
+
+from util.cache_snapshot import CacheSnapshotter, SnapshotError, read_snapshot, write_snapshot
+from util.prompts import PromptRegistry
+from util.retrieval_cache import RetrievalCache, make_key
+
+
+def test_snapshot_round_trip_and_checksum(tmp_path):
+    """Test that a snapshot reads back as written and corruption is detected."""
+    path = str(tmp_path / "retrieval.snapshot")
+    key = make_key("EDU_SERVICE", "index funds", ["CHUNK"], {}, 3)
+    entries = [(key, ("context", [{"CHUNK": "Index funds track an index."}]), 1700000000.0)]
+    write_snapshot(path, entries, {"fingerprint": {"corpus_version": "v1"}})
+
+    assert read_snapshot(path) == ({"fingerprint": {"corpus_version": "v1"}}, entries)
+
+    with open(path, "r+b") as f:
+        f.seek(-40, 2)
+        f.write(b"X")
+    with pytest.raises(SnapshotError):
+        read_snapshot(path)
+
+
+def test_restart_restores_live_entries(tmp_path):
+    """Test that a new process restores unexpired entries with their age and discards stale snapshots."""
+    cache = RetrievalCache(ttl_seconds=600)
+    cache.put("fresh", "value")
+    snapshotter = CacheSnapshotter(str(tmp_path))
+    snapshotter.register("retrieval", cache, {"corpus_version": "v1"})
+    assert snapshotter.save_all() == {"retrieval": 1}
+
+    restarted = RetrievalCache(ttl_seconds=600)
+    snapshotter = CacheSnapshotter(str(tmp_path))
+    snapshotter.register("retrieval", restarted, {"corpus_version": "v1"})
+    assert snapshotter.load_all() == {"retrieval": 1}
+    assert restarted.get("fresh") == "value"
+
+    # A reindexed corpus invalidates the snapshot
+    reindexed = RetrievalCache(ttl_seconds=600)
+    snapshotter = CacheSnapshotter(str(tmp_path))
+    snapshotter.register("retrieval", reindexed, {"corpus_version": "v2"})
+    assert snapshotter.load_all() == {"retrieval": 0}
+    assert len(reindexed) == 0
+
+
+def test_restore_skips_expired_entries():
+    """Test that entries which expired while the app was down are not restored."""
+    cache = RetrievalCache(ttl_seconds=60)
+    now = time.time()
+    assert cache.restore([("old", 1, now - 120), ("recent", 2, now - 30)]) == 1
+    assert cache.get("recent") == 2 and cache.get("old") is None
+
+
+def test_prompt_fingerprint_tracks_templates():
+    """Test that the prompt hash changes with any base prompt."""
+    base = PromptRegistry({"financial_literacy": "Explain simply.", "investment": "Be careful."})
+    assert base.fingerprint == PromptRegistry({"investment": "Be careful.", "financial_literacy": "Explain simply."}).fingerprint
+    assert base.fingerprint != PromptRegistry({"financial_literacy": "Explain briefly.", "investment": "Be careful."}).fingerprint
+
+
+def test_unrestorable_snapshot_is_logged_and_deleted(tmp_path, caplog):
+    """Test that a snapshot pickling a class that no longer exists is discarded without failing startup."""
+    module = types.ModuleType("vanished_cache_values")
+
+    class Answer:
+        pass
+
+    Answer.__module__ = module.__name__
+    Answer.__qualname__ = "Answer"
+    module.Answer = Answer
+    sys.modules[module.__name__] = module
+    try:
+        cache = RetrievalCache(ttl_seconds=600)
+        cache.put("key", Answer())
+        saved = CacheSnapshotter(str(tmp_path))
+        saved.register("completion", cache)
+        saved.register("retrieval", RetrievalCache(ttl_seconds=600))
+        saved.save_all()
+    finally:
+        del sys.modules[module.__name__]
+
+    restarted = RetrievalCache(ttl_seconds=600)
+    snapshotter = CacheSnapshotter(str(tmp_path))
+    snapshotter.register("completion", restarted)
+    snapshotter.register("retrieval", RetrievalCache(ttl_seconds=600))
+    assert snapshotter.load_all() == {"retrieval": 0}
+    assert len(restarted) == 0
+    assert not os.path.exists(snapshotter.path("completion"))
+    assert "vanished_cache_values" in caplog.text
@@ -0,0 +1,94 @@
+"""Test cases for per-section retrieval context reuse."""
+from util.conversation_context import DELTA, FRESH, REUSE, ConversationContextMemory, is_follow_up, term_overlap
+
+SCOPE = ("FIN_SERVICE", "{}")
+QUESTION = "How do index funds and bonds compare on fees?"
+CLOSE_FOLLOW_UP = "Are index fund fees lower than bonds?"
+CONTEXT = (
+    "Index funds track a market index with low fees.\nBonds pay fixed interest and lower portfolio risk.\n"
+    "Unlike credit card debt, where interest rates compound monthly, index fund returns vary with inflation."
+)
+
+
+def remembered_memory(**kwargs):
+    """Return a memory holding one investment turn about index funds and bonds."""
+    memory = ConversationContextMemory(**kwargs)
+    memory.remember("investment", QUESTION, SCOPE, CONTEXT, [{"CHUNK": "a"}, {"CHUNK": "b"}])
+    return memory
+
+
+def test_term_overlap_and_follow_up_cues():
+    """Test the similarity measure and continuation detection."""
+    assert term_overlap([], {"index"}) == 1.0
+    assert term_overlap(["index", "tax"], {"index"}) == 0.5
+    assert term_overlap(["funds"], {"fund"}) == 1.0
+    assert is_follow_up("And what about for retirement?")
+    assert is_follow_up("what if I retire early")
+    assert not is_follow_up("What is inflation?")
+
+
+def test_plan_without_previous_turn_is_fresh():
+    """Test that the first question of a section searches afresh."""
+    memory = ConversationContextMemory()
+    assert memory.plan("investment", "How do index funds work?", SCOPE).action == FRESH
+
+
+def test_plan_reuses_close_follow_up():
+    """Test that a follow-up covered by the previous topic reuses its hits."""
+    memory = remembered_memory()
+    plan = memory.plan("investment", CLOSE_FOLLOW_UP, SCOPE)
+    assert plan.action == REUSE
+    assert plan.previous.results == [{"CHUNK": "a"}, {"CHUNK": "b"}]
+    assert plan.previous.context == CONTEXT
+
+
+def test_plan_searches_only_new_terms():
+    """Test that partially new follow-ups get a delta search for the new terms."""
+    memory = remembered_memory()
+    plan = memory.plan("investment", "Do index funds and bonds have tax benefits?", SCOPE)
+    assert plan.action == DELTA
+    assert plan.delta_query == "tax benefits"
+
+    # A continuation cue extends the topic even when all its terms are new
+    plan = memory.plan("investment", "And what about for retirement?", SCOPE)
+    assert plan.action == DELTA
+    assert plan.delta_query == "retirement"
+
+
+def test_plan_is_fresh_for_new_topic_scope_or_section():
+    """Test that unrelated questions, changed search settings and other sections search afresh."""
+    memory = remembered_memory()
+    assert memory.plan("investment", "What is inflation?", SCOPE).action == FRESH
+    assert memory.plan("investment", CLOSE_FOLLOW_UP, ("FIN_SERVICE", '{"@eq": {}}')).action == FRESH
+    assert memory.plan("financial_literacy", CLOSE_FOLLOW_UP, SCOPE).action == FRESH
+
+
+def test_reuse_is_capped():
+    """Test that a context is not reused indefinitely."""
+    memory = remembered_memory(max_reuses=1)
+    plan = memory.plan("investment", CLOSE_FOLLOW_UP, SCOPE)
+    memory.remember("investment", CLOSE_FOLLOW_UP, SCOPE, CONTEXT, plan.previous.results, plan)
+    assert memory.plan("investment", CLOSE_FOLLOW_UP, SCOPE).action == FRESH
+
+    memory.forget("investment")
+    assert memory.plan("investment", CLOSE_FOLLOW_UP, SCOPE).action == FRESH
+
+
+def test_topic_ignores_retrieved_context():
+    """Test that terms only the retrieved chunks mention do not make a new question look like a follow-up."""
+    memory = ConversationContextMemory()
+    memory.remember("investment", "What is an index fund?", SCOPE, CONTEXT, [{"CHUNK": "a"}])
+    assert memory.plan("investment", "How do credit card interest rates work?", SCOPE).action == FRESH
+    assert memory.plan("investment", "Does inflation affect returns?", SCOPE).action == FRESH
+
+    remembered = remembered_memory()
+    assert remembered.plan("investment", "How do credit card interest rates work?", SCOPE).action == FRESH
+
+
+def test_topic_includes_searched_query():
+    """Test that a history-aware rewrite searched instead of the question counts toward the topic."""
+    memory = ConversationContextMemory()
+    memory.remember(
+        "investment", "Which is cheaper?", SCOPE, CONTEXT, [{"CHUNK": "a"}], search_query="index fund versus bond fees"
+    )
+    assert memory.plan("investment", CLOSE_FOLLOW_UP, SCOPE).action == REUSE
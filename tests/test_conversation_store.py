@@ -0,0 +1,113 @@
+"""Test cases for the persistent conversation store."""
+import threading
+import time
+
+import pytest
+
+from util.conversation_store import ConversationStore, SnowflakeConversationStore, SQLiteConversationStore
+
+
+def test_sqlite_store_returns_recent_messages_in_order(tmp_path):
+    """Test appends, batching and per-user, per-section recent lookups."""
+    store = SQLiteConversationStore(str(tmp_path / "history.db"), flush_interval=0.05)
+    for index in range(10):
+        store.append("ann@example.com", "fin_lit", {"role": "user", "content": f"Question {index}?"})
+    store.append("ann@example.com", "fin_lit", {"role": "assistant", "content": "Answer.", "citations": ["Chunk"]})
+    store.append("ann@example.com", "investment", {"role": "user", "content": "Other section"})
+    store.append("bob@example.com", "fin_lit", {"role": "user", "content": "Other user"})
+    store.flush()
+
+    recent = store.recent("ann@example.com", "fin_lit", 3)
+    assert recent == [
+        {"role": "user", "content": "Question 8?"},
+        {"role": "user", "content": "Question 9?"},
+        {"role": "assistant", "content": "Answer.", "citations": ["Chunk"]},
+    ]
+    assert store.recent("bob@example.com", "fin_lit", 10) == [{"role": "user", "content": "Other user"}]
+    stats = store.stats()
+    assert stats["written"] == 13
+    assert stats["batches"] < 13
+    store.close()
+
+    reopened = SQLiteConversationStore(str(tmp_path / "history.db"))
+    assert len(reopened.recent("ann@example.com", "fin_lit", 100)) == 11
+    reopened.close()
+
+
+def test_rehydrating_a_long_history_is_fast(tmp_path):
+    """Test that loading the last turns stays fast for a user with thousands of messages."""
+    store = SQLiteConversationStore(str(tmp_path / "history.db"), batch_size=500)
+    for index in range(5000):
+        store.append("ann@example.com", "fin_lit", {"role": "user", "content": f"Question {index} " * 20})
+    store.flush()
+
+    start = time.perf_counter()
+    recent = store.recent("ann@example.com", "fin_lit", 20)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    store.close()
+
+    assert len(recent) == 20
+    assert recent[-1]["content"].startswith("Question 4999 ")
+    assert elapsed_ms < 50
+
+
+def test_full_queue_drops_instead_of_blocking():
+    """Test that appends never wait for a slow backend."""
+    release = threading.Event()
+
+    class SlowStore(ConversationStore):
+        def _write_rows(self, rows):
+            release.wait(5)
+
+        def recent(self, user_id, section, limit):
+            return []
+
+    store = SlowStore(batch_size=1, queue_size=2)
+    results = [store.append("ann", "fin_lit", {"role": "user", "content": str(index)}) for index in range(10)]
+    release.set()
+    store.close()
+
+    assert results.count(False) >= 7
+    assert store.stats()["dropped"] == results.count(False)
+
+
+def test_store_requires_backend_methods():
+    """Test that a store without ``recent`` and ``_write_rows`` cannot be created."""
+
+    class WriteOnlyStore(ConversationStore):
+        def _write_rows(self, rows):
+            pass
+
+    with pytest.raises(TypeError):
+        ConversationStore()
+    with pytest.raises(TypeError):
+        WriteOnlyStore()
+
+
+def test_snowflake_store_batches_inserts():
+    """Test the Snowflake backend's SQL through a fake session runner."""
+
+    class FakeSession:
+        def __init__(self):
+            self.statements = []
+
+        def sql(self, query, params=None):
+            self.statements.append((query, params))
+            rows = [("user", "Question?", None), ("assistant", "Answer.", '["Chunk"]')] if query.startswith("SELECT") else []
+            return type("Result", (), {"collect": lambda self: list(reversed(rows))})()
+
+    session = FakeSession()
+    store = SnowflakeConversationStore(lambda call: call(session), table="CHAT", flush_interval=0.05)
+    store.append("ann", "fin_lit", {"role": "user", "content": "Question?"})
+    store.append("ann", "fin_lit", {"role": "assistant", "content": "Answer."})
+    store.flush()
+    recent = store.recent("ann", "fin_lit", 2)
+    store.close()
+
+    inserts = [statement for statement in session.statements if statement[0].startswith("INSERT")]
+    assert len(inserts) == 1
+    assert len(inserts[0][1]) == 12
+    assert recent == [
+        {"role": "user", "content": "Question?"},
+        {"role": "assistant", "content": "Answer.", "citations": ["Chunk"]},
+    ]
@@ -10,7 +10,7 @@ from snowflake.snowpark import Session
 from trulens.connectors.snowflake import SnowflakeConnector
 from trulens.core import TruSession
 
-from evaluate_cortex import CortexSearchRetriever, RAG_from_scratch, connection_params
+from evaluate_cortex import ConnectionManager, CortexSearchRetriever, RAG_from_scratch, connection_params, feedback_function, main
 
 
 @pytest.fixture
@@ -50,6 +50,7 @@ def mock_snowflake_connector():
     return Mock(spec=SnowflakeConnector)
 
 
+@pytest.mark.snowflake
 def test_connection_params_structure():
     """Test that connection parameters have all required fields."""
     required_params = {
@@ -252,3 +253,58 @@ def test_rag_from_scratch_generate_completion(mock_rag_dependencies):
         assert "mistral-large2" in call_args
         assert query in call_args[1]
         assert all(c in call_args[1] for c in context)
+
+
+def test_connection_manager_shares_one_login(mock_rag_dependencies):
+    """Test that the run's retriever, completions, TruLens and feedback share one session."""
+    with patch("evaluate_cortex.create_snowpark_session", return_value=mock_rag_dependencies["session"]) as mock_create, patch(
+        "evaluate_cortex.Cortex"
+    ) as mock_cortex, patch("evaluate_cortex.Complete", return_value="answer") as mock_complete, patch("evaluate_cortex.Root"):
+        with ConnectionManager() as connections:
+            main(connections)
+            rag = RAG_from_scratch(connections)
+            feedback_function(connections)
+            rag.generate_completion("test query", ["context"])
+
+            assert rag.tru_session == mock_rag_dependencies["tru_session"]
+            mock_cortex.assert_called_once_with(mock_rag_dependencies["session"], "mistral-large2")
+            assert mock_complete.call_args[1]["session"] is mock_rag_dependencies["session"]
+
+    stats = connections.stats()
+    assert mock_create.call_count == 1
+    assert stats["logins"] == 1
+    assert stats["calls"] == {"retriever": 3, "completion": 1}
+    mock_rag_dependencies["session"].close.assert_called_once()
+
+
+def test_connection_manager_follows_reconnect(mock_rag_dependencies):
+    """Test that retrieval, TruLens and feedback move to the new session after a reconnect."""
+    expired, fresh = Mock(spec=Session), Mock(spec=Session)
+    with patch("evaluate_cortex.create_snowpark_session", side_effect=[expired, fresh]), patch(
+        "evaluate_cortex.Cortex"
+    ) as mock_cortex, patch("evaluate_cortex.Root") as mock_root, patch("evaluate_cortex.SnowflakeConnector") as mock_connector:
+        with ConnectionManager() as connections:
+            rag = RAG_from_scratch(connections)
+            connections.provider()
+            connections._primary.reconnect()
+
+            rag.retrieve_context("test query")
+            provider = connections.provider()
+            tru_snowflake_connector = rag.tru_snowflake_connector
+
+    expired.close.assert_called_once()
+    mock_root.assert_called_once_with(fresh)
+    assert mock_cortex.call_args_list[-1].args == (fresh, "mistral-large2")
+    assert provider is mock_cortex.return_value
+    assert mock_connector.call_args_list[-1].kwargs == {"snowpark_session": fresh}
+    assert tru_snowflake_connector is mock_connector.return_value
+    assert connections.stats()["reconnects"] == 1
+
+
+def test_connection_manager_raises_when_login_fails():
+    """Test that a failed login is reported instead of handing out no session."""
+    with patch("evaluate_cortex.create_snowpark_session", return_value=None):
+        connections = ConnectionManager()
+        with pytest.raises(ConnectionError):
+            connections.session()
+        assert connections.stats()["logins"] == 0
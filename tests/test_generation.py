@@ -0,0 +1,118 @@
+"""Test cases for the answer generation pool."""
+import threading
+
+import pytest
+
+from util.admission import OverloadedError
+from util.generation import GenerationPool, current_job
+
+
+@pytest.fixture
+def pool():
+    pool = GenerationPool(max_workers=2)
+    yield pool
+    pool.shutdown()
+
+
+def test_double_submit_shares_one_job(pool):
+    """Test that submitting an in-flight key returns the running job instead of starting another."""
+    release = threading.Event()
+    calls = []
+
+    def generate(question):
+        calls.append(question)
+        release.wait(5)
+        return f"answer to {question}"
+
+    first = pool.submit(("session", "fin_lit", "what is an index fund"), generate, "What is an index fund?")
+    second = pool.submit(("session", "fin_lit", "what is an index fund"), generate, "What is an index fund?")
+    assert second is first
+    release.set()
+    assert first.result(5) == "answer to What is an index fund?"
+    assert calls == ["What is an index fund?"]
+    stats = pool.stats()
+    assert (stats["submitted"], stats["deduplicated"], stats["completed"], stats["in_flight"]) == (1, 1, 1, 0)
+
+    # Once finished, the same question starts a new generation
+    assert pool.submit(("session", "fin_lit", "what is an index fund"), generate, "again") is not first
+
+
+def test_pool_caps_concurrent_generations(pool):
+    """Test that no more than ``max_workers`` generations run at once and the rest wait for a worker."""
+    running, peak, lock = [0], [0], threading.Lock()
+    release = threading.Event()
+
+    def generate():
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        release.wait(5)
+        with lock:
+            running[0] -= 1
+
+    jobs = [pool.submit(index, generate) for index in range(5)]
+    assert not jobs[-1].wait(0.1)
+    assert jobs[-1].started_at is None and pool.in_flight() == 5
+    release.set()
+    assert all(job.wait(5) for job in jobs)
+    assert peak[0] == 2
+
+
+def test_failures_and_current_job(pool):
+    """Test that a job exposes itself to the generation and surfaces its exception."""
+
+    def generate():
+        current_job().errors.append("completion failed")
+        raise RuntimeError("search unavailable")
+
+    job = pool.submit("key", generate)
+    with pytest.raises(RuntimeError):
+        job.result(5)
+    assert job.errors == ["completion failed"]
+    assert current_job() is None
+    assert pool.stats()["failed"] == 1
+
+
+def test_waiting_jobs_are_admitted_in_priority_order():
+    """Test queue positions, follow-up priority and load shedding once the queue is full."""
+    pool = GenerationPool(max_workers=1, max_queue=3)
+    release, started = threading.Event(), []
+
+    def generate(name):
+        started.append(name)
+        release.wait(5)
+
+    try:
+        running = pool.submit("running", generate, "running")
+        while not started:
+            running.wait(0.01)
+        regular = pool.submit("regular", generate, "regular")
+        follow_up = pool.submit("follow-up", generate, "follow-up", priority=True)
+        assert (pool.position(running), pool.position(follow_up), pool.position(regular)) == (0, 1, 2)
+
+        pool.submit("third", generate, "third")
+        assert not pool.accepting()
+        with pytest.raises(OverloadedError):
+            pool.submit("shed", generate, "shed")
+
+        release.set()
+        assert regular.wait(5)
+        assert started[:3] == ["running", "follow-up", "regular"]
+        assert pool.stats()["shed"] == 1
+    finally:
+        release.set()
+        pool.shutdown()
+
+
+def test_jobs_waiting_too_long_are_shed():
+    """Test that a job past ``max_queue_seconds`` fails with OverloadedError instead of starting."""
+    pool = GenerationPool(max_workers=1, max_queue_seconds=0.05)
+    release = threading.Event()
+    try:
+        pool.submit("slow", release.wait, 0.2)
+        late = pool.submit("late", lambda: "never")
+        with pytest.raises(OverloadedError):
+            late.result(5)
+        assert pool.stats()["expired"] == 1
+    finally:
+        pool.shutdown()
@@ -0,0 +1,110 @@
+"""Test cases for idle session reaping."""
+import threading
+
+from util.idle_sessions import IdleSessionManager
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def always_active(session_id):
+    return True
+
+
+def test_idle_sessions_are_released_once():
+    """Test that only sessions idle past the timeout are released, and only once until active again."""
+    clock = FakeClock()
+    released = []
+    manager = IdleSessionManager(always_active, idle_timeout=60, clock=clock)
+    manager.touch("busy")
+    manager.touch("idle")
+
+    clock.now = 50
+    manager.touch("busy")
+    clock.now = 100
+    report = manager.reap()
+    assert report.sessions == 1
+
+    clock.now = 200
+    assert manager.reap().sessions == 1
+    assert manager.stats() == {"tracked": 2, "idle": 2, "released": 2, "bytes_reclaimed": 0, "passes": 2}
+
+    # The session's next run frees its state, once
+    assert manager.touch("idle", lambda: released.append("idle") or 100) == 100
+    assert manager.touch("idle", lambda: released.append("idle") or 100) == 0
+    assert released == ["idle"]
+    assert manager.stats()["bytes_reclaimed"] == 100
+
+    clock.now = 300
+    assert manager.reap().sessions == 1
+    manager.touch("idle", lambda: released.append("idle") or 100)
+    assert released == ["idle", "idle"]
+
+
+def test_reaper_never_calls_release():
+    """Test that a session's state is only released from the session's own touch."""
+    clock = FakeClock()
+    threads = []
+    manager = IdleSessionManager(always_active, idle_timeout=1, clock=clock)
+    manager.touch("idle")
+    clock.now = 5
+    reaper = threading.Thread(target=manager.reap)
+    reaper.start()
+    reaper.join()
+
+    manager.touch("idle", lambda: threads.append(threading.current_thread()) or 0)
+    assert threads == [threading.current_thread()]
+
+
+def test_session_touched_during_pass_is_not_released():
+    """Test that the idle check and the release mark happen together under the lock."""
+    clock = FakeClock()
+    manager = IdleSessionManager(always_active, idle_timeout=60, clock=clock)
+    manager.touch("open")
+
+    def activity_check(session_id):
+        # The session runs the script while the reaper checks which sessions are gone
+        manager.touch("open")
+        return True
+
+    clock.now = 100
+    manager.is_active = activity_check
+    assert manager.reap().sessions == 0
+    assert manager.stats()["idle"] == 0
+
+
+def test_discarded_sessions_are_forgotten():
+    """Test that sessions Streamlit discarded are dropped without being released."""
+    active = {"open"}
+    clock = FakeClock()
+    manager = IdleSessionManager(active.__contains__, idle_timeout=60, clock=clock)
+    manager.touch("open")
+    manager.touch("closed")
+    clock.now = 100
+    report = manager.reap()
+    assert manager.stats()["tracked"] == 1
+    assert report.sessions == 1
+
+
+def test_activity_check_errors_keep_tracking():
+    """Test that a failing activity check does not forget the session."""
+    manager = IdleSessionManager(lambda session_id: 1 / 0, idle_timeout=60, clock=FakeClock())
+    manager.touch("open")
+    manager.reap()
+    assert manager.stats()["tracked"] == 1
+
+
+def test_release_errors_are_contained():
+    """Test that a failing release does not stop the session's run."""
+    clock = FakeClock()
+    manager = IdleSessionManager(always_active, idle_timeout=1, clock=clock)
+    manager.touch("failing")
+    clock.now = 5
+    manager.reap()
+    assert manager.touch("failing", lambda: 1 / 0) == 0
+    assert manager.stats()["idle"] == 0
@@ -0,0 +1,23 @@
+"""Test cases for the app entry points' import cost."""
+import os
+
+import pytest
+
+from benchmarks.import_time import check_module, parse_importtime
+
+SAMPLE = """import time: self [us] | cumulative | imported package
+import time:       120 |        120 |   _io
+import time:      2500 |       8000 |     streamlit
+import time:       600 |       9100 | streamlite_app
+"""
+
+
+def test_parse_importtime():
+    """Test that the importtime report is parsed per module."""
+    assert parse_importtime(SAMPLE) == {"_io": (120, 120), "streamlit": (2500, 8000), "streamlite_app": (600, 9100)}
+
+
+@pytest.mark.parametrize("module", ["streamlite_app", "app"])
+def test_entry_point_imports_lazily_within_budget(module):
+    """Test that importing an entry point skips Snowflake and stays within the import budget."""
+    assert check_module(module, budget_ms=float(os.getenv("IMPORT_BUDGET_MS", "3000")), top=0) == []
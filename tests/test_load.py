@@ -0,0 +1,37 @@
+"""Test cases for the multi-session load harness."""
+import subprocess
+import sys
+
+from benchmarks.load import check, summarize
+
+SUMMARY = {
+    "stages": {"turn": summarize([100.0, 200.0, 900.0])},
+    "error_rate": 0.1,
+    "state_kb_per_user": 40.0,
+}
+
+
+def test_summarize_percentiles():
+    """Test that stage samples are summarized as count and percentiles."""
+    assert summarize([float(ms) for ms in range(1, 101)]) == {"count": 100, "p50": 51.0, "p95": 95.0, "p99": 99.0}
+
+
+def test_check_reports_exceeded_thresholds():
+    """Test that only exceeded thresholds are reported, and unset thresholds are ignored."""
+    assert check(SUMMARY, max_p95_ms=1000, max_error_rate=0.2, max_state_kb=64) == []
+    assert check(SUMMARY, max_p95_ms=None, max_error_rate=None, max_state_kb=None) == []
+    assert check(SUMMARY, max_p95_ms=500, max_error_rate=0.05, max_state_kb=32) == [
+        "turn p95 900ms exceeds 500ms",
+        "error rate 0.100 exceeds 0.050",
+        "session state 40.0KiB per user exceeds 32.0KiB",
+    ]
+
+
+def test_load_run_passes_gate():
+    """Test that a small concurrent load run logs every user in and answers every turn."""
+    command = [sys.executable, "-m", "benchmarks.load", "--users", "3", "--concurrency", "3", "--turns", "2"]
+    command += ["--complete-ms", "20", "--search-ms", "5", "--corpus-rows", "200", "--max-error-rate", "0"]
+    result = subprocess.run(command, capture_output=True, text=True, timeout=300)
+    assert result.returncode == 0, result.stdout + result.stderr
+    assert "error_rate=0.000" in result.stdout
+    assert "turn " in result.stdout and "complete " in result.stdout
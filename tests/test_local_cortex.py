@@ -0,0 +1,104 @@
+"""Test cases for the offline Cortex stand-in."""
+import json
+import sys
+import time
+from unittest.mock import patch
+
+import pytest
+
+from util.local_cortex import LocalCortex, LocalCortexError, install, load_corpus, make_corpus
+
+CORPUS = [
+    {"CHUNK": "Index funds track a market index at low cost.", "source": "funds"},
+    {"CHUNK": "Compound interest grows savings over time.", "source": "interest"},
+]
+
+
+def test_complete_is_deterministic():
+    """Test that answers depend only on the model and prompt, not on the seed or call order."""
+    cortex = LocalCortex(corpus=CORPUS, seed=1)
+    answer = cortex.Complete("mistral-large2", "What is an index fund?")
+
+    assert answer == LocalCortex(corpus=CORPUS, seed=2).Complete("mistral-large2", "What is an index fund?")
+    assert answer != cortex.Complete("llama3.1-70b", "What is an index fund?")
+    assert len(answer.split()) == cortex.answer_tokens
+    assert cortex.Complete("mistral-large2", [{"role": "user", "content": "What is an index fund?"}]) == answer
+
+
+def test_complete_latency_and_token_rate():
+    """Test that a completion takes its time to first token plus its generation time."""
+    cortex = LocalCortex(corpus=CORPUS, latency=0.05, tokens_per_second=1000, answer_tokens=50)
+    start = time.perf_counter()
+    cortex.Complete("mistral-large2", "What is an index fund?")
+    assert time.perf_counter() - start >= 0.1
+
+
+def test_streamed_chunks_join_to_the_answer():
+    """Test that a streamed completion yields the answer word by word."""
+    cortex = LocalCortex(corpus=CORPUS)
+    chunks = list(cortex.Complete("mistral-large2", "What is an index fund?", stream=True))
+
+    assert len(chunks) == cortex.answer_tokens
+    assert "".join(chunks) == cortex.Complete("mistral-large2", "What is an index fund?")
+
+
+def test_error_injection():
+    """Test that calls chosen to fail raise, streamed ones when iterated, and are counted."""
+    cortex = LocalCortex(corpus=CORPUS, error_rate=1.0)
+    with pytest.raises(LocalCortexError):
+        cortex.Complete("mistral-large2", "What is an index fund?")
+    stream = cortex.Complete("mistral-large2", "What is an index fund?", stream=True)
+    with pytest.raises(LocalCortexError):
+        next(stream)
+
+    assert cortex.stats()["completions"] == 2
+    assert cortex.stats()["errors"] == 2
+
+
+def test_search_through_root():
+    """Test that services resolve through Root and search their own corpus."""
+    cortex = LocalCortex(corpus=CORPUS, services={"FIN_SERVICE": [{"CHUNK": "Bond ladders spread maturities."}]})
+    session = cortex.Session.builder.configs({"account": "a"}).create()
+    schema = cortex.Root(session).databases["DB"].schemas["PUBLIC"]
+
+    results = schema.cortex_search_services["EDU_SERVICE"].search("index fund", columns=["CHUNK", "source"], limit=1).results
+    assert results == [CORPUS[0]]
+    assert schema.cortex_search_services["FIN_SERVICE"].search("bond ladders", columns=["CHUNK"], limit=1).results
+    assert cortex.stats()["searches"] == 2
+    assert session.configs == {"account": "a"}
+
+
+def test_closed_session_fails():
+    """Test that SQL and completions on a closed session raise."""
+    cortex = LocalCortex(corpus=CORPUS)
+    session = cortex.create_session()
+    session.sql("SELECT 1").collect()
+    session.close()
+
+    assert session.queries == ["SELECT 1"]
+    with pytest.raises(LocalCortexError):
+        session.sql("SELECT 1")
+    with pytest.raises(LocalCortexError):
+        cortex.Complete("mistral-large2", "Hi", session=session)
+
+
+def test_install_replaces_snowflake_imports():
+    """Test that lazily imported Snowflake names resolve to the stand-in after install."""
+    cortex = LocalCortex(corpus=CORPUS)
+    with patch.dict(sys.modules):
+        install(cortex)
+        from snowflake.core import Root
+        from snowflake.cortex import Complete
+        from snowflake.snowpark import Session
+
+        session = Session.builder.configs({}).create()
+        assert Complete("mistral-large2", "Hi", session=session) == cortex.answer("mistral-large2", "Hi")
+        assert Root(session).databases["DB"].schemas["PUBLIC"].cortex_search_services["EDU_SERVICE"] is cortex.service("EDU")
+
+
+def test_corpus_sources(tmp_path):
+    """Test that synthetic corpora are reproducible and JSON lines corpora load row by row."""
+    assert make_corpus(5, seed=3) == make_corpus(5, seed=3)
+    path = tmp_path / "corpus.jsonl"
+    path.write_text("\n".join(json.dumps(row) for row in CORPUS) + "\n")
+    assert load_corpus(str(path)) == CORPUS
@@ -0,0 +1,107 @@
+"""Test cases for the metrics registry and endpoint."""
+import threading
+import urllib.request
+
+import pytest
+
+from util.metrics import MetricsRegistry, TraceMetrics, start_http_server
+from util.tracing import Tracer
+
+
+def test_counter_and_gauge_render_with_labels():
+    """Test counters and gauges in the Prometheus text format."""
+    registry = MetricsRegistry()
+    requests = registry.counter("app_requests_total", "Chat requests handled", ["section"])
+    requests.inc(section="fin_lit")
+    requests.inc(2, section="fin_lit")
+    sessions = registry.gauge("app_pool_sessions", "Open sessions")
+    sessions.set(3)
+    sessions.dec()
+    registry.gauge("app_cache_entries", "Cache entries", func=lambda: 7)
+
+    text = registry.render()
+    assert "# TYPE app_requests_total counter" in text
+    assert 'app_requests_total{section="fin_lit"} 3' in text
+    assert "app_pool_sessions 2" in text
+    assert "app_cache_entries 7" in text
+    assert registry.counter("app_requests_total", "Chat requests handled", ["section"]) is requests
+
+
+def test_metric_names_and_labels_are_checked():
+    """Test that a name is bound to one metric type and labels must match."""
+    registry = MetricsRegistry()
+    counter = registry.counter("app_errors_total", "Errors", ["stage"])
+    with pytest.raises(ValueError):
+        registry.gauge("app_errors_total", "Errors")
+    with pytest.raises(ValueError):
+        counter.inc(section="fin_lit")
+
+
+def test_histogram_buckets_are_cumulative():
+    """Test histogram bucket counts, sum and count."""
+    registry = MetricsRegistry()
+    latency = registry.histogram("app_stage_duration_seconds", "Stage latency", ["stage"], buckets=(0.1, 1.0))
+    for value in (0.05, 0.1, 0.5, 3.0):
+        latency.observe(value, stage="complete")
+
+    text = registry.render()
+    assert 'app_stage_duration_seconds_bucket{stage="complete",le="0.1"} 2' in text
+    assert 'app_stage_duration_seconds_bucket{stage="complete",le="1"} 3' in text
+    assert 'app_stage_duration_seconds_bucket{stage="complete",le="+Inf"} 4' in text
+    assert 'app_stage_duration_seconds_sum{stage="complete"} 3.65' in text
+    assert latency.count(stage="complete") == 4
+
+
+def test_concurrent_updates_are_not_lost():
+    """Test that counters and histograms stay exact under concurrent updates."""
+    registry = MetricsRegistry()
+    counter = registry.counter("app_requests_total", "Requests")
+    histogram = registry.histogram("app_request_duration_seconds", "Latency")
+
+    def work():
+        for _ in range(2000):
+            counter.inc()
+            histogram.observe(0.2)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert counter.value() == 16000
+    assert histogram.count() == 16000
+
+
+def test_trace_metrics_record_requests_stages_and_errors():
+    """Test that finished traces feed request, stage, error, cache and history metrics."""
+    registry = MetricsRegistry()
+    active = Tracer(enabled=True)
+    active.add_listener(TraceMetrics(registry))
+
+    with active.trace("chat_request", section="investment", stored_messages=12):
+        with active.span("query_cortex_search_service", cache="hit"):
+            pass
+        with active.span("complete") as span:
+            span.set_attribute("error", "timeout")
+
+    assert registry.get("app_requests_total").value(section="investment") == 1
+    assert registry.get("app_stage_duration_seconds").count(stage="complete") == 1
+    assert registry.get("app_stage_errors_total").value(stage="complete") == 1
+    assert registry.get("app_retrieval_cache_lookups_total").value(outcome="hit") == 1
+    assert registry.get("app_session_messages").count() == 1
+
+
+def test_http_endpoint_serves_metrics():
+    """Test the Prometheus endpoint on an ephemeral port."""
+    registry = MetricsRegistry()
+    registry.counter("app_requests_total", "Requests").inc()
+    server = start_http_server(registry, port=0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            body = response.read().decode()
+            assert response.headers["Content-Type"].startswith("text/plain; version=0.0.4")
+        assert "app_requests_total 1" in body
+    finally:
+        server.shutdown()
+        server.server_close()
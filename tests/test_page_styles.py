@@ -0,0 +1,35 @@
+"""Test cases for merged page stylesheets."""
+from util.page_styles import BASE_CSS, PAGE_STYLES, merge_css, minify_css, page_stylesheet
+
+
+def test_minify_css_strips_comments_and_whitespace():
+    """Test that minification keeps the rules and drops everything else."""
+    css = """
+        /* Hide branding */
+        footer {visibility: hidden;}
+        .stButton > button {
+            width: 100%;
+            margin-top: 1rem;
+        }
+    """
+    assert minify_css(css) == "footer{visibility:hidden}.stButton>button{width:100%;margin-top:1rem}"
+
+
+def test_merge_css_keeps_last_copy_of_duplicate_rules():
+    """Test that duplicated rules are emitted once, at their last position."""
+    merged = merge_css("a{color:red}", "b{color:blue}", "a{color:red}")
+    assert merged == "b{color:blue}a{color:red}"
+
+    # Nested at-rules are passed through untouched
+    media = "@media (max-width: 600px){a{color:red}}"
+    assert merge_css(media, media) == minify_css(media) * 2
+
+
+def test_page_stylesheet_is_one_deduplicated_element():
+    """Test that each page gets a single style element without repeated rules."""
+    landing = page_stylesheet("landing")
+    assert landing.startswith("<style>") and landing.count("<style>") == 1
+    assert landing.count("#MainMenu{visibility:hidden}") == 1
+    assert len(landing) < sum(len(block) for block in PAGE_STYLES["landing"])
+    assert page_stylesheet("login") == f"<style>{merge_css(BASE_CSS)}</style>"
+    assert page_stylesheet("landing") is landing
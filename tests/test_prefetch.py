@@ -0,0 +1,122 @@
+"""Test cases for the retrieval cache and follow-up prefetcher."""
+import json
+import threading
+import time
+
+from util.prefetch import FollowUpPredictor, RetrievalPrefetcher
+from util.retrieval_cache import RetrievalCache, make_key, normalize_query
+
+
+def test_normalize_query():
+    """Test that case, punctuation and spacing are ignored but every word and its position count."""
+    assert normalize_query("  What are INDEX funds? ") == "what are index funds"
+    assert normalize_query('Is a 401(k) "safe"?') == "is a 401(k) safe"
+    assert normalize_query("Should I buy bonds?") != normalize_query("Should I not buy bonds?")
+    assert normalize_query("Stocks vs bonds") != normalize_query("Bonds vs stocks")
+
+
+def test_make_key_distinguishes_request_settings():
+    """Test that filters, columns and limits are part of the cache key."""
+    base = make_key("EDU_SERVICE", "index funds", ["CHUNK"], {}, 5)
+    assert base == make_key("EDU_SERVICE", "Index funds?", ["CHUNK"], None, 5)
+    assert base != make_key("FIN_SERVICE", "index funds", ["CHUNK"], {}, 5)
+    assert base != make_key("EDU_SERVICE", "index funds", ["CHUNK"], {"@eq": {"audience": "Moderate"}}, 5)
+    assert base != make_key("EDU_SERVICE", "index funds", ["CHUNK"], {}, 3)
+
+
+def test_retrieval_cache_lru_and_ttl():
+    """Test LRU eviction, expiry and hit accounting."""
+    cache = RetrievalCache(max_entries=2, ttl_seconds=0)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)  # evicts "b", the least recently used
+    assert cache.get("b") is None
+    assert "a" in cache and "c" in cache
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+    expiring = RetrievalCache(ttl_seconds=0.01)
+    expiring.put("a", 1)
+    time.sleep(0.02)
+    assert expiring.get("a") is None
+    assert expiring.get_or_load("a", lambda: 2) == 2
+    assert expiring.get("a") == 2
+
+
+def test_predictor_uses_answer_terms_and_transitions(tmp_path):
+    """Test follow-up prediction from logged transitions and answer key terms."""
+    log = tmp_path / "questions.jsonl"
+    entries = [
+        {"session_id": "s1", "question": "What is an index fund?"},
+        {"session_id": "s2", "question": "What is an index fund?"},
+        {"session_id": "s1", "question": "Are index funds safe?"},
+        {"session_id": "s2", "question": "Are index funds safe?"},
+    ]
+    log.write_text("\n".join(json.dumps(entry) for entry in entries))
+
+    predictor = FollowUpPredictor()
+    assert predictor.load_log(str(log)) == 2
+
+    predictions = predictor.predict(
+        "What is an index fund?",
+        "An index fund tracks a market index. Expense ratios are low and diversification is broad.",
+        limit=3,
+    )
+    # Logged follow-ups first, then answer terms the question did not mention
+    assert predictions == ["Are index funds safe?", "tracks", "market"]
+
+
+def test_predictor_memory_is_bounded():
+    """Test that new follow-ups replace the rarest and the least recently used questions are forgotten."""
+    predictor = FollowUpPredictor(max_next_questions=2, max_questions=2)
+    predictor.record("budget", "Common follow-up?")
+    predictor.record("budget", "Common follow-up?")
+    predictor.record("budget", "Rare follow-up?")
+    predictor.record("budget", "New follow-up?")
+    assert predictor.popular_next("budget", 5) == ["Common follow-up?", "New follow-up?"]
+
+    predictor.record("taxes", "What is a deduction?")
+    predictor.popular_next("budget", 1)
+    predictor.record("savings", "What is an emergency fund?")
+    assert predictor.popular_next("taxes", 1) == []
+    assert predictor.popular_next("budget", 1) == ["Common follow-up?"]
+    assert predictor.popular_next("savings", 1) == ["What is an emergency fund?"]
+
+
+def test_prefetcher_warms_cache_within_budget():
+    """Test that prefetches fill the cache, skip cached queries and respect the budget."""
+    cache = RetrievalCache()
+    cache.put("cached", ("context", ["row"]))
+    prefetcher = RetrievalPrefetcher(cache, max_workers=2)
+    fetched = []
+    lock = threading.Lock()
+
+    def fetch(query):
+        with lock:
+            fetched.append(query)
+        return ("context for " + query, [query])
+
+    started = prefetcher.schedule(["cached", "bonds", "stocks", "etfs"], key=lambda q: q, fetch=fetch, budget=2)
+    prefetcher.shutdown(wait=True)
+
+    assert started == 2
+    assert sorted(fetched) == ["bonds", "stocks"]
+    assert cache.get("bonds") == ("context for bonds", ["bonds"])
+    assert cache.get("etfs") is None
+    assert prefetcher.stats["skipped"] == 1
+    assert prefetcher.stats["completed"] == 2
+
+
+def test_prefetcher_survives_failed_fetch():
+    """Test that a failing prefetch is counted and not cached."""
+    cache = RetrievalCache()
+    prefetcher = RetrievalPrefetcher(cache, max_workers=1)
+
+    def fetch(query):
+        raise RuntimeError("search unavailable")
+
+    assert prefetcher.schedule(["bonds"], key=lambda q: q, fetch=fetch, budget=5) == 1
+    prefetcher.shutdown(wait=True)
+    assert "bonds" not in cache
+    assert prefetcher.stats["failed"] == 1
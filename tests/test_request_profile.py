@@ -0,0 +1,57 @@
+"""Test cases for request profiles built from traces."""
+from util.request_profile import format_waterfall, profile_trace, stage_rows
+from util.tracing import Tracer
+
+
+def traced_request():
+    """Record one chat request with a cached search and a completion."""
+    active = Tracer(enabled=True)
+    with active.trace("chat_request", section="fin_lit", model="mistral-large2", question_tokens=5):
+        with active.span("create_prompt") as prompt_span:
+            with active.span("query_cortex_search_service", cache="hit", chunks=3, context_tokens=300):
+                pass
+            prompt_span.set_attributes(
+                plan="search", prefetched=False, history_tokens=40, chunks=3, context_tokens=300, prompt_tokens=400
+            )
+        with active.span("complete", model="mistral-large2", prompt_tokens=400, completion_tokens=120):
+            pass
+    return active.recent(1)[0]
+
+
+def test_stage_rows_are_nested_and_relative():
+    """Test that rows follow start order with depth and offsets from the request start."""
+    rows = stage_rows(traced_request())
+    assert [(row["name"], row["depth"]) for row in rows] == [
+        ("chat_request", 0),
+        ("create_prompt", 1),
+        ("query_cortex_search_service", 2),
+        ("complete", 1),
+    ]
+    assert rows[0]["start_ms"] == 0
+    assert rows[-1]["start_ms"] >= rows[1]["start_ms"]
+
+
+def test_format_waterfall_has_one_line_per_stage():
+    """Test the text waterfall layout."""
+    lines = format_waterfall(traced_request(), width=10).splitlines()
+    assert len(lines) == 4
+    assert lines[2].startswith("    query_cortex_search_service |")
+    assert all(len(line.split("|")[1]) == 10 for line in lines)
+
+
+def test_profile_trace_breaks_down_tokens_and_cache():
+    """Test the token, retrieval and cache summary."""
+    profile = profile_trace(traced_request())
+    assert profile["section"] == "fin_lit"
+    assert profile["model"] == "mistral-large2"
+    assert profile["tokens"] == {
+        "question": 5,
+        "history": 40,
+        "context": 300,
+        "instructions": 55,
+        "prompt": 400,
+        "completion": 120,
+    }
+    assert profile["retrieval"] == {"plan": "search", "searches": 1, "chunks": 3, "context_tokens": 300}
+    assert profile["cache"] == {"prefetched": False, "hits": 1, "misses": 0}
+    assert profile["errors"] == {}
@@ -0,0 +1,65 @@
+"""Test cases for Cortex Search filter helpers and the local search stand-in."""
+import pytest
+
+from util.local_search import LocalCortexSearchService
+from util.search_filters import build_search_filter, matches_filter
+
+ROWS = [
+    {"CHUNK": "Index funds spread risk across the market", "section": "investment", "audience": "Conservative"},
+    {"CHUNK": "Growth stocks carry more risk and more reward", "section": "investment", "audience": "Moderately Aggressive"},
+    {"CHUNK": "Compound interest grows savings over time", "section": "financial_literacy", "audience": "Conservative"},
+    {"CHUNK": "Budgeting helps you manage risk of debt", "section": "financial_literacy", "audience": "Moderate"},
+]
+
+
+def test_build_search_filter():
+    """Test filter construction from attribute values."""
+    assert build_search_filter({}) == {}
+    assert build_search_filter({"audience": None, "topic": []}) == {}
+    assert build_search_filter(section="investment") == {"@eq": {"section": "investment"}}
+    assert build_search_filter({"topic": ["Retirement", "Education"]}) == {
+        "@or": [{"@eq": {"topic": "Retirement"}}, {"@eq": {"topic": "Education"}}]
+    }
+    assert build_search_filter({"section": "investment", "audience": "Conservative"}) == {
+        "@and": [{"@eq": {"section": "investment"}}, {"@eq": {"audience": "Conservative"}}]
+    }
+
+
+def test_matches_filter():
+    """Test local evaluation of filter operators."""
+    row = {"section": "investment", "year": 2024, "tags": ["etf", "bonds"]}
+    assert matches_filter(row, {})
+    assert matches_filter(row, {"@eq": {"section": "investment"}})
+    assert not matches_filter(row, {"@eq": {"section": "financial_literacy"}})
+    assert matches_filter(row, {"@contains": {"tags": "etf"}})
+    assert matches_filter(row, {"@and": [{"@gte": {"year": 2020}}, {"@lte": {"year": 2024}}]})
+    assert matches_filter(row, {"@or": [{"@eq": {"section": "x"}}, {"@eq": {"year": 2024}}]})
+    assert matches_filter(row, {"@not": {"@eq": {"section": "x"}}})
+    assert not matches_filter({}, {"@gte": {"year": 2020}})
+
+    with pytest.raises(ValueError):
+        matches_filter(row, {"@like": {"section": "inv%"}})
+
+
+@pytest.mark.parametrize("attributes", [(), ("section", "audience")])
+def test_local_search_honours_filter(attributes):
+    """Test that the local stand-in filters before ranking, with and without an attribute index."""
+    service = LocalCortexSearchService(ROWS, attributes=attributes)
+
+    unfiltered = service.search("risk", columns=["CHUNK"], limit=10)
+    assert len(unfiltered.results) == 3
+
+    search_filter = build_search_filter(section="investment", audience="Conservative")
+    filtered = service.search("risk", columns=["CHUNK", "section"], filter=search_filter, limit=10)
+    assert filtered.results == [{"CHUNK": ROWS[0]["CHUNK"], "section": "investment"}]
+
+    either = {"@or": [{"@eq": {"audience": "Moderate"}}, {"@eq": {"audience": "Moderately Aggressive"}}]}
+    assert len(service.search("risk", columns=["CHUNK"], filter=either, limit=10).results) == 2
+    assert service.calls == 3
+
+
+def test_local_search_ranks_and_limits():
+    """Test that results are ranked by term matches and capped at the limit."""
+    service = LocalCortexSearchService(ROWS)
+    response = service.search("more risk", columns=["CHUNK"], limit=1)
+    assert response.results == [{"CHUNK": ROWS[1]["CHUNK"]}]
@@ -0,0 +1,255 @@
+"""Test cases for the process-wide Snowpark session pool."""
+import threading
+import time
+from unittest.mock import MagicMock
+
+import pytest
+
+from util.session_pool import ManagedSession, PoolExhaustedError, SessionPool, is_session_error
+
+
+class FakeSession:
+    """Minimal stand-in for a Snowpark session."""
+
+    def __init__(self):
+        self.closed = False
+        self.healthy = True
+
+    def close(self):
+        self.closed = True
+
+
+def make_pool(**kwargs):
+    """Return a pool of fake sessions and the list of sessions it created."""
+    created = []
+
+    def factory():
+        session = FakeSession()
+        created.append(session)
+        return session
+
+    def health_check(session):
+        if not session.healthy:
+            raise ConnectionError("session expired")
+
+    kwargs.setdefault("health_check", health_check)
+    return SessionPool(factory, **kwargs), created
+
+
+def test_invalid_bounds():
+    """Test that inconsistent size bounds are rejected."""
+    with pytest.raises(ValueError):
+        SessionPool(MagicMock(), min_size=3, max_size=2)
+
+
+def test_sessions_are_created_lazily_and_reused():
+    """Test that checkouts reuse returned sessions instead of opening new ones."""
+    pool, created = make_pool(min_size=1, max_size=2)
+    assert pool.stats()["size"] == 0
+
+    with pool.session() as first:
+        assert pool.stats()["in_use"] == 1
+    with pool.session() as second:
+        assert second is first
+
+    stats = pool.stats()
+    assert len(created) == 1
+    assert stats["checkouts"] == 2
+    assert stats["idle"] == 1
+    assert stats["utilization"] == 0
+
+
+def test_checkout_blocks_at_max_size():
+    """Test that a full pool makes callers wait and eventually time out."""
+    pool, _ = make_pool(max_size=1, checkout_timeout=0.05)
+    session = pool.checkout()
+    with pytest.raises(PoolExhaustedError):
+        pool.checkout()
+
+    threading.Timer(0.02, pool.release, args=(session,)).start()
+    assert pool.checkout(timeout=1) is session
+    assert pool.stats()["waits"] >= 1
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_many_concurrent_users_share_few_sessions():
+    """Test that hundreds of concurrent callers are served by a handful of sessions."""
+    pool, created = make_pool(max_size=4)
+    errors = []
+
+    def user():
+        try:
+            with pool.session():
+                time.sleep(0.001)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=user) for _ in range(200)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert len(created) <= 4
+    assert pool.stats()["checkouts"] == 200
+    assert pool.stats()["in_use"] == 0
+
+
+def test_unhealthy_idle_session_is_replaced():
+    """Test that sessions failing their health check are closed and replaced."""
+    pool, created = make_pool(validate_after=0)
+    with pool.session() as session:
+        pass
+    session.healthy = False
+
+    with pool.session() as replacement:
+        assert replacement is not session
+    assert session.closed
+    assert pool.stats()["health_failures"] == 1
+    assert len(created) == 2
+
+
+def test_session_being_validated_counts_toward_max_size():
+    """Test that a checkout cannot open a session while another is health checking the only idle one."""
+    checking, finish = threading.Event(), threading.Event()
+
+    def slow_health_check(session):
+        checking.set()
+        finish.wait(5)
+
+    pool, created = make_pool(max_size=1, validate_after=0, health_check=slow_health_check)
+    pool.release(pool.checkout())
+    validated = []
+    validating = threading.Thread(target=lambda: validated.append(pool.checkout()))
+    validating.start()
+    assert checking.wait(5)
+
+    assert pool.stats()["size"] == 1
+    with pytest.raises(PoolExhaustedError):
+        pool.checkout(timeout=0.05)
+    finish.set()
+    validating.join()
+
+    assert validated == created
+    assert pool.stats()["size"] == 1
+
+
+def test_discarded_session_is_closed():
+    """Test that a session released with discard is not reused."""
+    pool, _ = make_pool()
+    session = pool.checkout()
+    pool.release(session, discard=True)
+    assert session.closed
+    assert pool.stats()["size"] == 0
+
+
+def test_prewarm_and_reap_idle():
+    """Test that prewarm opens idle sessions and the reaper trims them to min_size."""
+    pool, created = make_pool(min_size=1, max_size=4, idle_timeout=0)
+    assert pool.prewarm(3) == 3
+    assert pool.stats()["idle"] == 3
+
+    time.sleep(0.01)
+    assert pool.reap_idle() == 2
+    assert pool.stats()["size"] == 1
+    assert sum(session.closed for session in created) == 2
+
+    pool.close()
+    assert all(session.closed for session in created)
+    with pytest.raises(RuntimeError):
+        pool.checkout()
+
+
+def test_prewarm_async_runs_in_background():
+    """Test that a background warm-up opens min_size sessions and is not started twice."""
+    release = threading.Event()
+    pool = SessionPool(lambda: release.wait() or FakeSession(), min_size=2, max_size=4)
+
+    thread = pool.prewarm_async()
+    assert thread is not None
+    assert pool.prewarm_async() is None
+    release.set()
+    thread.join(timeout=1)
+    assert pool.stats()["idle"] == 2
+
+
+class SnowflakeError(Exception):
+    """Stand-in for a Snowflake connector error carrying an error number."""
+
+    def __init__(self, msg, errno):
+        super().__init__(msg)
+        self.errno = errno
+
+
+def test_is_session_error():
+    """Test that expiry and connection failures are told apart from query errors."""
+    assert is_session_error(ConnectionError("reset by peer"))
+    assert is_session_error(SnowflakeError("Authentication token has expired.", 390114))
+    assert is_session_error(RuntimeError("Session no longer exists. New login required"))
+    assert not is_session_error(SnowflakeError("SQL compilation error", 1003))
+    assert not is_session_error(ValueError("bad prompt"))
+
+
+def test_run_retries_once_on_a_new_session():
+    """Test that a session error discards the session and retries the call on a fresh one."""
+    pool, created = make_pool()
+    calls = []
+
+    def call(session):
+        calls.append(session)
+        if len(calls) == 1:
+            raise SnowflakeError("Authentication token has expired.", 390114)
+        return "ok"
+
+    assert pool.run(call) == "ok"
+    assert calls == created
+    assert created[0].closed and not created[1].closed
+    assert pool.stats()["reconnects"] == 1
+
+    with pytest.raises(ValueError):
+        pool.run(lambda session: (_ for _ in ()).throw(ValueError("bad query")))
+    assert pool.stats()["closed"] == 1
+
+
+def test_keepalive_pings_idle_sessions():
+    """Test that keepalive validates idle sessions and closes the ones that fail."""
+    pool, created = make_pool(min_size=0, max_size=4, keepalive_interval=0.001)
+    pool.prewarm(2)
+    created[0].healthy = False
+    time.sleep(0.01)
+
+    assert pool.keepalive() == 1
+    stats = pool.stats()
+    assert stats["keepalives"] == 2
+    assert stats["idle"] == 1
+    assert created[0].closed and not created[1].closed
+
+
+def test_managed_session_validates_and_reconnects():
+    """Test that a managed session replaces itself after failing validation or a call."""
+    created = []
+
+    def factory():
+        created.append(FakeSession())
+        return created[-1]
+
+    def health_check(session):
+        if not session.healthy:
+            raise ConnectionError("session expired")
+
+    managed = ManagedSession(factory, validate_after=0, health_check=health_check)
+    first = managed.session
+    first.healthy = False
+    assert managed.session is created[1]
+    assert first.closed
+
+    def call(session):
+        if session is created[1]:
+            raise ConnectionError("connection reset")
+        return session
+
+    assert managed.run(call) is created[2]
+    assert managed.reconnects == 2
+    managed.close()
+    assert created[2].closed
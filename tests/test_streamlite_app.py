@@ -7,6 +7,13 @@ import streamlit as st
 import xmlrunner
 from jinja2 import Environment, FileSystemLoader
 
+from util.admission import OverloadedError
+from util.generation import GenerationJob
+from util.idle_sessions import IdleSessionManager
+from util.tracing import Tracer, tracer
+from util.transcript import ChatTranscript
+from util.warmup import run_warmup
+
 # Mock the snowflake module and its submodules
 mock_snowflake = MagicMock()
 mock_root = MagicMock()
@@ -32,17 +39,37 @@ sys.modules["snowflake.snowpark"] = mock_snowflake.snowpark
 sys.modules["snowflake.snowpark.context"] = mock_snowflake.snowpark.context
 
 from streamlite_app import (
+    COMPLETION_ERROR,
+    HIGH_DEMAND_MESSAGE,
+    answer_key,
+    await_answer,
+    build_warmup_steps,
+    cached_complete,
     complete,
     create_prompt,
+    debug_panel_enabled,
+    display_chat_interface,
+    get_cached_search,
     get_chat_history,
+    get_retrieval_cache,
+    get_rewrite_cache,
+    get_search_filter,
     init_config_options,
     init_messages,
     init_service_metadata,
-    initialize_session,
     main,
     main_page,
     make_chat_history_summary,
     query_cortex_search_service,
+    release_idle_session,
+    remember_debug_trace,
+    render_chat_window,
+    save_message,
+    search_cortex,
+    service_filter_attributes,
+    session_is_active,
+    submit_answer,
+    track_session_activity,
 )
 
 
@@ -62,7 +89,6 @@ class TestStreamliteApp(unittest.TestCase):
         st.session_state.clear()
         st.session_state.update(
             {
-                "session": cls.session,
                 "messages": [],
                 "fin_lit_messages": [],
                 "investment_messages": [],
@@ -86,10 +112,6 @@ class TestStreamliteApp(unittest.TestCase):
                         "search_column": "CHUNK",
                     },
                 ],
-                "cortex_search_services": {
-                    "EDU_SERVICE": MagicMock(),
-                    "FIN_SERVICE": MagicMock(),
-                },
                 "num_retrieved_chunks": 3,
                 "debug": False,
             }
@@ -97,11 +119,20 @@ class TestStreamliteApp(unittest.TestCase):
 
     def setUp(self):
         """Set up test environment before each test"""
+        # Start each test with an empty process-wide retrieval cache
+        get_retrieval_cache().clear()
+        get_rewrite_cache().clear()
+
+        # Snowflake calls run on the mock session instead of a pooled one
+        patcher = patch("streamlite_app.get_session_pool")
+        self.mock_get_pool = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.mock_get_pool.return_value.run.side_effect = lambda call: call(self.session)
+
         # Reset session state before each test
         st.session_state.clear()
         st.session_state.update(
             {
-                "session": self.session,
                 "messages": [],
                 "fin_lit_messages": [],
                 "investment_messages": [],
@@ -125,19 +156,19 @@ class TestStreamliteApp(unittest.TestCase):
                         "search_column": "CHUNK",
                     },
                 ],
-                "cortex_search_services": {
-                    "EDU_SERVICE": MagicMock(),
-                    "FIN_SERVICE": MagicMock(),
-                },
                 "num_retrieved_chunks": 3,
                 "debug": False,
             }
         )
 
-    def test_initialize_session(self):
-        """Test session initialization"""
-        session = initialize_session()
-        self.assertEqual(session, mock_session)
+    def use_search_service(self, service):
+        """Route searches to ``service`` instead of resolving it on a pooled session"""
+        patcher = patch(
+            "streamlite_app.get_search_runner",
+            return_value=lambda query, columns, filter, limit: search_cortex(service, query, columns, filter, limit),
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
 
     def test_init_service_metadata(self):
         """Test service metadata initialization"""
@@ -174,9 +205,8 @@ class TestStreamliteApp(unittest.TestCase):
         mock_cortex_service.search.return_value = mock_search_response
 
         # Update session state
-        st.session_state.cortex_search_services = {"EDU_SERVICE": mock_cortex_service}
+        self.use_search_service(mock_cortex_service)
         st.session_state.selected_cortex_search_service = "EDU_SERVICE"
-        st.session_state.cortex_search_service = mock_cortex_service
 
         # Test the function
         context_str, results = query_cortex_search_service("test query")
@@ -188,6 +218,71 @@ class TestStreamliteApp(unittest.TestCase):
         # Verify search was called correctly
         mock_cortex_service.search.assert_called_once_with("test query", columns=["CHUNK"], limit=3)
 
+    def test_query_cortex_search_service_with_filter(self):
+        """Test that filters and columns are passed through to the search service"""
+        mock_search_response = MagicMock()
+        mock_search_response.results = [{"CHUNK": "test chunk", "SOURCE": "guide"}]
+        mock_cortex_service = MagicMock()
+        mock_cortex_service.search.return_value = mock_search_response
+
+        self.use_search_service(mock_cortex_service)
+
+        search_filter = {"@eq": {"audience": "Conservative"}}
+        context_str, results = query_cortex_search_service("test query", columns=["CHUNK", "SOURCE"], filter=search_filter)
+
+        self.assertEqual(context_str, "test chunk")
+        mock_cortex_service.search.assert_called_once_with(
+            "test query", columns=["CHUNK", "SOURCE"], limit=3, filter=search_filter
+        )
+
+    def test_query_cortex_search_service_uses_cache(self):
+        """Test that repeated queries are served from the retrieval cache"""
+        mock_search_response = MagicMock()
+        mock_search_response.results = [{"CHUNK": "cached chunk"}]
+        mock_cortex_service = MagicMock()
+        mock_cortex_service.search.return_value = mock_search_response
+
+        self.use_search_service(mock_cortex_service)
+
+        first = query_cortex_search_service("What are index funds?")
+        second = query_cortex_search_service("what are  index funds")
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_cortex_service.search.call_count, 1)
+        self.assertIsNotNone(get_cached_search("What are Index funds"))
+
+        # A different question about the same terms is searched again
+        query_cortex_search_service("What are not index funds?")
+        self.assertEqual(mock_cortex_service.search.call_count, 2)
+
+    def test_get_search_filter(self):
+        """Test that only attributes declared by the service are pushed down"""
+        st.session_state.risk_profile = "Conservative"
+        st.session_state.financial_goals = ["Retirement"]
+
+        # Services without filter attributes are queried unfiltered
+        self.assertEqual(get_search_filter(), {})
+
+        st.session_state.service_metadata[0]["filter_attributes"] = ["audience", "topic"]
+        self.assertEqual(
+            get_search_filter(),
+            {"@and": [{"@eq": {"audience": "Conservative"}}, {"@eq": {"topic": "Retirement"}}]},
+        )
+
+    def test_service_filter_attributes(self):
+        """Test that filter attributes come from secrets and unmapped attributes are dropped"""
+        settings = {"FIN_SERVICE": ["section", "audience", "source"]}
+        with patch("streamlite_app.get_setting", side_effect=lambda section, key, default=None: settings.get(key, default)):
+            self.assertEqual(service_filter_attributes("FIN_SERVICE"), ["section", "audience"])
+            self.assertEqual(service_filter_attributes("EDU_SERVICE"), [])
+
+            del st.session_state["service_metadata"]
+            init_service_metadata()
+
+        self.assertEqual(
+            [service["filter_attributes"] for service in st.session_state.service_metadata], [[], ["section", "audience"]]
+        )
+
     def test_get_chat_history(self):
         """Test retrieving chat history"""
         # Initialize feature-specific chat history
@@ -232,6 +327,215 @@ class TestStreamliteApp(unittest.TestCase):
         history = get_chat_history()
         self.assertEqual(history, [])
 
+    def test_get_chat_history_drops_citations(self):
+        """Test that citations stay out of the history used for prompts"""
+        st.session_state.current_section = "financial_literacy"
+        st.session_state.fin_lit_messages = [{"role": "assistant", "content": "Hi", "citations": ["chunk"]}]
+        self.assertEqual(get_chat_history(), [{"role": "assistant", "content": "Hi"}])
+
+    @patch("streamlite_app.st.rerun")
+    @patch("streamlite_app.st.expander")
+    @patch("streamlite_app.st.button", return_value=False)
+    @patch("streamlite_app.st.markdown")
+    @patch("streamlite_app.st.chat_message")
+    def test_render_chat_window(self, mock_chat_message, mock_markdown, mock_button, mock_expander, mock_rerun):
+        """Test that only the recent turns render and older ones wait behind a load control"""
+        messages = []
+        for turn in range(15):
+            messages.append({"role": "user", "content": f"question {turn}"})
+            messages.append({"role": "assistant", "content": f"answer {turn}", "citations": [f"chunk {turn}"]})
+
+        render_chat_window("fin_lit", messages)
+
+        # Ten turns by default: twenty messages, ten of them with collapsed citations
+        self.assertEqual(mock_chat_message.call_count, 20)
+        self.assertEqual(mock_expander.call_count, 10)
+        mock_expander.assert_called_with("References (1)", expanded=False)
+        mock_button.assert_called_once_with("Load earlier messages (10 hidden)", key="fin_lit_load_earlier")
+        mock_rerun.assert_not_called()
+
+        # Loading earlier messages widens the window
+        mock_button.return_value = True
+        render_chat_window("fin_lit", messages)
+        self.assertEqual(st.session_state.fin_lit_window_turns, 20)
+        mock_rerun.assert_called_once()
+
+    def test_debug_panel_keeps_recent_session_traces(self):
+        """Test that the debug panel is opt-in and keeps only the last requests of the session"""
+
+        def enabled(query_params, **settings):
+            with patch("streamlite_app.st.query_params", query_params), patch(
+                "streamlite_app.get_setting", side_effect=lambda section, key, default=None: settings.get(key, default)
+            ):
+                return debug_panel_enabled()
+
+        self.assertFalse(enabled({}))
+        # Anyone can add ?debug=1, so it only works where explicitly allowed
+        self.assertFalse(enabled({"debug": "1"}))
+        self.assertTrue(enabled({"debug": "1"}, allow_query_param=True))
+        self.assertFalse(enabled({"debug": "1"}, token="s3cret"))
+        self.assertFalse(enabled({"debug": "guess"}, token="s3cret"))
+        self.assertTrue(enabled({"debug": "s3cret"}, token="s3cret"))
+
+        st.session_state.pop("debug_traces", None)
+        active = Tracer(enabled=True)
+        for _ in range(12):
+            with active.trace("chat_request") as request_span:
+                pass
+            remember_debug_trace(request_span)
+        remember_debug_trace(tracer.trace("chat_request"))  # untraced request
+
+        self.assertEqual(len(st.session_state.debug_traces), 10)
+        self.assertIs(st.session_state.debug_traces[-1], active.recent(1)[0])
+
+    def test_answer_key_distinguishes_reworded_questions(self):
+        """Test that only the same question text shares an answer"""
+        self.assertEqual(answer_key("fin_lit", "Should I buy bonds?"), answer_key("fin_lit", " Should I buy bonds?\n"))
+        self.assertNotEqual(answer_key("fin_lit", "Should I buy bonds?"), answer_key("fin_lit", "Should I not buy bonds?"))
+        self.assertNotEqual(answer_key("fin_lit", "Stocks vs bonds"), answer_key("fin_lit", "Bonds vs stocks"))
+        self.assertNotEqual(answer_key("fin_lit", "Stocks vs bonds"), answer_key("investment", "Stocks vs bonds"))
+
+    @patch("streamlite_app.prefetch_follow_ups")
+    @patch("streamlite_app.st.empty")
+    @patch("streamlite_app.complete")
+    @patch("streamlite_app.create_prompt")
+    def test_answer_generated_off_script_thread(self, mock_create_prompt, mock_complete, mock_empty, mock_prefetch):
+        """Test that a double submit shares one generation and the answer is collected by a later run"""
+        import threading
+
+        release = threading.Event()
+        mock_create_prompt.return_value = ("prompt", [{"CHUNK": "Index funds are diversified."}])
+        mock_complete.side_effect = lambda model, prompt: release.wait(5) and "Index funds track an index."
+
+        messages = ChatTranscript()
+        save_message("fin_lit", messages, {"role": "user", "content": "What is an index fund?"})
+        job = submit_answer("fin_lit", "What is an index fund?", messages)
+        self.assertIs(submit_answer("fin_lit", "What is an index fund? ", messages), job)
+        release.set()
+
+        # A rerun finds the pending job in the session and collects it
+        st.session_state.fin_lit_pending_answer = job
+        await_answer("fin_lit", messages, job)
+
+        mock_create_prompt.assert_called_once()
+        self.assertEqual(mock_create_prompt.call_args.args[0], "What is an index fund?")
+        self.assertNotIn("fin_lit_pending_answer", st.session_state)
+        self.assertEqual(messages[-1]["content"], "Index funds track an index.")
+        self.assertEqual(list(messages[-1]["citations"]), ["Index funds are diversified."])
+        mock_empty.return_value.markdown.assert_called_with("Index funds track an index.")
+        mock_prefetch.assert_called_once_with("What is an index fund?", "Index funds track an index.")
+
+    @patch("streamlite_app.cached_complete", return_value="Answer.")
+    @patch("streamlite_app.make_chat_history_summary", return_value="index funds")
+    @patch("streamlite_app.query_cortex_search_service", return_value=("Index funds", [{"CHUNK": "Index funds"}]))
+    def test_answer_uses_section_it_was_asked_in(self, mock_query_cortex, mock_summary, mock_cached_complete):
+        """Test that switching section while an answer is queued does not change its prompt, service or history"""
+        import threading
+
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+        release, worker_ctx = threading.Event(), []
+
+        def blocked_prompt(question, request):
+            worker_ctx.append(get_script_run_ctx())
+            release.wait(5)
+            return create_prompt(question, request)
+
+        st.session_state.fin_lit_messages = ChatTranscript.from_dicts(
+            [{"role": "user", "content": "What is a budget?"}, {"role": "assistant", "content": "A spending plan."}]
+        )
+        save_message("fin_lit", st.session_state.fin_lit_messages, {"role": "user", "content": "What is an index fund?"})
+        with patch("streamlite_app.create_prompt", side_effect=blocked_prompt) as mock_create_prompt:
+            job = submit_answer("fin_lit", "What is an index fund?", st.session_state.fin_lit_messages)
+
+            # The user moves to the investment section while the answer is queued
+            st.session_state.current_section = "investment"
+            st.session_state.selected_cortex_search_service = "FIN_SERVICE"
+            st.session_state.investment_messages = ChatTranscript.from_dicts([{"role": "user", "content": "Stocks?"}])
+            st.session_state.num_retrieved_chunks = 7
+            release.set()
+            job.result(timeout=5)
+
+        request = mock_create_prompt.call_args.args[1]
+        self.assertEqual(request["section"], "financial_literacy")
+        self.assertEqual(worker_ctx, [None])
+        self.assertEqual([m["content"] for m in mock_summary.call_args.args[0]], ["A spending plan.", "What is an index fund?"])
+        mock_query_cortex.assert_called_with("index funds", columns=["CHUNK"], filter={}, limit=3, service_name="EDU_SERVICE")
+        self.assertIn("You are a financial education expert", mock_cached_complete.call_args.args[1])
+
+    @patch("streamlite_app.render_chat_window")
+    @patch("streamlite_app.st.markdown")
+    @patch("streamlite_app.st.chat_message")
+    @patch("streamlite_app.st.chat_input", return_value="What is an index fund?")
+    @patch("streamlite_app.get_generation_pool")
+    def test_question_shed_under_load(self, mock_get_pool, mock_chat_input, mock_chat_message, mock_markdown, mock_render):
+        """Test that a full generation queue turns the question away without adding it to the history"""
+        mock_get_pool.return_value.accepting.return_value = False
+        st.session_state.fin_lit_messages = ChatTranscript()
+
+        display_chat_interface("fin_lit", "Ask a question")
+
+        mock_markdown.assert_called_with(HIGH_DEMAND_MESSAGE)
+        mock_get_pool.return_value.submit.assert_not_called()
+        self.assertEqual(len(st.session_state.fin_lit_messages), 0)
+        self.assertNotIn("fin_lit_pending_answer", st.session_state)
+
+    @patch("streamlite_app.render_chat_window")
+    @patch("streamlite_app.st.markdown")
+    @patch("streamlite_app.st.chat_message")
+    @patch("streamlite_app.st.chat_input", return_value="What is an index fund?")
+    @patch("streamlite_app.get_conversation_store")
+    @patch("streamlite_app.submit_answer", side_effect=OverloadedError("queue full"))
+    @patch("streamlite_app.get_generation_pool")
+    def test_question_shed_at_submit_leaves_no_history(
+        self, mock_get_pool, mock_submit, mock_get_store, mock_chat_input, mock_chat_message, mock_markdown, mock_render
+    ):
+        """Test that a question the pool refuses on submit is neither kept nor stored"""
+        mock_get_pool.return_value.accepting.return_value = True
+        st.session_state.email = "user@example.com"
+        st.session_state.fin_lit_messages = ChatTranscript.from_dicts(
+            [{"role": "user", "content": "Earlier?"}, {"role": "assistant", "content": "Earlier answer."}]
+        )
+
+        display_chat_interface("fin_lit", "Ask a question")
+
+        mock_submit.assert_called_once()
+        mock_markdown.assert_called_with(HIGH_DEMAND_MESSAGE)
+        self.assertEqual([message["content"] for message in st.session_state.fin_lit_messages], ["Earlier?", "Earlier answer."])
+        mock_get_store.return_value.append.assert_not_called()
+        self.assertNotIn("fin_lit_pending_answer", st.session_state)
+
+    @patch("streamlite_app.get_conversation_store")
+    @patch("streamlite_app.st.empty")
+    def test_expired_answer_removes_question(self, mock_empty, mock_get_store):
+        """Test that a question whose answer expired in the queue is taken back out of the history"""
+        st.session_state.email = "user@example.com"
+        messages = ChatTranscript()
+        save_message("fin_lit", messages, {"role": "user", "content": "What is an index fund?"}, persist=False)
+        job = GenerationJob(("session", "fin_lit", "what is an index fund"))
+        job.future.set_exception(OverloadedError("waited 60s for a worker"))
+        st.session_state.fin_lit_pending_answer = job
+
+        await_answer("fin_lit", messages, job)
+
+        mock_empty.return_value.markdown.assert_called_with(HIGH_DEMAND_MESSAGE)
+        self.assertEqual(len(messages), 0)
+        mock_get_store.return_value.append.assert_not_called()
+        self.assertNotIn("fin_lit_pending_answer", st.session_state)
+
+        # An answered question is stored together with its answer
+        save_message("fin_lit", messages, {"role": "user", "content": "What is an index fund?"}, persist=False)
+        job = GenerationJob(("session", "fin_lit", "what is an index fund"))
+        job.future.set_result({"role": "assistant", "content": "Index funds track an index.", "citations": []})
+        st.session_state.fin_lit_pending_answer = job
+        with patch("streamlite_app.prefetch_follow_ups"):
+            await_answer("fin_lit", messages, job)
+
+        self.assertEqual(
+            [call.args[2]["role"] for call in mock_get_store.return_value.append.call_args_list], ["user", "assistant"]
+        )
+        self.assertEqual(len(messages), 2)
+
     def test_complete(self):
         """Test completion generation"""
         # Mock completion response
@@ -241,6 +545,90 @@ class TestStreamliteApp(unittest.TestCase):
         response = complete("mistral-large2", "test prompt")
         self.assertEqual(response, mock_response)
 
+    def test_complete_records_span_when_tracing(self):
+        """Test that a traced request records the completion stage with token counts"""
+        mock_complete.return_value = "Traced completion"
+        tracer.configure(enabled=True)
+        try:
+            with tracer.trace("chat_request"):
+                complete("mistral-large2", "test prompt")
+            spans = {span.name: span for span in tracer.recent(1)[0].spans}
+        finally:
+            tracer.configure(enabled=False)
+
+        self.assertEqual(spans["complete"].attributes["model"], "mistral-large2")
+        self.assertEqual(spans["complete"].attributes["completion_tokens"], 5)
+        self.assertEqual(spans["complete"].parent_id, spans["chat_request"].span_id)
+
+    @patch("streamlite_app.st.error")
+    def test_complete_failure_marks_span_error(self, mock_error):
+        """Test that a failed completion is recorded on its span so metrics count it"""
+        tracer.configure(enabled=True)
+        try:
+            with tracer.trace("chat_request"), patch.object(mock_snowflake.cortex, "Complete", side_effect=RuntimeError("boom")):
+                self.assertEqual(complete("mistral-large2", "test prompt"), "An error occurred.")
+            spans = {span.name: span for span in tracer.recent(1)[0].spans}
+        finally:
+            tracer.configure(enabled=False)
+
+        self.assertEqual(spans["complete"].attributes["error"], "boom")
+
+    @patch("streamlite_app.get_session_pool")
+    def test_complete_checks_out_pooled_session(self, mock_get_pool):
+        """Test that completions borrow a pooled session"""
+        pooled_session = MagicMock()
+        mock_get_pool.return_value.run.side_effect = lambda call: call(pooled_session)
+        mock_complete.return_value = "Pooled completion"
+
+        response = complete("mistral-large2", "test prompt")
+
+        self.assertEqual(response, "Pooled completion")
+        mock_complete.assert_called_with("mistral-large2", "test prompt", session=pooled_session)
+        mock_get_pool.return_value.run.assert_called_once()
+
+    @patch("streamlite_app.get_warmup_report")
+    @patch("streamlite_app.landing_page")
+    @patch("streamlite_app.get_session_pool")
+    def test_main_landing_page_does_not_connect(self, mock_get_pool, mock_landing_page, mock_warmup):
+        """Test that anonymous visitors get the landing page without any Snowflake work"""
+        st.session_state.clear()
+
+        main()
+
+        mock_landing_page.assert_called_once()
+        mock_get_pool.assert_not_called()
+
+    @patch("streamlite_app.get_warmup_report")
+    @patch("streamlite_app.main_page")
+    @patch("streamlite_app.get_session_pool")
+    def test_main_warms_pool_once_after_login(self, mock_get_pool, mock_main_page, mock_warmup):
+        """Test that the pool is warmed in the background on the first main page render only"""
+        st.session_state.page = "main"
+
+        main()
+        main()
+
+        mock_get_pool.return_value.prewarm_async.assert_called_once()
+        self.assertEqual(mock_main_page.call_count, 2)
+
+    @patch("streamlite_app.get_retrieval_cache")
+    @patch("streamlite_app.get_session_pool")
+    def test_warmup_steps(self, mock_get_pool, mock_get_cache):
+        """Test that warm-up prewarms the pool, probes services and seeds the cache from top questions"""
+        pool = mock_get_pool.return_value
+        pool.prewarm.return_value = 1
+        pool.run.side_effect = lambda call: ("Index funds", [{"CHUNK": "Index funds"}])
+        settings = {"top_questions": ["What is an index fund?"], "resume_warehouse": True}
+
+        with patch("streamlite_app.get_setting", side_effect=lambda section, key, default=None: settings.get(key, default)):
+            report = run_warmup(build_warmup_steps)
+
+        self.assertEqual([step.name for step in report.steps], ["prompts", "sessions", "services", "warehouse", "cache"])
+        self.assertEqual(report.summary()["failed"], [])
+        self.assertEqual(report.steps[-1].detail, "2 cache entries")
+        self.assertEqual(mock_get_cache.return_value.put.call_count, 2)
+        pool.prewarm.assert_called_once()
+
     def test_make_chat_history_summary(self):
         """Test making chat history summary"""
         test_history = "User: Hello\nAssistant: Hi"
@@ -255,6 +643,20 @@ class TestStreamliteApp(unittest.TestCase):
         self.assertIn(test_history, summary)
         self.assertIn(test_question, summary)
 
+    @patch("streamlite_app.complete")
+    def test_history_rewrites_are_cached(self, mock_complete):
+        """Test that a repeated rewrite is served from the cache and failed completions are not cached"""
+        mock_complete.return_value = "index fund fees"
+        self.assertEqual(make_chat_history_summary("[fees]", "And for index funds?"), "index fund fees")
+        self.assertEqual(make_chat_history_summary("[fees]", "And for index funds?"), "index fund fees")
+        mock_complete.assert_called_once()
+
+        mock_complete.return_value = COMPLETION_ERROR
+        cache = get_rewrite_cache()
+        self.assertEqual(cached_complete("mistral-large2", "other prompt", cache), COMPLETION_ERROR)
+        self.assertEqual(cached_complete("mistral-large2", "other prompt", cache), COMPLETION_ERROR)
+        self.assertEqual(mock_complete.call_count, 3)
+
     @patch("streamlite_app.query_cortex_search_service")
     def test_create_prompt(self, mock_query_cortex):
         """Test creating a prompt"""
@@ -271,7 +673,7 @@ class TestStreamliteApp(unittest.TestCase):
 
         # Test without chat history
         context, results = create_prompt("test question")
-        mock_query_cortex.assert_called_with("test question", columns=["CHUNK"], filter={})
+        mock_query_cortex.assert_called_with("test question", columns=["CHUNK"], filter={}, limit=3, service_name="EDU_SERVICE")
         self.assertIsInstance(context, str)
         self.assertIn("test context", context)
         self.assertEqual(results, mock_results)
@@ -287,6 +689,54 @@ class TestStreamliteApp(unittest.TestCase):
         self.assertIn("test context", context)
         self.assertEqual(results, mock_results)
 
+    @patch("streamlite_app.query_cortex_search_service")
+    def test_create_prompt_history_from_transcript_matches_list(self, mock_query_cortex):
+        """Test that a transcript's cached history gives the same prompt as a plain message list"""
+        st.session_state.use_chat_history = False
+        st.session_state.num_chat_messages = 3
+        st.session_state.current_section = "investment"
+        mock_query_cortex.return_value = ("test context", [])
+        history = [
+            {"role": "user", "content": "What is an ETF?"},
+            {"role": "assistant", "content": "An exchange-traded fund.", "citations": ["chunk"]},
+            {"role": "user", "content": "And a bond?"},
+            {"role": "assistant", "content": "A loan to an issuer."},
+        ]
+
+        st.session_state.investment_messages = history
+        st.session_state.pop("retrieval_context", None)
+        list_prompt, _ = create_prompt("What about stocks?")
+        st.session_state.investment_messages = ChatTranscript.from_dicts(history)
+        st.session_state.pop("retrieval_context", None)
+        transcript_prompt, _ = create_prompt("What about stocks?")
+
+        self.assertEqual(transcript_prompt, list_prompt)
+        self.assertIn("'content': 'And a bond?'", transcript_prompt)
+        self.assertNotIn("What is an ETF?", transcript_prompt)
+
+    @patch("streamlite_app.query_cortex_search_service")
+    def test_create_prompt_reuses_previous_turn_context(self, mock_query_cortex):
+        """Test that close follow-ups reuse or extend the previous turn's hits"""
+        st.session_state.use_chat_history = False
+        first_results = [{"CHUNK": "Index funds track the market"}]
+        mock_query_cortex.return_value = ("Index funds track the market", first_results)
+
+        create_prompt("How do index funds work?")
+        self.assertEqual(mock_query_cortex.call_count, 1)
+
+        # Same topic: the previous hits are reused without a search
+        prompt, results = create_prompt("Why do index funds work?")
+        self.assertEqual(mock_query_cortex.call_count, 1)
+        self.assertEqual(results, first_results)
+        self.assertIn("Index funds track the market", prompt)
+
+        # Continuation with a new term: only the new term is searched, with a smaller limit
+        mock_query_cortex.return_value = ("Retirement accounts", [{"CHUNK": "Retirement accounts"}])
+        prompt, results = create_prompt("And what about for retirement?")
+        mock_query_cortex.assert_called_with("retirement", columns=["CHUNK"], filter={}, limit=1, service_name="EDU_SERVICE")
+        self.assertEqual(results, [{"CHUNK": "Retirement accounts"}, {"CHUNK": "Index funds track the market"}])
+        self.assertIn("Retirement accounts", prompt)
+
     def test_init_messages(self):
         """Test initialization of feature-specific message histories"""
         # Clear session state
@@ -295,17 +745,80 @@ class TestStreamliteApp(unittest.TestCase):
         # Initialize messages
         init_messages()
 
-        # Check all message lists are initialized
-        self.assertIn("messages", st.session_state)
+        # Check all message histories are initialized and the unused shared list is gone
+        self.assertNotIn("messages", st.session_state)
         self.assertIn("fin_lit_messages", st.session_state)
         self.assertIn("investment_messages", st.session_state)
         self.assertIn("ai_agent_messages", st.session_state)
 
-        # Verify they are empty lists
-        self.assertEqual(st.session_state.messages, [])
-        self.assertEqual(st.session_state.fin_lit_messages, [])
-        self.assertEqual(st.session_state.investment_messages, [])
-        self.assertEqual(st.session_state.ai_agent_messages, [])
+        # Verify they are empty, memory-capped histories
+        for key in ("fin_lit_messages", "investment_messages", "ai_agent_messages"):
+            self.assertIsInstance(st.session_state[key], ChatTranscript)
+            self.assertEqual(list(st.session_state[key]), [])
+
+    @patch("streamlite_app.get_conversation_store")
+    def test_init_messages_rehydrates_from_store(self, mock_get_store):
+        """Test that a logged-in user's recent turns are loaded and new messages are queued"""
+        st.session_state.clear()
+        st.session_state.email = "user@example.com"
+        store = mock_get_store.return_value
+        store.recent.return_value = [{"role": "user", "content": "Earlier question"}]
+
+        init_messages()
+        save_message("fin_lit", st.session_state.fin_lit_messages, {"role": "assistant", "content": "Answer"})
+
+        store.recent.assert_any_call("user@example.com", "fin_lit", 20)
+        self.assertEqual([message["content"] for message in st.session_state.fin_lit_messages], ["Earlier question", "Answer"])
+        store.append.assert_called_once_with("user@example.com", "fin_lit", {"role": "assistant", "content": "Answer"})
+
+    def test_release_idle_session(self):
+        """Test that an idle session's metadata and old turns are freed"""
+        history = ChatTranscript.from_dicts([{"role": "user", "content": f"Question {index}?" * 20} for index in range(50)])
+        state = {"service_metadata": [{"name": "EDU_SERVICE"}], "fin_lit_messages": history, "email": "a"}
+
+        reclaimed = release_idle_session(state, history_persisted=False, keep_messages=10)
+
+        self.assertNotIn("service_metadata", state)
+        self.assertEqual(len(state["fin_lit_messages"]), 10)
+        self.assertEqual(state["fin_lit_messages"][-1]["content"], "Question 49?" * 20)
+        self.assertEqual(state["email"], "a")
+        self.assertGreater(reclaimed, 0)
+
+        # Persisted histories are dropped and reload from the store on the next visit
+        release_idle_session(state, history_persisted=True)
+        self.assertNotIn("fin_lit_messages", state)
+
+    def test_idle_session_released_on_its_next_run(self):
+        """Test that the reaper only marks an idle session and its own next run frees its state"""
+        clock = MagicMock(return_value=0.0)
+        manager = IdleSessionManager(session_is_active, idle_timeout=60, clock=clock)
+        st.session_state.service_metadata = [{"name": "EDU_SERVICE"}]
+        st.session_state.email = "a"
+        ctx = MagicMock(session_id="browser-1")
+
+        with patch("streamlite_app.get_script_run_ctx", return_value=ctx), patch(
+            "streamlite_app.get_idle_session_manager", return_value=manager
+        ), patch("streamlite_app.get_conversation_store", return_value=None), patch(
+            "streamlite_app.get_setting", side_effect=lambda section, key, default=None: default
+        ):
+            track_session_activity()
+            clock.return_value = 120.0
+            self.assertEqual(manager.reap().sessions, 1)
+            # The reaper leaves the session's state alone
+            self.assertIn("service_metadata", st.session_state)
+
+            track_session_activity()
+
+        self.assertNotIn("service_metadata", st.session_state)
+        self.assertEqual(st.session_state.email, "a")
+        self.assertGreater(manager.stats()["bytes_reclaimed"], 0)
+
+        # Once Streamlit discards the session it is forgotten
+        with patch("streamlite_app.Runtime") as runtime:
+            runtime.exists.return_value = True
+            runtime.instance.return_value.is_active_session.return_value = False
+            manager.reap()
+        self.assertEqual(manager.stats()["tracked"], 0)
 
     def test_init_config_options(self):
         """Test configuration options initialization"""
@@ -330,6 +843,16 @@ class TestStreamliteApp(unittest.TestCase):
         init_config_options()
         self.assertEqual(st.session_state.selected_cortex_search_service, "FIN_SERVICE")
 
+    def test_init_config_options_is_noop_on_rerun(self):
+        """Test that reruns in the same section leave the options untouched"""
+        st.session_state.clear()
+        st.session_state.current_section = "investment"
+        init_config_options()
+
+        st.session_state.selected_cortex_search_service = "EDU_SERVICE"
+        init_config_options()
+        self.assertEqual(st.session_state.selected_cortex_search_service, "EDU_SERVICE")
+
     def test_create_prompt_with_feature_specific_base_prompts(self):
         """Test prompt creation with feature-specific base prompts"""
         # Set up session state
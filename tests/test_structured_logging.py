@@ -0,0 +1,102 @@
+"""Test cases for queued structured logging."""
+import io
+import json
+import logging
+import queue
+import threading
+
+import pytest
+
+from util.structured_logging import (
+    JsonFormatter,
+    NonBlockingQueueHandler,
+    SamplingFilter,
+    configure_logging,
+    stop_logging,
+)
+
+
+@pytest.fixture
+def log_stream():
+    """Configure JSON logging into a string buffer and restore the root logger afterwards."""
+    root = logging.getLogger()
+    level = root.level
+    stream = io.StringIO()
+    handler = configure_logging(level=logging.DEBUG, max_field_chars=20, debug_sample_every=3, stream=stream)
+    yield stream
+    stop_logging()
+    root.removeHandler(handler)
+    root.setLevel(level)
+
+
+def test_records_are_written_as_capped_json_lines(log_stream):
+    """Test JSON output with lazily formatted, size-capped fields and extras."""
+    logger = logging.getLogger("tests.structured")
+    logger.info("Querying with query: %s", "x" * 50, extra={"section": "fin_lit", "chunks": 3})
+    stop_logging()
+
+    (entry,) = [json.loads(line) for line in log_stream.getvalue().splitlines()]
+    assert entry["level"] == "INFO"
+    assert entry["logger"] == "tests.structured"
+    assert entry["msg"] == "Querying with query:...[51 more chars]"
+    assert entry["section"] == "fin_lit"
+    assert entry["chunks"] == 3
+
+
+def test_debug_records_are_sampled(log_stream):
+    """Test that one in three DEBUG records is kept while warnings always pass."""
+    logger = logging.getLogger("tests.structured")
+    for index in range(9):
+        logger.debug("rerun %d", index)
+    logger.warning("slow request")
+    stop_logging()
+
+    messages = [json.loads(line)["msg"] for line in log_stream.getvalue().splitlines()]
+    assert messages == ["rerun 0", "rerun 3", "rerun 6", "slow request"]
+
+
+def test_formatting_happens_on_the_writer_thread():
+    """Test that arguments are only rendered by the listener thread."""
+    rendered_on = []
+
+    class Probe:
+        def __str__(self):
+            rendered_on.append(threading.current_thread().name)
+            return "probe"
+
+    stream = io.StringIO()
+    handler = configure_logging(stream=stream)
+    try:
+        handler.handle(logging.LogRecord("tests", logging.INFO, __file__, 1, "value %s", (Probe(),), None))
+        stop_logging()
+    finally:
+        logging.getLogger().removeHandler(handler)
+
+    assert rendered_on and threading.current_thread().name not in rendered_on
+    assert json.loads(stream.getvalue())["msg"] == "value probe"
+
+
+def test_full_queue_drops_instead_of_blocking():
+    """Test that a full queue drops records and counts them."""
+    handler = NonBlockingQueueHandler(queue.Queue(1))
+    record = logging.LogRecord("tests", logging.INFO, __file__, 1, "message", (), None)
+    handler.handle(record)
+    handler.handle(record)
+    assert handler.dropped == 1
+
+
+def test_sampling_filter_passes_higher_levels():
+    """Test that the sampling filter only thins DEBUG records."""
+    sampler = SamplingFilter(sample_every=100)
+    info = logging.LogRecord("tests", logging.INFO, __file__, 1, "message", (), None)
+    assert all(sampler.filter(info) for _ in range(5))
+
+
+def test_json_formatter_includes_exceptions():
+    """Test that exception tracebacks are included."""
+    try:
+        raise ValueError("bad value")
+    except ValueError:
+        record = logging.LogRecord("tests", logging.ERROR, __file__, 1, "failed", (), __import__("sys").exc_info())
+    entry = json.loads(JsonFormatter().format(record))
+    assert "ValueError: bad value" in entry["exc"]
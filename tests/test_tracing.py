@@ -0,0 +1,104 @@
+"""Test cases for per-request tracing."""
+import json
+
+import pytest
+
+from util.tracing import NOOP_SPAN, STATUS_ERROR, STATUS_OK, JsonLinesExporter, Tracer, approx_tokens, traced, tracer
+
+
+def test_disabled_tracer_returns_noop_spans():
+    """Test that a disabled tracer records nothing."""
+    disabled = Tracer()
+    with disabled.trace("chat_request") as root:
+        assert root is NOOP_SPAN
+        assert disabled.span("complete") is NOOP_SPAN
+    assert disabled.recent() == []
+
+
+def test_spans_are_grouped_per_request():
+    """Test that stage spans nest under their request and share its trace ID."""
+    active = Tracer(enabled=True)
+    assert active.span("outside") is NOOP_SPAN
+
+    with active.trace("chat_request", section="fin_lit"):
+        with active.span("create_prompt") as prompt_span:
+            with active.span("query_cortex_search_service") as search_span:
+                search_span.set_attributes(cache="miss", chunks=3)
+        with active.span("complete") as complete_span:
+            complete_span.set_attribute("prompt_tokens", 120)
+
+    (trace,) = active.recent()
+    spans = {span.name: span for span in trace.spans}
+    assert set(spans) == {"chat_request", "create_prompt", "query_cortex_search_service", "complete"}
+    assert spans["query_cortex_search_service"].parent_id == prompt_span.span_id
+    assert spans["complete"].parent_id == trace.root.span_id
+    assert spans["query_cortex_search_service"].attributes == {"cache": "miss", "chunks": 3}
+    assert trace.duration_ms >= spans["create_prompt"].duration_ms
+    assert [span["name"] for span in trace.as_dict()["spans"]][:2] == ["chat_request", "create_prompt"]
+
+
+def test_errors_mark_the_span():
+    """Test that an exception escaping a span records an error status."""
+    active = Tracer(enabled=True)
+    with pytest.raises(ValueError):
+        with active.trace("chat_request"):
+            raise ValueError("boom")
+    root = active.recent()[0].root
+    assert root.status == STATUS_ERROR
+    assert root.attributes["error"] == "ValueError: boom"
+
+
+def test_traces_export_as_otlp_json_lines(tmp_path):
+    """Test that finished traces are appended to the export file in OTLP JSON."""
+    path = tmp_path / "traces.jsonl"
+    active = Tracer(enabled=True, exporter=JsonLinesExporter(str(path)))
+    for _ in range(2):
+        with active.trace("chat_request", cached=True, latency=0.5):
+            with active.span("complete", prompt_tokens=10):
+                pass
+
+    lines = path.read_text().splitlines()
+    assert len(lines) == 2
+    spans = json.loads(lines[0])["resourceSpans"][0]["scopeSpans"][0]["spans"]
+    root = next(span for span in spans if "parentSpanId" not in span)
+    child = next(span for span in spans if "parentSpanId" in span)
+    assert len(root["traceId"]) == 32 and len(child["spanId"]) == 16
+    assert child["parentSpanId"] == root["spanId"]
+    assert child["attributes"] == [{"key": "prompt_tokens", "value": {"intValue": "10"}}]
+    assert {"key": "cached", "value": {"boolValue": True}} in root["attributes"]
+    assert root["status"] == {"code": STATUS_OK}
+
+
+def test_traced_decorator_uses_module_tracer():
+    """Test that decorated functions become spans of the current request."""
+
+    @traced()
+    def stage():
+        tracer.current_span().set_attribute("chunks", 2)
+        return "done"
+
+    assert stage() == "done"
+    tracer.configure(enabled=True)
+    try:
+        with tracer.trace("chat_request"):
+            stage()
+        names = [span.name for span in tracer.recent(1)[0].spans]
+    finally:
+        tracer.configure(enabled=False)
+    assert names == ["stage", "chat_request"]
+    assert approx_tokens("abcdefgh") == 2
+
+
+def test_listeners_receive_finished_traces():
+    """Test that listeners get each finished trace and a failing listener is contained."""
+    active = Tracer(enabled=True)
+    received = []
+    active.add_listener(received.append)
+    active.add_listener(lambda trace: 1 / 0)
+
+    with active.trace("chat_request"):
+        with active.span("complete"):
+            pass
+
+    assert [trace.root.name for trace in received] == ["chat_request"]
+    assert len(active.recent()) == 1
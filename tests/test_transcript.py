@@ -0,0 +1,60 @@
+"""Test cases for chat transcripts."""
+import pickle
+
+from util.transcript import NO_HISTORY, ChatMessage, ChatTranscript, prompt_history
+
+
+def messages(turns):
+    """Return ``turns`` questions and cited answers as plain dicts."""
+    history = []
+    for turn in range(turns):
+        history.append({"role": "user", "content": f"Question {turn}?"})
+        history.append({"role": "assistant", "content": f"Answer {turn}.", "citations": [f"Chunk {turn}"]})
+    return history
+
+
+def test_message_caches_prompt_form_and_tokens():
+    """Test the cached prompt form, token estimate and interned role of a record."""
+    message = ChatMessage("assistant", "Index funds track an index.", ["Chunk"])
+    assert message.prompt_text == str({"role": "assistant", "content": "Index funds track an index."})
+    assert message.tokens == (len(message.prompt_text) + 3) // 4
+    assert message.role is ChatMessage("".join(["assis", "tant"]), "Other").role
+    assert message["content"] == "Index funds track an index."
+    assert message.get("citations") == ("Chunk",)
+    assert message.get("missing", "default") == "default"
+
+
+def test_prompt_history_matches_plain_list():
+    """Test that the cached history text equals str() of the role/content dicts."""
+    history = messages(5)
+    transcript = ChatTranscript.from_dicts(history)
+    expected = str([{"role": message["role"], "content": message["content"]} for message in history[-3:]])
+
+    text, tokens = transcript.prompt_history(3)
+    assert text == expected
+    assert tokens > 0
+    assert prompt_history(history, 3)[0] == expected
+    assert transcript.history(2) == [{"role": "user", "content": "Question 4?"}, {"role": "assistant", "content": "Answer 4."}]
+    assert transcript.prompt_history(0) == (NO_HISTORY, 0)
+    assert prompt_history([], 3) == (NO_HISTORY, 0)
+
+
+def test_window_reads_spilled_messages():
+    """Test a history window larger than the in-memory tail."""
+    transcript = ChatTranscript(max_messages=2)
+    transcript.extend(messages(3))
+    assert transcript.spilled == 4
+    assert [record.content for record in transcript.window(3)] == ["Answer 1.", "Question 2?", "Answer 2."]
+    assert isinstance(transcript[0], ChatMessage)
+
+
+def test_transcript_round_trips():
+    """Test dict and pickle round trips, including spilled messages and citations."""
+    history = messages(4)
+    transcript = ChatTranscript.from_dicts(history, max_messages=3)
+    assert transcript.to_dicts() == history
+    assert list(transcript) == history
+
+    restored = pickle.loads(pickle.dumps(transcript))
+    assert restored.to_dicts() == history
+    assert restored.max_messages == 3
@@ -0,0 +1,64 @@
+"""Test cases for the process warm-up runner and compiled prompt templates."""
+import threading
+
+from util.prompts import PromptRegistry
+from util.warmup import run_warmup, start_warmup
+
+
+def test_run_warmup_times_steps_and_continues_after_failures():
+    """Test that every step runs and is reported, including failures."""
+    ran = []
+
+    def fail():
+        raise ConnectionError("warehouse unavailable")
+
+    report = run_warmup([("first", lambda: ran.append(1) or "ok"), ("broken", fail), ("last", lambda: ran.append(2))])
+
+    summary = report.summary()
+    assert ran == [1, 2]
+    assert report.done
+    assert summary["completed"] == summary["total"] == 3
+    assert summary["failed"] == ["broken"]
+    assert summary["steps"][0]["detail"] == "ok"
+    assert "warehouse unavailable" in summary["steps"][1]["detail"]
+
+
+def test_start_warmup_runs_in_background():
+    """Test that the background run fills in the returned report."""
+    report = start_warmup([("step", lambda: None)])
+    assert report.wait(timeout=1)
+    assert [step.name for step in report.steps] == ["step"]
+
+
+def test_start_warmup_builds_steps_in_background():
+    """Test that steps given as a function are built on the warm-up thread, and a failed build is reported."""
+    built_on = []
+
+    def build():
+        built_on.append(threading.current_thread())
+        return [("step", lambda: None)]
+
+    report = start_warmup(build)
+    assert report.wait(timeout=1)
+    assert built_on and built_on[0] is not threading.current_thread()
+    assert report.step_names == ["step"]
+
+    def broken():
+        raise RuntimeError("no secrets")
+
+    report = run_warmup(broken)
+    assert report.done
+    assert report.summary()["failed"] == ["setup"]
+    assert report.steps[0].detail == "no secrets"
+
+
+def test_prompt_registry_renders_section_templates():
+    """Test that base prompts are embedded literally and placeholders are filled per request."""
+    registry = PromptRegistry({"investment": "You are an investment advisor. Fees cost $5."})
+
+    prompt = registry.render("investment", chat_history="No previous context", context="Index funds", question="Why $?")
+
+    assert registry.sections == ["investment"]
+    assert prompt.startswith("[INST]\n    You are an investment advisor. Fees cost $5.\n")
+    assert "<context>\n    Index funds\n    </context>" in prompt
+    assert "<question>\n    Why $?\n    </question>" in prompt
@@ -0,0 +1,57 @@
+"""Test cases for the batched background writer and per-thread SQLite connections."""
+import threading
+
+from util.write_behind import BatchWriter, ThreadLocalSQLite
+
+
+def test_items_are_written_in_batches():
+    """Test that queued items are grouped up to ``batch_size`` and all written by ``flush``."""
+    batches = []
+    writer = BatchWriter(batches.append, "test-writer", batch_size=3, flush_interval=0.2)
+    for item in range(7):
+        assert writer.submit(item)
+    writer.flush()
+    writer.close()
+
+    assert [item for batch in batches for item in batch] == list(range(7))
+    assert max(len(batch) for batch in batches) <= 3
+    assert writer.pending == 0
+
+
+def test_full_queue_refuses_and_failed_writes_do_not_stop_the_writer():
+    """Test that ``submit`` never blocks and a batch that fails to write is skipped."""
+    release = threading.Event()
+    written = []
+
+    def write(batch):
+        release.wait(5)
+        if batch == [0]:
+            raise ConnectionError("store unavailable")
+        written.extend(batch)
+
+    writer = BatchWriter(write, "test-writer", batch_size=1, queue_size=2)
+    results = [writer.submit(item) for item in range(10)]
+    release.set()
+    writer.close()
+    writer.close()
+
+    assert results.count(False) >= 7
+    assert written == [item for item, queued in enumerate(results) if queued and item]
+
+
+def test_sqlite_connections_are_per_thread(tmp_path):
+    """Test that each thread gets its own connection to the same WAL database."""
+    db = ThreadLocalSQLite(str(tmp_path / "test.db"), "CREATE TABLE IF NOT EXISTS items (value INTEGER);")
+    connection = db.connection()
+    assert db.connection() is connection
+    assert connection.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    other = []
+    thread = threading.Thread(target=lambda: other.append(db.connection()))
+    thread.start()
+    thread.join()
+    assert other[0] is not connection
+
+    with connection:
+        connection.execute("INSERT INTO items VALUES (1)")
+    assert ThreadLocalSQLite(db.path).connection().execute("SELECT COUNT(*) FROM items").fetchone()[0] == 1
@@ -0,0 +1,106 @@
+"""
+Admission control for answer generation.
+
+Under a traffic spike, starting every request at once slows all of them down
+together. ``AdmissionQueue`` holds the requests that arrive while every worker is
+busy in a bounded queue and decides which one runs next: short follow-up
+questions go first, in arrival order, and other requests in arrival order after
+them. After ``priority_burst`` follow-ups in a row one waiting regular request
+is let through, so follow-ups cannot starve the others. A request that arrives
+while the queue is full is shed with ``OverloadedError`` instead of making every
+waiting request slower.
+"""
+import logging
+from collections import Counter, deque
+from typing import Any, Dict, List
+
+logger = logging.getLogger(__name__)
+
+
+class OverloadedError(RuntimeError):
+    """Raised when a request is shed because the admission queue is full or it waited too long."""
+
+
+class AdmissionQueue:
+    """Bounded queue of waiting requests with priority for follow-ups. Not thread-safe; callers lock."""
+
+    def __init__(self, max_queue: int = 32, priority_burst: int = 3):
+        """
+        Initialize an empty queue.
+
+        Args:
+            max_queue: Requests that may wait; further requests are shed
+            priority_burst: Follow-ups taken in a row while regular requests wait
+        """
+        self.max_queue = max_queue
+        self.priority_burst = max(1, priority_burst)
+        self._priority: deque = deque()
+        self._regular: deque = deque()
+        self._streak = 0
+        self._counters = Counter()
+
+    def __len__(self) -> int:
+        return len(self._priority) + len(self._regular)
+
+    def full(self) -> bool:
+        return len(self) >= self.max_queue
+
+    def put(self, item: Any, priority: bool = False) -> None:
+        """
+        Queue ``item``; ``priority`` marks a short follow-up.
+
+        Raises:
+            OverloadedError: If the queue is full
+        """
+        if self.full():
+            self._counters["shed"] += 1
+            raise OverloadedError(f"Admission queue full ({self.max_queue} waiting)")
+        (self._priority if priority else self._regular).append(item)
+        self._counters["prioritized" if priority else "queued"] += 1
+
+    def take(self) -> Any:
+        """Remove and return the request to run next, or None if none is waiting."""
+        if self._priority and (self._streak < self.priority_burst or not self._regular):
+            self._streak += 1
+            return self._priority.popleft()
+        self._streak = 0
+        return self._regular.popleft() if self._regular else None
+
+    def remove(self, item: Any) -> bool:
+        """Withdraw a waiting request; returns False if it is not waiting."""
+        for waiting in (self._priority, self._regular):
+            try:
+                waiting.remove(item)
+                return True
+            except ValueError:
+                pass
+        return False
+
+    def order(self) -> List[Any]:
+        """Return the waiting requests in the order they will be taken."""
+        priority, regular, streak = list(self._priority), list(self._regular), self._streak
+        order = []
+        while priority or regular:
+            if priority and (streak < self.priority_burst or not regular):
+                streak += 1
+                order.append(priority.pop(0))
+            else:
+                streak = 0
+                order.append(regular.pop(0))
+        return order
+
+    def position(self, item: Any) -> int:
+        """Return the 1-based place of ``item`` in line, or 0 if it is not waiting."""
+        for place, waiting in enumerate(self.order(), start=1):
+            if waiting is item:
+                return place
+        return 0
+
+    def stats(self) -> Dict[str, int]:
+        """Return waiting, queued, prioritized and shed counts."""
+        return {
+            "waiting": len(self),
+            "queued": self._counters["queued"],
+            "prioritized": self._counters["prioritized"],
+            "shed": self._counters["shed"],
+        }
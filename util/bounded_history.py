@@ -0,0 +1,204 @@
+"""
+Chat histories with a memory cap.
+
+``BoundedHistory`` keeps the most recent messages of a conversation in memory,
+up to a message count and an approximate byte size. Older messages are spilled
+to an append-only JSON lines file and read back only when indexed, e.g. when the
+user loads earlier messages. It behaves as a read-only sequence with ``append``,
+so code written for a list of message dicts can slice and iterate it unchanged.
+Subclasses can hold other message records by overriding ``_prepare``, ``_encode``
+and ``_decode``.
+"""
+import json
+import logging
+import os
+import tempfile
+import weakref
+from array import array
+from collections import deque
+from collections.abc import Sequence
+from itertools import islice
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+
+DEFAULT_SPILL_DIR = os.path.join(tempfile.gettempdir(), "econo-genie-history")
+
+
+def _remove(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class SpillFile:
+    """Append-only JSON lines file of messages, read back by position."""
+
+    def __init__(self, directory: str):
+        """
+        Create an empty spill file in ``directory``.
+
+        The file is deleted when the object is garbage collected or ``delete`` is called.
+        """
+        os.makedirs(directory, exist_ok=True)
+        fd, self.path = tempfile.mkstemp(prefix="history-", suffix=".jsonl", dir=directory)
+        os.close(fd)
+        # Start offset of each line, plus the end of the file
+        self._offsets = array("q", [0])
+        self._finalizer = weakref.finalize(self, _remove, self.path)
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1
+
+    @property
+    def size_bytes(self) -> int:
+        return self._offsets[-1]
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        """Append ``messages`` to the end of the file."""
+        lines = [(json.dumps(message, separators=(",", ":")) + "\n").encode("utf-8") for message in messages]
+        with open(self.path, "ab") as f:
+            f.write(b"".join(lines))
+        for line in lines:
+            self._offsets.append(self._offsets[-1] + len(line))
+
+    def read(self, start: int, stop: int) -> List[Message]:
+        """Return messages ``start`` to ``stop`` (exclusive) with one seek and one read."""
+        start, stop = max(start, 0), min(stop, len(self))
+        if start >= stop:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self._offsets[start])
+            data = f.read(self._offsets[stop] - self._offsets[start])
+        return [json.loads(line) for line in data.splitlines()]
+
+    def delete(self) -> None:
+        self._finalizer()
+
+
+class BoundedHistory(Sequence):
+    """A chat history that keeps its newest messages in memory and spills older ones to disk."""
+
+    def __init__(self, max_messages: int = 100, max_bytes: int = 256 * 1024, spill_dir: Optional[str] = None):
+        """
+        Initialize an empty history.
+
+        Args:
+            max_messages: Messages kept in memory
+            max_bytes: Approximate serialized size of the messages kept in memory; the
+                newest message always stays in memory
+            spill_dir: Directory for the spill file, created on the first spill
+        """
+        self.max_messages = max(1, max_messages)
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir or DEFAULT_SPILL_DIR
+        self._tail: deque = deque()
+        self._sizes: deque = deque()
+        self._tail_bytes = 0
+        self._spill: Optional[SpillFile] = None
+
+    @property
+    def spilled(self) -> int:
+        """Number of messages held on disk."""
+        return len(self._spill) if self._spill is not None else 0
+
+    @property
+    def memory_bytes(self) -> int:
+        """Approximate serialized size of the messages held in memory."""
+        return self._tail_bytes
+
+    def _prepare(self, message: Message) -> Tuple[Any, int]:
+        """Return the in-memory item for ``message`` and its approximate size in bytes."""
+        return message, len(json.dumps(message, separators=(",", ":")))
+
+    def _encode(self, item: Any) -> Message:
+        """Return the JSON-serializable form of an in-memory item, written when it is spilled."""
+        return item
+
+    def _decode(self, message: Message) -> Any:
+        """Return the item for a message read back from the spill file."""
+        return message
+
+    def _read_spilled(self, start: int, stop: int) -> List[Any]:
+        return [self._decode(message) for message in self._spill.read(start, stop)]
+
+    def append(self, message: Message) -> None:
+        """Add a message, spilling the oldest in-memory messages when over a cap."""
+        message, size = self._prepare(message)
+        self._tail.append(message)
+        self._sizes.append(size)
+        self._tail_bytes += size
+
+        evicted = []
+        while len(self._tail) > 1 and (len(self._tail) > self.max_messages or self._tail_bytes > self.max_bytes):
+            evicted.append(self._tail.popleft())
+            self._tail_bytes -= self._sizes.popleft()
+        if evicted:
+            self._spill_messages(evicted)
+
+    def _spill_messages(self, messages: List[Message]) -> None:
+        try:
+            if self._spill is None:
+                self._spill = SpillFile(self.spill_dir)
+            self._spill.extend(self._encode(message) for message in messages)
+        except OSError as e:
+            # Without a writable spill directory, older messages are dropped rather than kept in memory
+            logger.warning("Could not spill %d chat messages: %s", len(messages), e)
+
+    def extend(self, messages: Iterable[Message]) -> None:
+        for message in messages:
+            self.append(message)
+
+    def __len__(self) -> int:
+        return self.spilled + len(self._tail)
+
+    def __getitem__(self, index):
+        spilled = self.spilled
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self))
+            if step != 1:
+                return [self[position] for position in range(start, stop, step)]
+            if stop <= start:
+                return []
+            head = self._read_spilled(start, min(stop, spilled)) if start < spilled else []
+            return head + list(islice(self._tail, max(start - spilled, 0), max(stop - spilled, 0)))
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("history index out of range")
+        if index < spilled:
+            return self._read_spilled(index, index + 1)[0]
+        return self._tail[index - spilled]
+
+    def __iter__(self) -> Iterator[Message]:
+        if self.spilled:
+            yield from self._read_spilled(0, self.spilled)
+        yield from list(self._tail)
+
+    def __reversed__(self) -> Iterator[Message]:
+        # Newest first; spilled messages are only read if iteration gets that far
+        yield from reversed(list(self._tail))
+        if self.spilled:
+            yield from reversed(self._read_spilled(0, self.spilled))
+
+    def pop(self) -> Any:
+        """Remove and return the newest message, which is always held in memory."""
+        if not self._tail:
+            raise IndexError("pop from an empty history")
+        self._tail_bytes -= self._sizes.pop()
+        return self._tail.pop()
+
+    def clear(self) -> None:
+        """Drop every message and delete the spill file."""
+        self._tail.clear()
+        self._sizes.clear()
+        self._tail_bytes = 0
+        if self._spill is not None:
+            self._spill.delete()
+            self._spill = None
+
+    def __repr__(self) -> str:
+        return f"BoundedHistory({len(self)} messages, {self.spilled} spilled)"
@@ -0,0 +1,329 @@
+"""
+Shared cache tiers.
+
+An in-process ``RetrievalCache`` only helps the server that filled it; replicas
+behind a load balancer each warm their own copy. ``TieredCache`` puts a shared
+second tier behind the in-process LRU: lookups that miss locally read through to
+the shared backend and keep what they find, and new entries are written to the
+local tier at once and to the shared backend by a background thread in batches
+(write-behind), so the request path never waits on the shared store.
+
+Backends store opaque bytes under string keys and bound their own size:
+
+* ``SQLiteCacheBackend``: a local SQLite file in WAL mode, shared by the server
+  processes of one host.
+* ``KeyValueCacheBackend``: a network key-value store through a Redis-style client
+  (``get``, ``set(key, value, ex=ttl)``, ``delete``); expiry and eviction are the
+  store's. ``LocalKeyValueStore`` is an in-memory stand-in with the same interface.
+
+Values are pickled, so a shared tier must only be shared between trusted
+instances of this app.
+"""
+import abc
+import hashlib
+import json
+import logging
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+from util.retrieval_cache import RetrievalCache
+from util.write_behind import BatchWriter, ThreadLocalSQLite
+
+logger = logging.getLogger(__name__)
+
+
+class CacheBackend(abc.ABC):
+    """Shared byte store behind a ``TieredCache``. Subclasses implement ``get``, ``set_many`` and ``delete``."""
+
+    @abc.abstractmethod
+    def get(self, key: str) -> Optional[bytes]:
+        """Return the value stored under ``key``, or None if missing or expired."""
+
+    @abc.abstractmethod
+    def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_seconds: float) -> None:
+        """Store each ``(key, value)`` pair, valid for ``ttl_seconds`` (0 for no expiry)."""
+
+    @abc.abstractmethod
+    def delete(self, key: str) -> None:
+        """Remove the value stored under ``key``, if any."""
+
+    def close(self) -> None:
+        pass
+
+
+class SQLiteCacheBackend(CacheBackend):
+    """Cache entries in a local SQLite file, shared by the processes of one host."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS cache_entries (
+            key TEXT PRIMARY KEY,
+            value BLOB NOT NULL,
+            expires_at REAL NOT NULL,
+            written_at REAL NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS cache_entries_written ON cache_entries (written_at);
+    """
+
+    def __init__(self, path: str, max_entries: int = 100000):
+        """
+        Open (and create) the cache database at ``path``.
+
+        Args:
+            path: Database file; every process that opens it shares its entries
+            max_entries: Entries kept; each write removes the oldest written beyond it
+        """
+        self.path = path
+        self.max_entries = max_entries
+        self._db = ThreadLocalSQLite(path, self.SCHEMA)
+
+    def get(self, key: str) -> Optional[bytes]:
+        row = self._db.connection().execute("SELECT value, expires_at FROM cache_entries WHERE key = ?", (key,)).fetchone()
+        if row is None or (row[1] and row[1] < time.time()):
+            return None
+        return row[0]
+
+    def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_seconds: float) -> None:
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds else 0
+        connection = self._db.connection()
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO cache_entries (key, value, expires_at, written_at) VALUES (?, ?, ?, ?)",
+                [(key, value, expires_at, now) for key, value in items],
+            )
+            connection.execute(
+                "DELETE FROM cache_entries WHERE expires_at > 0 AND expires_at < ? OR key IN "
+                "(SELECT key FROM cache_entries ORDER BY written_at DESC LIMIT -1 OFFSET ?)",
+                (now, self.max_entries),
+            )
+
+    def delete(self, key: str) -> None:
+        connection = self._db.connection()
+        with connection:
+            connection.execute("DELETE FROM cache_entries WHERE key = ?", (key,))
+
+    def __len__(self) -> int:
+        return self._db.connection().execute("SELECT COUNT(*) FROM cache_entries").fetchone()[0]
+
+
+class KeyValueCacheBackend(CacheBackend):
+    """Cache entries in a network key-value store through a Redis-style client."""
+
+    def __init__(self, client: Any, prefix: str = "econo-genie:"):
+        """
+        Args:
+            client: Object with ``get(key)``, ``set(key, value, ex=seconds)`` and ``delete(key)``,
+                such as ``redis.Redis`` or ``LocalKeyValueStore``
+            prefix: Prepended to every key, to share one store between applications
+        """
+        self.client = client
+        self.prefix = prefix
+
+    def get(self, key: str) -> Optional[bytes]:
+        return self.client.get(self.prefix + key)
+
+    def set_many(self, items: Sequence[Tuple[str, bytes]], ttl_seconds: float) -> None:
+        ttl = int(ttl_seconds) or None
+        pipeline = getattr(self.client, "pipeline", None)
+        target = pipeline(transaction=False) if pipeline is not None else self.client
+        for key, value in items:
+            target.set(self.prefix + key, value, ex=ttl)
+        if target is not self.client:
+            target.execute()
+
+    def delete(self, key: str) -> None:
+        self.client.delete(self.prefix + key)
+
+
+class LocalKeyValueStore:
+    """In-memory stand-in for a Redis-style key-value store, evicting least recently used keys."""
+
+    def __init__(self, max_entries: int = 100000):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry[0] and entry[0] < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry[1]
+
+    def set(self, key: str, value: bytes, ex: Optional[int] = None) -> bool:
+        with self._lock:
+            self._entries[key] = (time.time() + ex if ex else 0, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return True
+
+    def delete(self, key: str) -> int:
+        with self._lock:
+            return 1 if self._entries.pop(key, None) is not None else 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def backend_key(namespace: str, key: Hashable) -> str:
+    """Return a stable string key for ``key`` that is the same in every process."""
+    digest = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+    return f"{namespace}:{digest}"
+
+
+class TieredCache:
+    """
+    An in-process LRU in front of an optional shared ``CacheBackend``.
+
+    Has the interface of ``RetrievalCache``, so it can replace one wherever it is used.
+    """
+
+    def __init__(
+        self,
+        namespace: str,
+        local: RetrievalCache,
+        shared: Optional[CacheBackend] = None,
+        ttl_seconds: float = 600.0,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        queue_size: int = 10000,
+    ):
+        """
+        Initialize the cache and, with a shared backend, start its writer thread.
+
+        Args:
+            namespace: Prefix of this cache's keys in the shared backend, e.g. "retrieval"
+            local: In-process tier
+            shared: Shared tier, or None for an in-process cache only
+            ttl_seconds: Expiry of entries written to the shared tier, 0 for none
+            batch_size: Most entries written to the shared tier at once
+            flush_interval: Longest time, in seconds, an entry waits to be written
+            queue_size: Entries waiting to be written before new ones are not shared
+        """
+        self.namespace = namespace
+        self.local = local
+        self.shared = shared
+        self.ttl_seconds = ttl_seconds
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._counters = Counter()
+        self._writer: Optional[BatchWriter] = None
+        if shared is not None:
+            self._writer = BatchWriter(self._write, f"{namespace}-cache-writer", batch_size, flush_interval, queue_size)
+
+    def __len__(self) -> int:
+        return len(self.local)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.local
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the value for ``key`` from the local tier, else from the shared tier, or None."""
+        value = self.local.get(key)
+        if value is not None or self.shared is None:
+            return value
+        try:
+            data = self.shared.get(backend_key(self.namespace, key))
+        except Exception as e:
+            self._counters["shared_errors"] += 1
+            logger.warning("Shared %s cache read failed: %s", self.namespace, e)
+            return None
+        if data is None:
+            self._counters["shared_misses"] += 1
+            return None
+        try:
+            value = pickle.loads(data)
+        except Exception as e:
+            # Written by an incompatible version of the app, or corrupt: a miss, and dropped for everyone
+            self._counters["shared_misses"] += 1
+            self._counters["decode_errors"] += 1
+            logger.warning("Dropping undecodable shared %s cache entry: %s", self.namespace, e)
+            self._delete_shared(backend_key(self.namespace, key))
+            return None
+        self._counters["shared_hits"] += 1
+        self.local.put(key, value)
+        return value
+
+    def _delete_shared(self, shared_key: str) -> None:
+        try:
+            self.shared.delete(shared_key)
+        except Exception as e:
+            self._counters["shared_errors"] += 1
+            logger.warning("Shared %s cache delete failed: %s", self.namespace, e)
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` locally and queue it for the shared tier."""
+        self.local.put(key, value)
+        if self.shared is None:
+            return
+        if not self._writer.submit((backend_key(self.namespace, key), pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL))):
+            self._counters["write_dropped"] += 1
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, calling ``loader`` and caching its result on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def entries(self) -> List[Tuple[Hashable, Any, float]]:
+        """Return the local tier's unexpired entries, for snapshots."""
+        return self.local.entries()
+
+    def restore(self, entries: Iterable[Tuple[Hashable, Any, float]]) -> int:
+        """Add snapshot entries to the local tier; the shared tier keeps its own copies."""
+        return self.local.restore(entries)
+
+    def _write(self, items: Iterable[Tuple[str, bytes]]) -> None:
+        # Later writes of a key in the same batch win
+        batch = list(dict(items).items())
+        try:
+            self.shared.set_many(batch, self.ttl_seconds)
+            self._counters["shared_writes"] += len(batch)
+        except Exception as e:
+            self._counters["shared_errors"] += 1
+            logger.warning("Shared %s cache write of %d entries failed: %s", self.namespace, len(batch), e)
+
+    def flush(self) -> None:
+        """Block until every queued entry has been written to the shared tier."""
+        if self._writer is not None:
+            self._writer.flush()
+
+    def clear(self) -> None:
+        """Drop the local entries and reset the counters; the shared tier is left as is."""
+        self.local.clear()
+        self._counters.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return the local tier's stats plus shared tier hits, misses, writes and errors."""
+        stats = self.local.stats()
+        lookups = stats["hits"] + stats["misses"]
+        shared_hits = self._counters["shared_hits"]
+        stats.update(
+            shared_hits=shared_hits,
+            shared_misses=self._counters["shared_misses"],
+            shared_writes=self._counters["shared_writes"],
+            shared_errors=self._counters["shared_errors"],
+            decode_errors=self._counters["decode_errors"],
+            write_dropped=self._counters["write_dropped"],
+            pending_writes=self._writer.pending if self._writer is not None else 0,
+            combined_hit_rate=(stats["hits"] + shared_hits) / lookups if lookups else 0.0,
+        )
+        return stats
+
+    def close(self) -> None:
+        """Write the queued entries and stop the writer."""
+        if self._writer is not None:
+            self._writer.close()
+        if self.shared is not None:
+            self.shared.close()
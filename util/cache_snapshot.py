@@ -0,0 +1,223 @@
+"""
+Cache snapshots for warm restarts.
+
+Every deploy starts with empty in-process caches. ``CacheSnapshotter`` writes the
+live entries of each registered cache to a snapshot file periodically and at
+exit, and loads them back when the next process starts, so a restarted server
+answers repeat questions from cache within seconds of starting.
+
+A snapshot file is::
+
+    magic (8 bytes) | format version (u32) | metadata length (u32) | metadata (JSON)
+    | entry count (u32) | index: (offset u64, length u32) per entry | entries
+    | SHA-256 of everything before it (32 bytes)
+
+Each entry is a pickled ``(key, value, written_at)`` record. The file is read
+through ``mmap`` and verified against its checksum before any entry is
+unpickled; entries are then decoded one at a time from the index. The metadata
+holds the cache's fingerprint, e.g. the corpus version for retrieval results and
+also the prompt template hash for answers; a snapshot whose fingerprint differs
+from the running app's is discarded, as are entries that expired while the app
+was down.
+"""
+import atexit
+import hashlib
+import json
+import logging
+import mmap
+import os
+import pickle
+import struct
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"EGCACHE\x00"
+FORMAT_VERSION = 1
+_HEADER = struct.Struct("<8sII")
+_COUNT = struct.Struct("<I")
+_INDEX_ENTRY = struct.Struct("<QI")
+_CHECKSUM_SIZE = 32
+
+# key, value, wall-clock time the entry was written
+Entry = Tuple[Any, Any, float]
+
+
+class SnapshotError(ValueError):
+    """Raised when a snapshot file is truncated, corrupt or of an unknown format."""
+
+
+def write_snapshot(path: str, entries: List[Entry], metadata: Mapping[str, Any]) -> int:
+    """
+    Write ``entries`` and ``metadata`` to a snapshot at ``path``.
+
+    The file is written next to ``path`` and renamed into place, so readers never
+    see a partial snapshot.
+
+    Returns:
+        Size of the snapshot in bytes
+    """
+    meta = json.dumps(dict(metadata), sort_keys=True).encode("utf-8")
+    records = [pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL) for entry in entries]
+    data_start = _HEADER.size + len(meta) + _COUNT.size + _INDEX_ENTRY.size * len(records)
+
+    index, offset = [], data_start
+    for record in records:
+        index.append(_INDEX_ENTRY.pack(offset, len(record)))
+        offset += len(record)
+    parts = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(meta)), meta, _COUNT.pack(len(records)), *index, *records]
+
+    checksum = hashlib.sha256()
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(prefix=".snapshot-", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for part in parts:
+                checksum.update(part)
+                f.write(part)
+            f.write(checksum.digest())
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return offset + _CHECKSUM_SIZE
+
+
+def read_snapshot(path: str) -> Tuple[Dict[str, Any], List[Entry]]:
+    """
+    Read a snapshot written by ``write_snapshot``.
+
+    Returns:
+        The snapshot's metadata and entries
+
+    Raises:
+        SnapshotError: If the file is not a valid snapshot or fails its checksum
+        OSError: If the file cannot be read
+    """
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size < _HEADER.size + _CHECKSUM_SIZE:
+            raise SnapshotError(f"{path} is too short to be a cache snapshot")
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as view, memoryview(view) as buffer:
+            magic, version, meta_length = _HEADER.unpack_from(buffer, 0)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path} is not a cache snapshot")
+            if version != FORMAT_VERSION:
+                raise SnapshotError(f"{path} has snapshot format {version}, expected {FORMAT_VERSION}")
+            # Hash and decode straight from the mapping, without copying the file
+            body_end = len(buffer) - _CHECKSUM_SIZE
+            if hashlib.sha256(buffer[:body_end]).digest() != buffer[body_end:]:
+                raise SnapshotError(f"{path} failed its checksum")
+
+            position = _HEADER.size
+            metadata = json.loads(bytes(buffer[position : position + meta_length]).decode("utf-8"))
+            position += meta_length
+            (count,) = _COUNT.unpack_from(buffer, position)
+            position += _COUNT.size
+            entries = []
+            for slot in range(count):
+                offset, length = _INDEX_ENTRY.unpack_from(buffer, position + slot * _INDEX_ENTRY.size)
+                entries.append(pickle.loads(buffer[offset : offset + length]))
+    return metadata, entries
+
+
+class CacheSnapshotter:
+    """Snapshots registered caches to a directory and restores them on startup."""
+
+    def __init__(self, directory: str):
+        """
+        Args:
+            directory: Where snapshot files, one per cache, are written
+        """
+        self.directory = directory
+        self._caches: Dict[str, Tuple[Any, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def register(self, name: str, cache: Any, fingerprint: Optional[Mapping[str, Any]] = None) -> None:
+        """
+        Snapshot ``cache`` as ``name``.
+
+        Args:
+            name: File name stem of the cache's snapshot
+            cache: Object with ``entries()`` and ``restore(entries)``, such as ``RetrievalCache``
+            fingerprint: Values the cached entries depend on, e.g. the corpus version;
+                a snapshot taken with a different fingerprint is not restored
+        """
+        self._caches[name] = (cache, dict(fingerprint or {}))
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.snapshot")
+
+    def save(self, name: str) -> int:
+        """Snapshot one cache; returns the number of entries written."""
+        cache, fingerprint = self._caches[name]
+        entries = cache.entries()
+        with self._lock:
+            write_snapshot(self.path(name), entries, {"cache": name, "fingerprint": fingerprint, "created_at": time.time()})
+        return len(entries)
+
+    def save_all(self) -> Dict[str, int]:
+        """Snapshot every cache, logging failures; returns entries written per cache."""
+        saved = {}
+        for name in self._caches:
+            try:
+                saved[name] = self.save(name)
+            except Exception as e:
+                logger.warning("Could not snapshot the %s cache: %s", name, e)
+        logger.debug("Cache snapshots written: %s", saved)
+        return saved
+
+    def load(self, name: str) -> int:
+        """Restore one cache from its snapshot; returns the number of entries restored."""
+        cache, fingerprint = self._caches[name]
+        metadata, entries = read_snapshot(self.path(name))
+        if metadata.get("fingerprint") != fingerprint:
+            logger.info("Discarding %s cache snapshot taken for %s; now %s", name, metadata.get("fingerprint"), fingerprint)
+            return 0
+        return cache.restore(entries)
+
+    def discard(self, name: str) -> None:
+        """Delete the snapshot of ``name``, if any."""
+        try:
+            os.remove(self.path(name))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning("Could not delete the %s cache snapshot: %s", name, e)
+
+    def load_all(self) -> Dict[str, int]:
+        """Restore every cache that has a snapshot, deleting those that fail; returns entries restored per cache."""
+        start = time.perf_counter()
+        loaded = {}
+        for name in self._caches:
+            if not os.path.exists(self.path(name)):
+                continue
+            try:
+                loaded[name] = self.load(name)
+            except Exception as e:
+                # Any bad snapshot, e.g. one pickling a class this version no longer has, only costs a cold start
+                logger.warning("Discarding the %s cache snapshot, which could not be restored: %r", name, e)
+                self.discard(name)
+        logger.info("Restored cache snapshots %s in %.3fs", loaded, time.perf_counter() - start)
+        return loaded
+
+    def start(self, interval: float = 300.0) -> None:
+        """Snapshot every ``interval`` seconds on a daemon thread and at exit; a no-op if already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+        atexit.register(self.save_all)
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.save_all()
+
+        self._thread = threading.Thread(target=loop, name="cache-snapshots", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
@@ -0,0 +1,149 @@
+"""
+Per-section memory of the last turn's retrieval context.
+
+Follow-up questions often stay on the topic of the previous turn ("and what
+about for retirement?"). ``ConversationContextMemory`` keeps the last turn's hits
+for each chat section and decides, from term overlap between the new question
+and the previous turn's topic, whether to reuse those hits as they are, augment
+them with a smaller search for just the new terms, or run a fresh search.
+Questions that open like a continuation ("and ...", "what about ...") are
+augmented even when most of their terms are new.
+
+A turn's topic is the terms of its question and of the query actually searched,
+never of the retrieved text: chunks mention many terms beside the one asked
+about, and matching against them would reuse hits for unrelated questions.
+"""
+from typing import Any, Dict, Hashable, List, Optional, Sequence
+
+from util.terms import key_terms, stem, term_stems
+
+REUSE = "reuse"
+DELTA = "delta"
+FRESH = "fresh"
+
+# Openings that mark a question as continuing the previous turn's topic
+FOLLOW_UP_CUES = ("and ", "also ", "what about", "how about", "what if", "same for", "then ")
+
+
+class TurnContext:
+    """Retrieval context kept from one turn."""
+
+    __slots__ = ("scope", "query_terms", "topic_terms", "context", "results", "reuses")
+
+    def __init__(self, scope: Hashable, query_terms: List[str], topic_terms: set, context: str, results: List[Any]):
+        self.scope = scope
+        self.query_terms = query_terms
+        self.topic_terms = topic_terms
+        self.context = context
+        self.results = results
+        self.reuses = 0
+
+
+class ContextPlan:
+    """How to obtain retrieval context for a new question."""
+
+    __slots__ = ("action", "similarity", "delta_query", "previous")
+
+    def __init__(self, action: str, similarity: float = 0.0, delta_query: str = "", previous: Optional[TurnContext] = None):
+        self.action = action
+        self.similarity = similarity
+        self.delta_query = delta_query
+        self.previous = previous
+
+    def __repr__(self) -> str:
+        return f"ContextPlan(action={self.action!r}, similarity={self.similarity:.2f}, delta_query={self.delta_query!r})"
+
+
+def is_follow_up(question: str) -> bool:
+    """Return True if ``question`` opens like a continuation of the previous turn."""
+    return question.strip().lower().startswith(FOLLOW_UP_CUES)
+
+
+def term_overlap(query_terms: Sequence[str], topic_terms: set) -> float:
+    """Fraction of the query's terms whose stems the topic covers; 1.0 for a query with no terms."""
+    if not query_terms:
+        return 1.0
+    return sum(1 for term in query_terms if stem(term) in topic_terms) / len(query_terms)
+
+
+class ConversationContextMemory:
+    """Keeps the last turn's retrieval context for each chat section."""
+
+    def __init__(self, reuse_threshold: float = 0.8, delta_threshold: float = 0.5, max_reuses: int = 3):
+        """
+        Initialize an empty memory.
+
+        Args:
+            reuse_threshold: Overlap at or above which the previous hits are reused unchanged
+            delta_threshold: Overlap at or above which only the new terms are searched
+            max_reuses: Consecutive turns a context may be reused before a fresh search
+        """
+        self._reuse_threshold = reuse_threshold
+        self._delta_threshold = delta_threshold
+        self._max_reuses = max_reuses
+        self._turns: Dict[str, TurnContext] = {}
+
+    def plan(self, section: str, question: str, scope: Hashable) -> ContextPlan:
+        """
+        Decide how to retrieve context for ``question`` in ``section``.
+
+        Args:
+            section: Chat section the question was asked in
+            question: The user's question
+            scope: Search settings the previous hits must match, e.g. service and filter
+
+        Returns:
+            A plan whose action is ``reuse``, ``delta`` or ``fresh``
+        """
+        previous = self._turns.get(section)
+        if previous is None or previous.scope != scope or not previous.results:
+            return ContextPlan(FRESH)
+
+        query_terms = key_terms(question)
+        similarity = term_overlap(query_terms, previous.topic_terms)
+        if similarity >= self._reuse_threshold and previous.reuses < self._max_reuses:
+            return ContextPlan(REUSE, similarity, previous=previous)
+        if similarity >= self._delta_threshold or is_follow_up(question):
+            # Continuations like "and what about for retirement?" extend the topic with their new terms
+            new_terms = [term for term in query_terms if stem(term) not in previous.topic_terms]
+            if new_terms:
+                return ContextPlan(DELTA, similarity, " ".join(new_terms), previous=previous)
+        return ContextPlan(FRESH, similarity)
+
+    def remember(
+        self,
+        section: str,
+        question: str,
+        scope: Hashable,
+        context: str,
+        results: List[Any],
+        plan: Optional[ContextPlan] = None,
+        search_query: Optional[str] = None,
+    ) -> None:
+        """
+        Store the context used to answer ``question`` as the section's last turn.
+
+        Args:
+            section: Chat section the question was asked in
+            question: The user's question
+            scope: Search settings the hits were retrieved with
+            context: Prompt context built from the hits
+            results: The hits
+            plan: The plan the context was obtained by, if any
+            search_query: Query searched instead of the question, e.g. a history-aware rewrite
+        """
+        topic_terms = term_stems(question) | term_stems(search_query or "")
+        turn = TurnContext(scope, key_terms(question), topic_terms, context, list(results))
+        if plan is not None and plan.action in (REUSE, DELTA) and plan.previous is not None:
+            # The hits still cover the previous turn's topic
+            turn.topic_terms |= plan.previous.topic_terms
+            if plan.action == REUSE:
+                turn.reuses = plan.previous.reuses + 1
+        self._turns[section] = turn
+
+    def forget(self, section: Optional[str] = None) -> None:
+        """Drop the remembered context for ``section``, or for every section."""
+        if section is None:
+            self._turns.clear()
+        else:
+            self._turns.pop(section, None)
@@ -0,0 +1,182 @@
+"""
+Persistent chat history.
+
+A ``ConversationStore`` keeps every chat message per user and section in an
+append-only table, indexed by user, section and insertion order, so that a new
+browser session can reload the most recent turns instead of starting empty.
+
+Appends only put the message on an in-memory queue; a background thread writes
+queued messages in batches, so the request path never waits for the database.
+Reads fetch the newest ``limit`` messages through the index, which keeps
+rehydration fast however long a user's history is.
+
+``SQLiteConversationStore`` is the local backend (WAL mode, so reads do not wait
+for the writer). ``SnowflakeConversationStore`` writes the same rows to a
+Snowflake table through a session runner such as ``SessionPool.run``.
+"""
+import abc
+import json
+import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from util.write_behind import BatchWriter, ThreadLocalSQLite
+
+logger = logging.getLogger(__name__)
+
+Message = Dict[str, Any]
+# user_id, section, created_at, role, content, citations (JSON)
+Row = Tuple[str, str, float, str, str, Optional[str]]
+
+
+def _to_row(user_id: str, section: str, message: Message, created_at: float) -> Row:
+    citations = message.get("citations")
+    return (user_id, section, created_at, message["role"], message["content"], json.dumps(citations) if citations else None)
+
+
+def _to_message(role: str, content: str, citations: Optional[str]) -> Message:
+    message = {"role": role, "content": content}
+    if citations:
+        message["citations"] = json.loads(citations)
+    return message
+
+
+class ConversationStore(abc.ABC):
+    """
+    Append-only chat message store with batched background writes.
+
+    Subclasses implement ``_write_rows`` and ``recent``.
+    """
+
+    def __init__(self, batch_size: int = 100, flush_interval: float = 0.5, queue_size: int = 10000):
+        """
+        Start the background writer.
+
+        Args:
+            batch_size: Most messages written in one batch
+            flush_interval: Longest time, in seconds, a queued message waits before it is written
+            queue_size: Messages queued before ``append`` drops new ones
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._counters = {"queued": 0, "written": 0, "dropped": 0, "failed": 0, "batches": 0}
+        self._writer = BatchWriter(self._write_batch, "conversation-store", batch_size, flush_interval, queue_size)
+
+    def append(self, user_id: str, section: str, message: Message) -> bool:
+        """Queue ``message`` for writing; returns False if the queue is full and it was dropped."""
+        if not self._writer.submit(_to_row(user_id, section, message, time.time())):
+            self._counters["dropped"] += 1
+            if self._counters["dropped"] % 1000 == 1:
+                logger.warning("Conversation store queue full, %d messages dropped so far", self._counters["dropped"])
+            return False
+        self._counters["queued"] += 1
+        return True
+
+    @abc.abstractmethod
+    def recent(self, user_id: str, section: str, limit: int) -> List[Message]:
+        """Return the user's newest ``limit`` messages in ``section``, oldest first."""
+
+    @abc.abstractmethod
+    def _write_rows(self, rows: Sequence[Row]) -> None:
+        """Insert ``rows``; runs on the writer thread."""
+
+    def _write_batch(self, rows: List[Row]) -> None:
+        try:
+            self._write_rows(rows)
+            self._counters["written"] += len(rows)
+            self._counters["batches"] += 1
+        except Exception as e:
+            self._counters["failed"] += len(rows)
+            logger.error("Could not write %d chat messages: %s", len(rows), e)
+
+    def flush(self) -> None:
+        """Block until every queued message has been written."""
+        self._writer.flush()
+
+    def stats(self) -> Dict[str, int]:
+        """Return queued, written, dropped and failed message counts and the batch count."""
+        return {**self._counters, "pending": self._writer.pending}
+
+    def close(self) -> None:
+        """Write the queued messages and stop the writer."""
+        self._writer.close()
+
+
+class SQLiteConversationStore(ConversationStore):
+    """Conversation store in a local SQLite database in WAL mode."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS chat_messages (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            section TEXT NOT NULL,
+            created_at REAL NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            citations TEXT
+        );
+        CREATE INDEX IF NOT EXISTS chat_messages_user_section ON chat_messages (user_id, section, id);
+        CREATE INDEX IF NOT EXISTS chat_messages_user_time ON chat_messages (user_id, created_at);
+    """
+
+    def __init__(self, path: str, **kwargs):
+        """
+        Open (and create) the database at ``path``; ``kwargs`` configure the batched writer.
+        """
+        self.path = path
+        self._db = ThreadLocalSQLite(path, self.SCHEMA)
+        super().__init__(**kwargs)
+
+    def _write_rows(self, rows: Sequence[Row]) -> None:
+        connection = self._db.connection()
+        with connection:
+            connection.executemany(
+                "INSERT INTO chat_messages (user_id, section, created_at, role, content, citations) VALUES (?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+
+    def recent(self, user_id: str, section: str, limit: int) -> List[Message]:
+        rows = (
+            self._db.connection()
+            .execute(
+                "SELECT role, content, citations FROM chat_messages WHERE user_id = ? AND section = ? ORDER BY id DESC LIMIT ?",
+                (user_id, section, limit),
+            )
+            .fetchall()
+        )
+        return [_to_message(*row) for row in reversed(rows)]
+
+
+class SnowflakeConversationStore(ConversationStore):
+    """
+    Conversation store in a Snowflake table.
+
+    ``run`` executes a callable with a Snowpark session, e.g. ``SessionPool.run``.
+    The table is created if missing and clustered by user and section.
+    """
+
+    def __init__(self, run: Callable[[Callable[[Any], Any]], Any], table: str = "CHAT_MESSAGES", **kwargs):
+        self.run = run
+        self.table = table
+        self.run(
+            lambda session: session.sql(
+                f"CREATE TABLE IF NOT EXISTS {table} (USER_ID STRING, SECTION STRING, CREATED_AT FLOAT, "
+                "ROLE STRING, CONTENT STRING, CITATIONS STRING) CLUSTER BY (USER_ID, SECTION)"
+            ).collect()
+        )
+        super().__init__(**kwargs)
+
+    def _write_rows(self, rows: Sequence[Row]) -> None:
+        placeholders = ", ".join(["(?, ?, ?, ?, ?, ?)"] * len(rows))
+        params = [value for row in rows for value in row]
+        self.run(lambda session: session.sql(f"INSERT INTO {self.table} VALUES {placeholders}", params=params).collect())
+
+    def recent(self, user_id: str, section: str, limit: int) -> List[Message]:
+        rows = self.run(
+            lambda session: session.sql(
+                f"SELECT ROLE, CONTENT, CITATIONS FROM {self.table} WHERE USER_ID = ? AND SECTION = ? "
+                "ORDER BY CREATED_AT DESC LIMIT ?",
+                params=[user_id, section, limit],
+            ).collect()
+        )
+        return [_to_message(row[0], row[1], row[2]) for row in reversed(rows)]
@@ -0,0 +1,204 @@
+"""
+Answer generation off the script thread.
+
+Streamlit reruns the script whenever a widget changes, and a rerun that arrives
+while the script thread is waiting on retrieval and ``Complete`` either loses the
+in-flight answer or starts it again. ``GenerationPool`` runs answer generation on
+a bounded process-wide thread pool instead: a submit returns a ``GenerationJob``
+that the session keeps in its state and polls on every rerun until the answer is
+ready, and submitting the same key again while a job is in flight returns that
+job rather than starting a second one. The pool size caps the number of answers,
+and so of Cortex calls, generated at once by the process.
+
+Jobs that arrive while every worker is busy wait in a ``util.admission``
+queue, which runs short follow-ups first, reports each job's place in line and
+sheds new jobs with ``OverloadedError`` once it is full.
+"""
+import logging
+import threading
+import time
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
+from concurrent.futures import wait as wait_futures
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from util.admission import AdmissionQueue, OverloadedError
+
+logger = logging.getLogger(__name__)
+
+_current_job: "ContextVar[Optional[GenerationJob]]" = ContextVar("current_generation_job", default=None)
+
+
+def current_job() -> Optional["GenerationJob"]:
+    """Return the job being generated on this thread, or None on the script thread."""
+    return _current_job.get()
+
+
+class GenerationJob:
+    """Handle of a submitted generation, kept by the session across reruns."""
+
+    __slots__ = ("key", "future", "submitted_at", "started_at", "finished_at", "errors", "trace", "call")
+
+    def __init__(self, key: Hashable):
+        self.key = key
+        self.future: Future = Future()
+        self.submitted_at = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        # Failures the generation handled itself, to be shown by the session
+        self.errors: List[str] = []
+        self.trace: Any = None
+        self.call: Optional[Callable[[], Any]] = None
+
+    def done(self) -> bool:
+        return self.future.done()
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Wait up to ``timeout`` seconds for the job to finish; returns whether it has."""
+        wait_futures([self.future], timeout)
+        return self.future.done()
+
+    def result(self, timeout: Optional[float] = None) -> Any:
+        """Return the generation's result, raising its exception if it failed."""
+        return self.future.result(timeout)
+
+    @property
+    def elapsed(self) -> float:
+        """Seconds since the job was submitted, or its total time once finished."""
+        return (self.finished_at or time.monotonic()) - self.submitted_at
+
+    @property
+    def queue_seconds(self) -> float:
+        """Seconds the job waited for a worker."""
+        return (self.started_at or time.monotonic()) - self.submitted_at
+
+    def __repr__(self) -> str:
+        state = "done" if self.done() else "running" if self.started_at else "queued"
+        return f"GenerationJob({self.key!r}, {state}, {self.elapsed:.1f}s)"
+
+
+class GenerationPool:
+    """Runs generations on a bounded thread pool, one job per in-flight key."""
+
+    def __init__(
+        self,
+        max_workers: int = 8,
+        max_queue: int = 32,
+        priority_burst: int = 3,
+        max_queue_seconds: Optional[float] = None,
+    ):
+        """
+        Initialize the pool.
+
+        Args:
+            max_workers: Generations run at once; further submits wait for a worker
+            max_queue: Jobs that may wait for a worker; further submits are shed
+            priority_burst: Priority jobs started in a row while regular jobs wait
+            max_queue_seconds: Jobs still waiting after this long fail with
+                ``OverloadedError`` instead of starting; None waits indefinitely
+        """
+        self.max_workers = max_workers
+        self.max_queue_seconds = max_queue_seconds
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="generation")
+        self._queue = AdmissionQueue(max_queue, priority_burst)
+        self._in_flight: Dict[Hashable, GenerationJob] = {}
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def submit(self, key: Hashable, fn: Callable[..., Any], *args: Any, priority: bool = False, **kwargs: Any) -> GenerationJob:
+        """
+        Queue ``fn(*args, **kwargs)`` for a worker, unless a job for ``key`` is already in flight.
+
+        Args:
+            key: Identifies the generation, e.g. session, section and normalized question
+            fn: Produces the result; ``current_job()`` returns the job while it runs
+            priority: Start ahead of regular jobs, e.g. for a short follow-up question
+
+        Returns:
+            The new job, or the in-flight job with the same key
+
+        Raises:
+            OverloadedError: If the admission queue is full
+        """
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None:
+                self._counters["deduplicated"] += 1
+                return job
+            job = GenerationJob(key)
+            job.call = lambda: fn(*args, **kwargs)
+            self._queue.put(job, priority)
+            self._in_flight[key] = job
+            self._counters["submitted"] += 1
+        # Each worker task starts whichever job is next in line when a worker frees up
+        self._executor.submit(self._run_next)
+        return job
+
+    def accepting(self) -> bool:
+        """Return whether a submit would currently be queued rather than shed."""
+        with self._lock:
+            return not self._queue.full()
+
+    def position(self, job: GenerationJob) -> int:
+        """Return the job's 1-based place in line for a worker, or 0 once it has started."""
+        with self._lock:
+            return self._queue.position(job) if job.started_at is None else 0
+
+    def _run_next(self) -> None:
+        with self._lock:
+            job = self._queue.take()
+        if job is None:
+            return
+        job.started_at = time.monotonic()
+        if self.max_queue_seconds is not None and job.queue_seconds > self.max_queue_seconds:
+            self._finish(job, "expired")
+            job.future.set_exception(OverloadedError(f"Waited {job.queue_seconds:.1f}s for a generation worker"))
+            return
+        self._run(job)
+
+    def _run(self, job: GenerationJob) -> None:
+        token = _current_job.set(job)
+        try:
+            result = job.call()
+        except Exception as e:
+            logger.error("Generation %r failed: %s", job.key, e)
+            self._finish(job, "failed")
+            job.future.set_exception(e)
+        else:
+            self._finish(job, "completed")
+            job.future.set_result(result)
+        finally:
+            _current_job.reset(token)
+
+    def _finish(self, job: GenerationJob, outcome: str) -> None:
+        # Forget the key before waiters wake, so a resubmit after completion starts a new job
+        job.finished_at = time.monotonic()
+        job.call = None
+        with self._lock:
+            if self._in_flight.get(job.key) is job:
+                del self._in_flight[job.key]
+            self._counters[outcome] += 1
+
+    def in_flight(self) -> int:
+        """Number of jobs waiting or running."""
+        with self._lock:
+            return len(self._in_flight)
+
+    def stats(self) -> Dict[str, int]:
+        """Return job counts by outcome, the jobs in flight and the jobs waiting for a worker."""
+        with self._lock:
+            return {
+                "submitted": self._counters["submitted"],
+                "deduplicated": self._counters["deduplicated"],
+                "completed": self._counters["completed"],
+                "failed": self._counters["failed"],
+                "expired": self._counters["expired"],
+                "shed": self._queue.stats()["shed"],
+                "in_flight": len(self._in_flight),
+                "waiting": len(self._queue),
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work and optionally wait for running generations."""
+        self._executor.shutdown(wait=wait)
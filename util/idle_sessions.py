@@ -0,0 +1,155 @@
+"""
+Idle browser session reaping.
+
+Streamlit keeps a session's state until its websocket is dropped, so abandoned
+tabs hold on to Snowpark sessions, chat histories and cached metadata. An
+``IdleSessionManager`` records when each session last ran the script and, once a
+session has been idle for ``idle_timeout`` seconds, marks it released.
+
+Sessions are tracked by id only: the reaper never touches a session's state,
+which belongs to the session's own script thread. Instead the session's next
+``touch`` reports the release and runs a release callback there, which frees what
+can be rebuilt and returns the bytes reclaimed. Sessions that ``is_active``
+reports as gone, e.g. closed tabs whose state Streamlit has discarded, are
+forgotten on the next pass.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class ReapReport:
+    """Outcome of one reaping pass."""
+
+    __slots__ = ("sessions", "seconds")
+
+    def __init__(self, sessions: int = 0, seconds: float = 0.0):
+        self.sessions = sessions
+        self.seconds = seconds
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"sessions": self.sessions, "seconds": round(self.seconds, 3)}
+
+
+class _TrackedSession:
+    __slots__ = ("last_active", "released")
+
+    def __init__(self, last_active: float):
+        self.last_active = last_active
+        self.released = False
+
+
+class IdleSessionManager:
+    """Tracks per-session activity and marks idle sessions for release."""
+
+    def __init__(
+        self,
+        is_active: Callable[[str], bool],
+        idle_timeout: float = 1800.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        """
+        Initialize the manager.
+
+        Args:
+            is_active: Returns False for a session id whose session has been discarded
+            idle_timeout: Seconds without a script run before a session is released
+            clock: Monotonic time source
+        """
+        self.is_active = is_active
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        self._sessions: Dict[str, _TrackedSession] = {}
+        self._lock = threading.Lock()
+        self._totals = {"released": 0, "bytes_reclaimed": 0, "passes": 0}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self, session_id: str, release: Optional[Callable[[], int]] = None) -> int:
+        """
+        Record activity in a session and return the bytes its release reclaimed, if it was released.
+
+        Args:
+            session_id: Id of the session running the script
+            release: Called, on the calling thread, if the session was released while idle;
+                frees what it can of the session's state and returns the approximate bytes reclaimed
+        """
+        now = self.clock()
+        with self._lock:
+            tracked = self._sessions.get(session_id)
+            if tracked is None:
+                self._sessions[session_id] = _TrackedSession(now)
+                return 0
+            tracked.last_active = now
+            released, tracked.released = tracked.released, False
+        if not released or release is None:
+            return 0
+
+        try:
+            reclaimed = release() or 0
+        except Exception as e:
+            logger.warning("Could not release idle session %s: %s", session_id, e)
+            return 0
+        with self._lock:
+            self._totals["bytes_reclaimed"] += reclaimed
+        return reclaimed
+
+    def reap(self) -> ReapReport:
+        """Mark every session idle for longer than ``idle_timeout`` released and forget discarded ones."""
+        start = self.clock()
+        with self._lock:
+            tracked_ids = list(self._sessions)
+        gone = [session_id for session_id in tracked_ids if not self._session_active(session_id)]
+
+        report = ReapReport()
+        with self._lock:
+            for session_id in gone:
+                self._sessions.pop(session_id, None)
+            # Checked and marked under the lock, so a session touched meanwhile is never released
+            now = self.clock()
+            for tracked in self._sessions.values():
+                if not tracked.released and now - tracked.last_active > self.idle_timeout:
+                    tracked.released = True
+                    report.sessions += 1
+            self._totals["released"] += report.sessions
+            self._totals["passes"] += 1
+        report.seconds = self.clock() - start
+
+        if report.sessions:
+            logger.info("Marked %d idle sessions for release", report.sessions)
+        return report
+
+    def _session_active(self, session_id: str) -> bool:
+        try:
+            return self.is_active(session_id)
+        except Exception as e:
+            # Keep tracking rather than forget a session that may still be open
+            logger.warning("Could not check whether session %s is active: %s", session_id, e)
+            return True
+
+    def start(self, interval: float = 60.0) -> None:
+        """Reap every ``interval`` seconds on a daemon thread; a no-op if already running."""
+        if self._thread is not None and self._thread.is_alive():
+            return
+
+        def loop():
+            while not self._stop.wait(interval):
+                self.reap()
+
+        self._thread = threading.Thread(target=loop, name="idle-session-reaper", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        """Return tracked, idle and released session counts and the bytes reclaimed so far."""
+        with self._lock:
+            return {
+                "tracked": len(self._sessions),
+                "idle": sum(1 for tracked in self._sessions.values() if tracked.released),
+                **self._totals,
+            }
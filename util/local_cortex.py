@@ -0,0 +1,293 @@
+"""
+Offline stand-in for Snowflake Cortex.
+
+``LocalCortex`` fakes the three Snowflake entry points used by the app, the
+evaluator and the benchmarks, with no network:
+
+* ``Session``: ``Session.builder.configs(params).create()`` returns a
+  ``LocalSession``, which records SQL statements and returns no rows.
+* ``Root``: ``Root(session).databases[db].schemas[schema].cortex_search_services[name]``
+  returns a ``util.local_search.LocalCortexSearchService`` over a local corpus.
+* ``Complete``: ``Complete(model, prompt, session=..., stream=False)`` returns text
+  derived deterministically from the model and prompt after a simulated time to
+  first token plus ``tokens_per_second`` generation time, or with ``stream=True``
+  an iterator of text chunks paced the same way; ``error_rate`` of the calls raise
+  ``LocalCortexError``.
+
+``install`` registers modules exposing these names as ``snowflake.core``,
+``snowflake.cortex`` and ``snowflake.snowpark`` in ``sys.modules``, so code that
+imports Snowflake lazily runs against the stand-in unchanged. Latencies and
+failures come from a seeded generator, so runs are reproducible.
+"""
+import hashlib
+import json
+import logging
+import random
+import sys
+import threading
+import time
+import types
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Sequence, Tuple, Union
+
+from util.local_search import LocalCortexSearchService
+from util.terms import key_terms
+
+logger = logging.getLogger(__name__)
+
+SECTIONS = ["financial_literacy", "investment", "ai_agents"]
+AUDIENCES = ["Conservative", "Moderate", "Moderately Aggressive"]
+TOPICS = ["House Down Payment", "Retirement", "Education", "Emergency Fund", "Wealth Building"]
+VOCABULARY = (
+    "budget savings interest compound credit debt loan mortgage retirement pension index fund stock bond etf "
+    "dividend inflation risk return portfolio diversification tax emergency insurance income expense allocation "
+    "equity growth value volatility horizon liquidity annuity brokerage account score rate fee"
+).split()
+
+MODULE_NAMES = ("snowflake", "snowflake.core", "snowflake.cortex", "snowflake.snowpark", "snowflake.snowpark.session")
+
+
+class LocalCortexError(RuntimeError):
+    """Raised by a stand-in call chosen to fail, or made on a closed session."""
+
+
+def make_corpus(rows: int, seed: int = 0) -> List[Dict[str, str]]:
+    """Generate a deterministic corpus of chunks tagged with attribute columns."""
+    rng = random.Random(seed)
+    return [
+        {
+            "CHUNK": " ".join(rng.choices(VOCABULARY, k=60)),
+            "section": rng.choice(SECTIONS),
+            "audience": rng.choice(AUDIENCES),
+            "topic": rng.choice(TOPICS),
+            "source": f"doc-{rng.randrange(500)}",
+        }
+        for _ in range(rows)
+    ]
+
+
+def load_corpus(path: str) -> List[Dict[str, Any]]:
+    """Read a corpus from a JSON lines file with one row, e.g. ``{"CHUNK": ...}``, per line."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+class LocalDataFrame:
+    """Result of ``LocalSession.sql``."""
+
+    def __init__(self, rows: Sequence[Any] = ()):
+        self._rows = list(rows)
+
+    def collect(self) -> List[Any]:
+        return list(self._rows)
+
+
+class LocalSession:
+    """Snowpark session stand-in; statements are recorded and return no rows."""
+
+    def __init__(self, configs: Optional[Mapping[str, Any]] = None):
+        self.configs = dict(configs or {})
+        self.queries: List[str] = []
+        self.closed = False
+
+    def sql(self, query: str, params: Optional[Sequence[Any]] = None) -> LocalDataFrame:
+        if self.closed:
+            raise LocalCortexError("Session is closed")
+        self.queries.append(query)
+        return LocalDataFrame()
+
+    def close(self) -> None:
+        self.closed = True
+
+
+class _SessionBuilder:
+    def __init__(self, cortex: "LocalCortex"):
+        self._cortex = cortex
+        self._configs: Dict[str, Any] = {}
+
+    def configs(self, options: Mapping[str, Any]) -> "_SessionBuilder":
+        self._configs.update(options)
+        return self
+
+    def create(self) -> LocalSession:
+        return self._cortex.create_session(self._configs)
+
+
+class _SessionClass:
+    """The ``Session`` name of the stand-in modules: ``Session.builder`` returns a new builder."""
+
+    def __init__(self, cortex: "LocalCortex"):
+        self._cortex = cortex
+
+    @property
+    def builder(self) -> _SessionBuilder:
+        return _SessionBuilder(self._cortex)
+
+
+class _Lookup:
+    """Read-only collection resolving items by name, like the ``snowflake.core`` collections."""
+
+    def __init__(self, resolve):
+        self._resolve = resolve
+
+    def __getitem__(self, name: str) -> Any:
+        return self._resolve(name)
+
+
+class LocalRoot:
+    """``snowflake.core.Root`` stand-in resolving every database and schema to the local services."""
+
+    def __init__(self, cortex: "LocalCortex", session: Any = None):
+        self.session = session
+        schema = types.SimpleNamespace(cortex_search_services=_Lookup(cortex.service))
+        database = types.SimpleNamespace(schemas=_Lookup(lambda name: schema))
+        self.databases = _Lookup(lambda name: database)
+
+
+class LocalCortex:
+    """Offline Cortex Search and ``Complete`` with configurable latency, token rate and failures."""
+
+    def __init__(
+        self,
+        corpus: Optional[Sequence[Mapping[str, Any]]] = None,
+        services: Optional[Mapping[str, Sequence[Mapping[str, Any]]]] = None,
+        search_latency: float = 0.0,
+        latency: float = 0.0,
+        latency_sigma: float = 0.0,
+        tokens_per_second: float = 0.0,
+        answer_tokens: int = 60,
+        error_rate: float = 0.0,
+        seed: int = 0,
+    ):
+        """
+        Initialize the stand-in.
+
+        Args:
+            corpus: Rows searched by every service not in ``services``; a synthetic
+                corpus of 1000 rows by default
+            services: Rows searched by specific service names
+            search_latency: Simulated round trip per search, in seconds
+            latency: Median time to first token of ``Complete``, in seconds
+            latency_sigma: Spread of the time to first token (log-normal sigma), 0 for fixed
+            tokens_per_second: Generation rate after the first token, 0 for instant
+            answer_tokens: Words in each generated answer
+            error_rate: Fraction of ``Complete`` calls that raise ``LocalCortexError``
+            seed: Seed of the latency and failure draws
+        """
+        self.search_latency = search_latency
+        self.latency = latency
+        self.latency_sigma = latency_sigma
+        self.tokens_per_second = tokens_per_second
+        self.answer_tokens = answer_tokens
+        self.error_rate = error_rate
+        self._default = LocalCortexSearchService(make_corpus(1000, seed) if corpus is None else corpus, latency=search_latency)
+        self._services = {name: LocalCortexSearchService(rows, latency=search_latency) for name, rows in (services or {}).items()}
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counters = Counter()
+        self.Session = _SessionClass(self)
+
+    def service(self, name: str) -> LocalCortexSearchService:
+        """Return the search service ``name``."""
+        return self._services.get(name, self._default)
+
+    def create_session(self, configs: Optional[Mapping[str, Any]] = None) -> LocalSession:
+        self._counters["sessions"] += 1
+        return LocalSession(configs)
+
+    def Root(self, session: Any = None) -> LocalRoot:
+        return LocalRoot(self, session)
+
+    def answer(self, model: str, prompt: Union[str, Sequence[Mapping[str, str]]]) -> str:
+        """Return the deterministic answer of ``model`` to ``prompt``, built from the prompt's key terms."""
+        text = prompt if isinstance(prompt, str) else " ".join(message.get("content", "") for message in prompt)
+        rng = random.Random(hashlib.sha256(f"{model}\0{text}".encode("utf-8")).digest())
+        words = rng.choices(key_terms(text, limit=20) + VOCABULARY, k=self.answer_tokens)
+        sentences = [" ".join(words[start : start + 12]) for start in range(0, len(words), 12)]
+        return " ".join(sentence.capitalize() + "." for sentence in sentences)
+
+    def _draw(self) -> Tuple[float, bool]:
+        """Count a completion and return its time to first token and whether it fails."""
+        with self._lock:
+            delay = self.latency * (self._rng.lognormvariate(0, self.latency_sigma) if self.latency_sigma else 1)
+            failed = self._rng.random() < self.error_rate
+            self._counters["completions"] += 1
+            self._counters["errors"] += failed
+        return delay, failed
+
+    def Complete(
+        self,
+        model: str,
+        prompt: Union[str, Sequence[Mapping[str, str]]],
+        session: Any = None,
+        stream: bool = False,
+        options: Any = None,
+    ) -> Union[str, Iterator[str]]:
+        """
+        Generate an answer like ``snowflake.cortex.Complete``.
+
+        Returns:
+            The answer, or with ``stream`` an iterator of its words
+
+        Raises:
+            LocalCortexError: If the session is closed or the call is chosen to fail;
+                streamed calls fail when iterated
+        """
+        if getattr(session, "closed", False):
+            raise LocalCortexError("Session is closed")
+        delay, failed = self._draw()
+        answer = self.answer(model, prompt)
+        if stream:
+            return self._stream(model, answer, delay, failed)
+        time.sleep(delay)
+        if failed:
+            raise LocalCortexError(f"Simulated Cortex failure for {model}")
+        if self.tokens_per_second:
+            time.sleep(len(answer.split()) / self.tokens_per_second)
+        return answer
+
+    def _stream(self, model: str, answer: str, delay: float, failed: bool) -> Iterator[str]:
+        time.sleep(delay)
+        if failed:
+            raise LocalCortexError(f"Simulated Cortex failure for {model}")
+        words = answer.split(" ")
+        for position, word in enumerate(words):
+            if position and self.tokens_per_second:
+                time.sleep(1 / self.tokens_per_second)
+            yield word if position == len(words) - 1 else word + " "
+
+    def stats(self) -> Dict[str, int]:
+        """Return sessions opened, completions, failed completions and searches."""
+        return {
+            "sessions": self._counters["sessions"],
+            "completions": self._counters["completions"],
+            "errors": self._counters["errors"],
+            "searches": self._default.calls + sum(service.calls for service in self._services.values()),
+        }
+
+    def modules(self) -> Dict[str, types.ModuleType]:
+        """Return stand-in Snowflake modules by import name."""
+        modules = {name: types.ModuleType(name) for name in MODULE_NAMES}
+        modules["snowflake"].__path__ = []
+        modules["snowflake"].core = modules["snowflake.core"]
+        modules["snowflake"].cortex = modules["snowflake.cortex"]
+        modules["snowflake"].snowpark = modules["snowflake.snowpark"]
+        modules["snowflake.snowpark"].__path__ = []
+        modules["snowflake.snowpark"].session = modules["snowflake.snowpark.session"]
+        modules["snowflake.core"].Root = self.Root
+        modules["snowflake.cortex"].Complete = self.Complete
+        for name in ("snowflake.snowpark", "snowflake.snowpark.session"):
+            modules[name].Session = self.Session
+        modules["snowflake.snowpark"].get_active_session = self.create_session
+        return modules
+
+
+def install(cortex: LocalCortex) -> LocalCortex:
+    """
+    Make ``cortex`` the target of later Snowflake imports in this process.
+
+    Modules that already imported Snowflake names keep them.
+    """
+    sys.modules.update(cortex.modules())
+    logger.info("Snowflake Cortex calls go to the local stand-in")
+    return cortex
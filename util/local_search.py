@@ -0,0 +1,135 @@
+"""
+In-process stand-in for a Cortex Search service.
+
+``LocalCortexSearchService`` exposes the same ``search(query, columns, filter, limit)``
+call as ``snowflake.core`` search service handles, over a list of rows held in
+memory. Filters are applied before scoring, the way the real service narrows its
+candidate set, so it can be used to benchmark and test filter pushdown offline.
+"""
+import logging
+import time
+from collections import Counter, defaultdict
+from typing import Any, Dict, List, Mapping, Optional, Sequence, Set
+
+from util.search_filters import matches_filter
+from util.terms import tokenize
+
+logger = logging.getLogger(__name__)
+
+
+class LocalSearchResponse:
+    """Search response with the ``results`` attribute the app reads."""
+
+    def __init__(self, results: List[Dict[str, Any]]):
+        self.results = results
+
+    def __repr__(self) -> str:
+        return f"LocalSearchResponse(results={len(self.results)})"
+
+
+class LocalCortexSearchService:
+    """Keyword-scored search over in-memory rows with attribute filtering."""
+
+    def __init__(
+        self,
+        rows: Sequence[Mapping[str, Any]],
+        search_column: str = "CHUNK",
+        attributes: Sequence[str] = (),
+        latency: float = 0.0,
+        per_result_latency: float = 0.0,
+    ):
+        """
+        Initialize the service with its corpus.
+
+        Args:
+            rows: Documents, each a mapping with ``search_column`` and attribute columns
+            search_column: Column holding the searchable text
+            attributes: Attribute columns to index for fast equality filtering
+            latency: Simulated fixed round-trip time per call, in seconds
+            per_result_latency: Simulated transfer time per returned row, in seconds
+        """
+        self._rows = [dict(row) for row in rows]
+        self._search_column = search_column
+        self._latency = latency
+        self._per_result_latency = per_result_latency
+        self._term_counts = [Counter(tokenize(row.get(search_column, ""))) for row in self._rows]
+        self._index: Dict[str, Dict[Any, Set[int]]] = {}
+        for attribute in attributes:
+            postings: Dict[Any, Set[int]] = defaultdict(set)
+            for row_id, row in enumerate(self._rows):
+                postings[row.get(attribute)].add(row_id)
+            self._index[attribute] = postings
+        self.calls = 0
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def _candidates(self, filter: Optional[Mapping[str, Any]]) -> Optional[Set[int]]:
+        """Resolve a filter to candidate row ids using the attribute index, or None if it cannot."""
+        if not filter:
+            return None
+        if len(filter) != 1:
+            return None
+
+        operator, operand = next(iter(filter.items()))
+        if operator == "@eq" and len(operand) == 1:
+            attribute, value = next(iter(operand.items()))
+            if attribute in self._index:
+                return set(self._index[attribute].get(value, ()))
+            return None
+        if operator in ("@and", "@or"):
+            resolved = [self._candidates(clause) for clause in operand]
+            if operator == "@and":
+                # Intersect the indexed clauses; unindexed ones are checked per row
+                indexed = [ids for ids in resolved if ids is not None]
+                if not indexed:
+                    return None
+                return set.intersection(*indexed)
+            if any(ids is None for ids in resolved):
+                return None
+            return set().union(*resolved)
+        return None
+
+    def search(
+        self,
+        query: str,
+        columns: Sequence[str],
+        filter: Optional[Mapping[str, Any]] = None,
+        limit: int = 10,
+    ) -> LocalSearchResponse:
+        """
+        Search the corpus.
+
+        Args:
+            query: Natural language query
+            columns: Columns to return for each result
+            filter: Cortex Search filter expression applied before scoring
+            limit: Maximum number of results
+
+        Returns:
+            Response whose ``results`` are dicts of the requested columns
+        """
+        self.calls += 1
+        query_terms = set(tokenize(query))
+
+        candidates = self._candidates(filter)
+        row_ids = range(len(self._rows)) if candidates is None else sorted(candidates)
+
+        scored = []
+        for row_id in row_ids:
+            if filter and not matches_filter(self._rows[row_id], filter):
+                continue
+            counts = self._term_counts[row_id]
+            score = sum(counts[term] for term in query_terms)
+            if score:
+                scored.append((-score, row_id))
+
+        scored.sort()
+        results = [{column: self._rows[row_id].get(column) for column in columns} for _, row_id in scored[:limit]]
+
+        delay = self._latency + self._per_result_latency * len(results)
+        if delay > 0:
+            time.sleep(delay)
+
+        logger.debug("Local search scanned %d rows, returned %d", len(row_ids), len(results))
+        return LocalSearchResponse(results)
@@ -0,0 +1,285 @@
+"""
+In-process metrics with a Prometheus text endpoint.
+
+``MetricsRegistry`` holds counters, gauges and fixed-bucket histograms. Updating
+a metric takes one short per-metric lock: a dictionary lookup and a few additions,
+cheap enough for every request path. Gauges can instead read their value from a
+callback when scraped. ``start_http_server`` serves the registry in the Prometheus
+text exposition format on a background thread. ``TraceMetrics`` turns finished
+request traces from ``util.tracing`` into request rate, stage latency, error and
+message-store size metrics.
+"""
+import bisect
+import logging
+import math
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, from a cache hit to a slow completion
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# Chat history lengths, in messages
+MESSAGE_BUCKETS = (10, 25, 50, 100, 250, 500, 1000)
+
+LabelValues = Tuple[str, ...]
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    """Render a Prometheus label set, e.g. ``{stage="complete",le="0.5"}``."""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    """Base class holding the name, help text, label names and lock."""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    """Monotonically increasing count."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: str) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Gauge(_Metric):
+    """Value that goes up and down, either set directly or read from ``func`` at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), func: Optional[Callable[[], float]] = None):
+        super().__init__(name, help, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self._func = func
+
+    def set(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: str) -> None:
+        self.inc(-amount, **labels)
+
+    def set_function(self, func: Callable[[], float]) -> None:
+        """Read the (unlabelled) value from ``func`` whenever the gauge is scraped."""
+        self._func = func
+
+    def value(self, **labels: str) -> float:
+        if self._func is not None:
+            return float(self._func())
+        return self._values.get(self._key(labels), 0.0)
+
+    def samples(self) -> List[str]:
+        if self._func is not None:
+            try:
+                return [f"{self.name} {_format_value(self._func())}"]
+            except Exception as e:
+                logger.warning("Gauge %s callback failed: %s", self.name, e)
+                return []
+        with self._lock:
+            values = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in values]
+
+
+class Histogram(_Metric):
+    """Observations counted into fixed cumulative buckets, with their sum and count."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: bucket counts (last is +Inf), sum
+        self._series: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = ([0] * (len(self.buckets) + 1), [0.0])
+            series[0][index] += 1
+            series[1][0] += value
+
+    def count(self, **labels: str) -> int:
+        series = self._series.get(self._key(labels))
+        return sum(series[0]) if series else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            series = [(key, list(counts), total[0]) for key, (counts, total) in self._series.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (math.inf,), counts):
+                cumulative += count
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named collection of metrics rendered together."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric):
+                    raise ValueError(f"Metric {metric.name} is already registered as a {existing.kind}")
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        """Return the counter ``name``, creating it on first use."""
+        return self._register(Counter(name, help, labelnames))
+
+    def gauge(self, name: str, help: str, labelnames: Sequence[str] = (), func: Optional[Callable[[], float]] = None) -> Gauge:
+        """Return the gauge ``name``, creating it on first use."""
+        gauge = self._register(Gauge(name, help, labelnames, func))
+        if func is not None:
+            gauge.set_function(func)
+        return gauge
+
+    def histogram(
+        self, name: str, help: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS
+    ) -> Histogram:
+        """Return the histogram ``name``, creating it on first use."""
+        return self._register(Histogram(name, help, labelnames, buckets))
+
+    def get(self, name: str) -> Optional[_Metric]:
+        return self._metrics.get(name)
+
+    def render(self) -> str:
+        """Return every metric in the Prometheus text exposition format."""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class TraceMetrics:
+    """Records request, stage latency, error and history size metrics from finished request traces."""
+
+    def __init__(self, registry: MetricsRegistry):
+        self.requests = registry.counter("app_requests_total", "Chat requests handled", ["section"])
+        self.request_seconds = registry.histogram("app_request_duration_seconds", "Chat request latency", ["section"])
+        self.stage_seconds = registry.histogram("app_stage_duration_seconds", "Pipeline stage latency", ["stage"])
+        self.errors = registry.counter("app_stage_errors_total", "Pipeline stages that failed", ["stage"])
+        self.cache = registry.counter("app_retrieval_cache_lookups_total", "Retrieval cache lookups", ["outcome"])
+        self.stored_messages = registry.histogram(
+            "app_session_messages", "Messages held in a session's chat history per request", buckets=MESSAGE_BUCKETS
+        )
+
+    def __call__(self, trace) -> None:
+        """Record one finished trace; used as a tracer listener."""
+        section = str(trace.root.attributes.get("section", "unknown"))
+        self.requests.inc(section=section)
+        self.request_seconds.observe(trace.root.duration_ms / 1000, section=section)
+        stored = trace.root.attributes.get("stored_messages")
+        if stored is not None:
+            self.stored_messages.observe(stored)
+        for span in trace.spans:
+            if span is not trace.root:
+                self.stage_seconds.observe(span.duration_ms / 1000, stage=span.name)
+            if "error" in span.attributes:
+                self.errors.inc(stage=span.name)
+            outcome = span.attributes.get("cache")
+            if outcome is not None:
+                self.cache.inc(outcome=str(outcome))
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry: MetricsRegistry
+
+    def do_GET(self) -> None:
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        logger.debug("metrics endpoint: " + format, *args)
+
+
+def start_http_server(registry: MetricsRegistry, port: int = 9464, address: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """
+    Serve ``registry`` at ``http://address:port/metrics`` on a daemon thread.
+
+    Returns:
+        The running server; call ``shutdown`` to stop it
+    """
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((address, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logger.info("Serving metrics on http://%s:%d/metrics", address, server.server_address[1])
+    return server
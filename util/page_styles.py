@@ -0,0 +1,196 @@
+"""
+Page stylesheets.
+
+Streamlit re-executes the whole script on every interaction and removes any
+element a rerun does not emit again, so page CSS has to be sent on each rerun.
+To keep that cheap, each page's style blocks are merged, minified and
+de-duplicated once per process into a single ``<style>`` element.
+"""
+import re
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+# Applied to every page
+BASE_CSS = """
+    /* Minimal custom styling */
+    .stButton>button {
+        width: 100%;
+        margin-top: 1rem;
+    }
+    .stForm {
+        padding: 1rem;
+        border-radius: 0.5rem;
+    }
+    /* Hide Streamlit branding */
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+    header {visibility: hidden;}
+"""
+
+# Shared landing and section typography and branding
+THEME_CSS = """
+    /* Center align text and buttons */
+    .stButton>button {
+        width: 100%;
+        margin-top: 1rem;
+        font-weight: bold;
+        border-radius: 0.5rem;
+        padding: 0.5rem 1rem;
+    }
+    /* Hide Streamlit branding */
+    #MainMenu {visibility: hidden;}
+    footer {visibility: hidden;}
+    header {visibility: hidden;}
+    /* Add spacing between sections */
+    .section {
+        margin-bottom: 2rem;
+    }
+    /* Custom font size for headers */
+    h1 {
+        font-size: 2.5rem;
+        text-align: center;
+    }
+    h2 {
+        font-size: 1.8rem;
+        margin-bottom: 1rem;
+    }
+    h3 {
+        font-size: 1.5rem;
+        margin-bottom: 0.5rem;
+    }
+    p {
+        font-size: 1.1rem;
+        line-height: 1.6;
+    }
+"""
+
+LANDING_CSS = """
+    .landing-header {
+        text-align: center;
+        padding: 2rem 0;
+    }
+    .welcome-stats {
+        padding: 1rem;
+        border-radius: 10px;
+        background-color: #FFFFFF;
+        margin: 1rem 0;
+    }
+    /* Landing page buttons */
+    .stButton>button {
+        font-size: 16px;
+        padding: 2px 10px;
+        border-radius: 4px;
+        height: 35px;
+        width: 100%;
+        margin: 0;
+    }
+    .button-col {
+        display: flex;
+        justify-content: center;
+    }
+"""
+
+LANDING_BUTTON_THEME_CSS = """
+    .stButton>button {
+        width: 100%;
+        margin-top: 1rem;
+        background-color: #4B8BBE;
+        color: white;
+        font-weight: bold;
+        border-radius: 0.5rem;
+        padding: 0.5rem 1rem;
+    }
+    .stButton>button:hover {
+        background-color: #306998;
+    }
+"""
+
+MAIN_CSS = """
+    /* Sidebar */
+    .sidebar-button {
+        background-color: #4B8BBE;
+        color: white;
+        border: none;
+        border-radius: 4px;
+        padding: 0.5rem 1rem;
+        margin: 0.5rem 0;
+        width: 100%;
+        text-align: left;
+    }
+    .sidebar .stButton>button {
+        background-color: #4B8BBE;
+        color: white;
+        border: none;
+        border-radius: 4px;
+        padding: 8px 16px;
+        width: 100%;
+        margin: 4px 0;
+        text-align: left;
+        font-size: 16px;
+    }
+    .sidebar .stButton>button:hover {
+        background-color: #3D7BA8;
+        border: none;
+    }
+    /* Investment profile */
+    div[data-testid="stExpander"] div[role="button"] p {
+        font-size: 1.1rem;
+        margin-bottom: 0.5rem;
+    }
+    div.row-widget.stRadio > div {
+        flex-direction: column;
+        gap: 0.5rem;
+    }
+    div.row-widget.stMultiSelect > div {
+        margin-top: 0.5rem;
+    }
+    [data-testid="stSidebarNav"] {
+        background-image: linear-gradient(#4B8BBE, #3D7BA8);
+        color: white;
+        padding: 1rem;
+        margin-top: auto;
+    }
+"""
+
+# Style blocks per page, in cascade order
+PAGE_STYLES: Dict[str, Tuple[str, ...]] = {
+    "landing": (BASE_CSS, THEME_CSS, LANDING_CSS, LANDING_BUTTON_THEME_CSS, THEME_CSS),
+    "main": (BASE_CSS, MAIN_CSS),
+}
+
+_COMMENT = re.compile(r"/\*.*?\*/", re.DOTALL)
+_RULE = re.compile(r"([^{}]+)\{([^{}]*)\}")
+
+
+def minify_css(css: str) -> str:
+    """Strip comments and collapse whitespace around CSS punctuation."""
+    css = _COMMENT.sub("", css)
+    css = re.sub(r"\s+", " ", css)
+    css = re.sub(r"\s*([{};:,>])\s*", r"\1", css)
+    return css.replace(";}", "}").strip()
+
+
+def merge_css(*blocks: str) -> str:
+    """
+    Minify and concatenate style blocks, dropping exact duplicate rules.
+
+    The last copy of a duplicated rule is kept, so the cascade is unchanged. CSS
+    with nested blocks such as ``@media`` is concatenated without de-duplication.
+    """
+    css = "".join(minify_css(block) for block in blocks)
+    rules: List[Tuple[str, str]] = _RULE.findall(css)
+    if "".join(f"{selector}{{{body}}}" for selector, body in rules) != css:
+        return css
+    seen = set()
+    kept = []
+    for rule in reversed(rules):
+        if rule not in seen:
+            seen.add(rule)
+            kept.append(rule)
+    return "".join(f"{selector}{{{body}}}" for selector, body in reversed(kept))
+
+
+@lru_cache(maxsize=None)
+def page_stylesheet(page: str) -> str:
+    """Return the merged ``<style>`` element for ``page``, built once per process."""
+    return f"<style>{merge_css(*PAGE_STYLES.get(page, (BASE_CSS,)))}</style>"
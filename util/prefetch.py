@@ -0,0 +1,184 @@
+"""
+Background prefetch of likely follow-up retrievals.
+
+After an answer is shown, ``FollowUpPredictor`` guesses the next search queries
+from the answer's key terms and from question-to-question transitions observed in
+conversation logs, and ``RetrievalPrefetcher`` runs those searches on a small
+thread pool to warm the retrieval cache before the user asks.
+"""
+import json
+import logging
+import threading
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Set
+
+from util.retrieval_cache import RetrievalCache, normalize_query
+from util.terms import key_terms, stem, term_stems
+
+logger = logging.getLogger(__name__)
+
+
+class FollowUpPredictor:
+    """Predicts follow-up queries from answer terms and popular next questions."""
+
+    def __init__(self, max_next_questions: int = 50, max_questions: int = 10000):
+        """
+        Initialize an empty predictor.
+
+        Args:
+            max_next_questions: Distinct next questions remembered per question
+            max_questions: Questions whose follow-ups are remembered before the least recently used is forgotten
+        """
+        self._max_next_questions = max_next_questions
+        self._max_questions = max_questions
+        self._transitions: "OrderedDict[str, Counter]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def record(self, previous_question: str, next_question: str) -> None:
+        """Record that ``next_question`` was asked right after ``previous_question``."""
+        if not previous_question or not next_question:
+            return
+        key, next_question = normalize_query(previous_question), next_question.strip()
+        with self._lock:
+            counts = self._transitions.get(key)
+            if counts is None:
+                if len(self._transitions) >= self._max_questions:
+                    self._transitions.popitem(last=False)
+                counts = self._transitions[key] = Counter()
+            else:
+                self._transitions.move_to_end(key)
+            if next_question not in counts and len(counts) >= self._max_next_questions:
+                # Make room by dropping the rarest follow-up seen so far, never the new one
+                del counts[min(counts, key=counts.__getitem__)]
+            counts[next_question] += 1
+
+    def load_log(self, path: str) -> int:
+        """
+        Load question transitions from a JSON-lines conversation log.
+
+        Each line is an object with ``session_id`` and ``question`` keys, in the
+        order the questions were asked.
+
+        Returns:
+            Number of transitions recorded
+        """
+        last_question: Dict[str, str] = {}
+        recorded = 0
+        with open(path, encoding="utf-8") as log_file:
+            for line in log_file:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                session_id, question = entry.get("session_id"), entry.get("question")
+                if session_id in last_question:
+                    self.record(last_question[session_id], question)
+                    recorded += 1
+                last_question[session_id] = question
+        logger.info("Loaded %d follow-up transitions from %s", recorded, path)
+        return recorded
+
+    def popular_next(self, question: str, limit: int) -> List[str]:
+        """Return the most frequent questions asked after ``question``."""
+        key = normalize_query(question)
+        with self._lock:
+            counts = self._transitions.get(key)
+            if counts:
+                self._transitions.move_to_end(key)
+            return [next_question for next_question, _ in counts.most_common(limit)] if counts else []
+
+    def predict(self, question: str, answer: str, limit: int = 4) -> List[str]:
+        """
+        Predict the search queries a follow-up to ``question`` is likely to issue.
+
+        Popular next questions come first, then key terms the answer introduced
+        that the question did not mention.
+        """
+        predictions: List[str] = []
+        seen: Set[str] = {normalize_query(question)}
+
+        candidates = self.popular_next(question, limit)
+        question_terms = term_stems(question)
+        candidates += [term for term in key_terms(answer) if stem(term) not in question_terms]
+
+        for candidate in candidates:
+            normalized = normalize_query(candidate)
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+            predictions.append(candidate)
+            if len(predictions) >= limit:
+                break
+        return predictions
+
+
+class RetrievalPrefetcher:
+    """Warms a retrieval cache from a bounded background thread pool."""
+
+    def __init__(self, cache: RetrievalCache, max_workers: int = 2):
+        """
+        Initialize the prefetcher.
+
+        Args:
+            cache: Cache the prefetched results are stored in
+            max_workers: Threads available for prefetch searches
+        """
+        self._cache = cache
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="prefetch")
+        self._in_flight: Set[Hashable] = set()
+        self._lock = threading.Lock()
+        self.stats = Counter()
+
+    def schedule(
+        self,
+        queries: Iterable[str],
+        key: Callable[[str], Hashable],
+        fetch: Callable[[str], Any],
+        budget: int,
+    ) -> int:
+        """
+        Prefetch ``queries`` that are neither cached nor already in flight.
+
+        Args:
+            queries: Candidate search queries, most likely first
+            key: Maps a query to its cache key
+            fetch: Performs the search for a query, returning the value to cache
+            budget: Maximum number of searches to start
+
+        Returns:
+            Number of searches started, to be charged against the caller's budget
+        """
+        started = 0
+        for query in queries:
+            if started >= budget:
+                break
+            cache_key = key(query)
+            with self._lock:
+                if cache_key in self._in_flight or cache_key in self._cache:
+                    self.stats["skipped"] += 1
+                    continue
+                self._in_flight.add(cache_key)
+            self._executor.submit(self._prefetch, query, cache_key, fetch)
+            started += 1
+        with self._lock:
+            self.stats["scheduled"] += started
+        return started
+
+    def _prefetch(self, query: str, cache_key: Hashable, fetch: Callable[[str], Any]) -> None:
+        """Run one prefetch search and cache its result."""
+        outcome = "completed"
+        try:
+            value = fetch(query)
+            if value is not None:
+                self._cache.put(cache_key, value)
+        except Exception as e:
+            outcome = "failed"
+            logger.warning("Prefetch failed for query %r: %s", query, e)
+        finally:
+            with self._lock:
+                self._in_flight.discard(cache_key)
+                self.stats[outcome] += 1
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop accepting work and optionally wait for running prefetches."""
+        self._executor.shutdown(wait=wait)
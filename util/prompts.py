@@ -0,0 +1,69 @@
+"""
+Compiled chat prompt templates.
+
+The base prompt for each section comes from ``st.secrets["base_prompts"]``.
+``PromptRegistry`` embeds each base prompt into the chat prompt layout once, so
+building a prompt per request is a single substitution instead of a secrets
+lookup and string assembly.
+"""
+import hashlib
+from string import Template
+from typing import Dict, List, Mapping
+
+# Chat prompt layout; ``$base_prompt`` is filled in when the registry is built
+PROMPT_LAYOUT = """[INST]
+    $base_prompt
+
+    <chat_history>
+    $$chat_history
+    </chat_history>
+
+    <context>
+    $$context
+    </context>
+
+    <question>
+    $$question
+    </question>
+    [/INST]
+    """
+
+
+class PromptRegistry:
+    """Per-section chat prompt templates compiled from the configured base prompts."""
+
+    def __init__(self, base_prompts: Mapping[str, str]):
+        """
+        Compile one template per section.
+
+        Args:
+            base_prompts: Base prompt text keyed by section
+        """
+        layout = Template(PROMPT_LAYOUT)
+        self._templates: Dict[str, Template] = {
+            # Escape "$" so base prompts are taken literally by the compiled template
+            section: Template(layout.substitute(base_prompt=str(base_prompt).replace("$", "$$")))
+            for section, base_prompt in base_prompts.items()
+        }
+
+    @property
+    def fingerprint(self) -> str:
+        """Hash of every compiled template; changes whenever a base prompt or the layout does."""
+        digest = hashlib.sha256()
+        for section in sorted(self._templates):
+            digest.update(f"{section}\0{self._templates[section].template}\0".encode("utf-8"))
+        return digest.hexdigest()[:16]
+
+    @property
+    def sections(self) -> List[str]:
+        """Sections with a compiled template."""
+        return list(self._templates)
+
+    def render(self, section: str, chat_history: str, context: str, question: str) -> str:
+        """
+        Build the chat prompt for ``section``.
+
+        Raises:
+            KeyError: If no base prompt is configured for ``section``
+        """
+        return self._templates[section].substitute(chat_history=chat_history, context=context, question=question)
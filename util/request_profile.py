@@ -0,0 +1,115 @@
+"""
+Per-request performance profiles built from finished traces.
+
+Turns a ``util.tracing.Trace`` into the figures shown by the app's debug panel:
+a waterfall of stage timings, the prompt token breakdown, retrieval chunk counts
+and sizes, cache outcomes and the model used. Works only on recorded traces, so
+it adds nothing to the request path.
+"""
+from typing import Any, Dict, List
+
+from util.tracing import Trace
+
+
+def stage_rows(trace: Trace) -> List[Dict[str, Any]]:
+    """
+    Return one row per span, in start order, with its nesting depth and offsets.
+
+    Args:
+        trace: Finished request trace
+
+    Returns:
+        Rows with name, depth, start_ms (relative to the request start), duration_ms and error
+    """
+    spans = sorted(trace.spans, key=lambda span: span.start_ns)
+    if not spans:
+        return []
+    parents = {span.span_id: span.parent_id for span in spans}
+    start_ns = spans[0].start_ns
+
+    def depth(span_id):
+        level = 0
+        while parents.get(span_id):
+            span_id = parents[span_id]
+            level += 1
+        return level
+
+    return [
+        {
+            "name": span.name,
+            "depth": depth(span.span_id),
+            "start_ms": (span.start_ns - start_ns) / 1e6,
+            "duration_ms": span.duration_ms,
+            "error": span.attributes.get("error"),
+        }
+        for span in spans
+    ]
+
+
+def format_waterfall(trace: Trace, width: int = 30) -> str:
+    """
+    Render a trace's stage timings as a fixed-width text waterfall.
+
+    Each line shows the (indented) stage name, a bar placed at the stage's offset
+    within the request and the stage duration; failed stages are marked with ``!``.
+    """
+    rows = stage_rows(trace)
+    total_ms = max((row["start_ms"] + row["duration_ms"] for row in rows), default=0.0) or 1.0
+    label_width = max((2 * row["depth"] + len(row["name"]) for row in rows), default=0)
+    lines = []
+    for row in rows:
+        start = min(int(row["start_ms"] / total_ms * width), width - 1)
+        length = max(1, round(row["duration_ms"] / total_ms * width))
+        bar = (" " * start + "█" * length)[:width].ljust(width)
+        label = ("  " * row["depth"] + row["name"]).ljust(label_width)
+        marker = " !" if row["error"] else ""
+        lines.append(f"{label} |{bar}| {row['duration_ms']:8.1f}ms{marker}")
+    return "\n".join(lines)
+
+
+def profile_trace(trace: Trace) -> Dict[str, Any]:
+    """
+    Summarize a chat request trace for the debug panel.
+
+    Returns:
+        Dictionary with the section, model, total duration, token breakdown,
+        retrieval figures, cache outcomes and any stage errors
+    """
+    root_id = trace.root.span_id if trace.root is not None else None
+    root = trace.root.attributes if trace.root is not None else {}
+    # Request stages are the root's children; a nested ``complete`` is the history rewrite
+    spans = {span.name: span.attributes for span in trace.spans if span.parent_id == root_id}
+    prompt = spans.get("create_prompt", {})
+    completion = spans.get("complete", {})
+    searches = [span.attributes for span in trace.spans if span.name == "query_cortex_search_service"]
+
+    question_tokens = root.get("question_tokens", 0)
+    history_tokens = prompt.get("history_tokens", 0)
+    context_tokens = prompt.get("context_tokens", 0)
+    prompt_tokens = prompt.get("prompt_tokens", completion.get("prompt_tokens", 0))
+    return {
+        "trace_id": trace.trace_id,
+        "section": root.get("section"),
+        "model": completion.get("model", root.get("model")),
+        "duration_ms": trace.duration_ms,
+        "tokens": {
+            "question": question_tokens,
+            "history": history_tokens,
+            "context": context_tokens,
+            "instructions": max(prompt_tokens - question_tokens - history_tokens - context_tokens, 0),
+            "prompt": prompt_tokens,
+            "completion": completion.get("completion_tokens", 0),
+        },
+        "retrieval": {
+            "plan": prompt.get("plan"),
+            "searches": len(searches),
+            "chunks": prompt.get("chunks", sum(search.get("chunks", 0) for search in searches)),
+            "context_tokens": context_tokens,
+        },
+        "cache": {
+            "prefetched": bool(prompt.get("prefetched")),
+            "hits": sum(1 for search in searches if search.get("cache") == "hit"),
+            "misses": sum(1 for search in searches if search.get("cache") == "miss"),
+        },
+        "errors": {span.name: span.attributes["error"] for span in trace.spans if "error" in span.attributes},
+    }
@@ -0,0 +1,149 @@
+"""
+Process-wide cache of Cortex Search results.
+
+Entries are keyed on the service, a normalized form of the query (lower case, with
+punctuation around words and extra whitespace removed), the requested columns, the
+filter and the result limit. Normalizing keeps every word and the word order, so
+"should I buy" and "should I not buy", or "A vs B" and "B vs A", stay apart. The cache is a thread-safe
+LRU with a time-to-live, shared by the request path and the background prefetcher.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Iterable, List, Optional, Sequence, Tuple
+
+
+# Stripped from either end of each word, so "Index funds?" matches "index funds"
+_WORD_PUNCTUATION = ".,;:!?\"'`"
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case ``query``, strip punctuation around its words and collapse whitespace, keeping word order."""
+    words = (word.strip(_WORD_PUNCTUATION) for word in str(query).lower().split())
+    return " ".join(word for word in words if word)
+
+
+def make_key(
+    service: str,
+    query: str,
+    columns: Sequence[str],
+    filter: Optional[Dict[str, Any]],
+    limit: int,
+) -> Tuple[str, str, Tuple[str, ...], str, int]:
+    """Build the cache key for a search request."""
+    return (service, normalize_query(query), tuple(columns), json.dumps(filter or {}, sort_keys=True), limit)
+
+
+class RetrievalCache:
+    """Thread-safe LRU cache with per-entry expiry."""
+
+    def __init__(self, max_entries: int = 1024, ttl_seconds: float = 600.0):
+        """
+        Initialize the cache.
+
+        Args:
+            max_entries: Entries kept before the least recently used is evicted
+            ttl_seconds: Seconds an entry stays valid, 0 to never expire
+        """
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Hashable) -> bool:
+        with self._lock:
+            return self._live(key) is not None
+
+    def _live(self, key: Hashable) -> Optional[Tuple[float, Any]]:
+        """Return the entry for ``key`` if present and unexpired; the caller holds the lock."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if self._ttl_seconds and time.monotonic() - entry[0] > self._ttl_seconds:
+            del self._entries[key]
+            return None
+        return entry
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value for ``key``, or None on a miss."""
+        with self._lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Store ``value`` under ``key``, evicting the least recently used entries if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic(), value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any]) -> Any:
+        """Return the cached value for ``key``, calling ``loader`` and caching its result on a miss."""
+        value = self.get(key)
+        if value is None:
+            value = loader()
+            if value is not None:
+                self.put(key, value)
+        return value
+
+    def entries(self) -> List[Tuple[Hashable, Any, float]]:
+        """Return the unexpired entries as ``(key, value, written_at)``, least recently used first."""
+        now, wall_now = time.monotonic(), time.time()
+        with self._lock:
+            return [
+                (key, value, wall_now - (now - stored_at))
+                for key, (stored_at, value) in self._entries.items()
+                if not self._ttl_seconds or now - stored_at <= self._ttl_seconds
+            ]
+
+    def restore(self, entries: Iterable[Tuple[Hashable, Any, float]]) -> int:
+        """
+        Add entries returned by ``entries``, e.g. from a snapshot, keeping their age.
+
+        Entries that have expired since they were written are skipped.
+
+        Returns:
+            Number of entries added
+        """
+        now, wall_now = time.monotonic(), time.time()
+        restored = 0
+        with self._lock:
+            for key, value, written_at in entries:
+                age = max(wall_now - written_at, 0.0)
+                if self._ttl_seconds and age > self._ttl_seconds:
+                    continue
+                self._entries[key] = (now - age, value)
+                self._entries.move_to_end(key)
+                restored += 1
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return restored
+
+    def clear(self) -> None:
+        """Drop every entry and reset the hit counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Return entry count, hit and miss counts and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
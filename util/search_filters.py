@@ -0,0 +1,87 @@
+"""
+Filter expressions for Cortex Search queries.
+
+Cortex Search narrows its candidate set server-side with a filter expression
+over the service's ATTRIBUTES columns. Expressions are plain dictionaries built
+from the operators below, for example::
+
+    {"@and": [{"@eq": {"section": "investment"}}, {"@eq": {"audience": "Conservative"}}]}
+
+These helpers build such expressions from user profile attributes and evaluate
+them locally so the offline search stand-in honours the same semantics.
+"""
+from typing import Any, Dict, Mapping, Optional
+
+
+def eq_filter(attribute: str, value: Any) -> Dict[str, Any]:
+    """Match rows whose attribute equals ``value``."""
+    return {"@eq": {attribute: value}}
+
+
+def build_search_filter(attributes: Optional[Mapping[str, Any]] = None, **kwargs: Any) -> Dict[str, Any]:
+    """
+    Build a Cortex Search filter from attribute values.
+
+    Args:
+        attributes: Mapping of attribute column to value. A list or tuple value
+            matches any of its items; ``None`` or empty values are skipped.
+        **kwargs: Additional attribute values, merged over ``attributes``.
+
+    Returns:
+        Filter expression, or an empty dict when nothing should be filtered.
+    """
+    values = dict(attributes or {})
+    values.update(kwargs)
+
+    clauses = []
+    for attribute, value in values.items():
+        if value is None or value == "" or value == [] or value == ():
+            continue
+        if isinstance(value, (list, tuple, set)):
+            options = [eq_filter(attribute, item) for item in value]
+            clauses.append(options[0] if len(options) == 1 else {"@or": options})
+        else:
+            clauses.append(eq_filter(attribute, value))
+
+    if not clauses:
+        return {}
+    if len(clauses) == 1:
+        return clauses[0]
+    return {"@and": clauses}
+
+
+def matches_filter(row: Mapping[str, Any], filter: Optional[Mapping[str, Any]]) -> bool:
+    """
+    Evaluate a filter expression against a single row.
+
+    Supports ``@eq``, ``@contains``, ``@gte``, ``@lte``, ``@and``, ``@or`` and
+    ``@not``. An empty filter matches every row.
+
+    Raises:
+        ValueError: If the expression uses an unknown operator.
+    """
+    if not filter:
+        return True
+
+    for operator, operand in filter.items():
+        if operator == "@and":
+            matched = all(matches_filter(row, clause) for clause in operand)
+        elif operator == "@or":
+            matched = any(matches_filter(row, clause) for clause in operand)
+        elif operator == "@not":
+            matched = not matches_filter(row, operand)
+        elif operator == "@eq":
+            matched = all(row.get(key) == value for key, value in operand.items())
+        elif operator == "@contains":
+            matched = all(value in (row.get(key) or ()) for key, value in operand.items())
+        elif operator == "@gte":
+            matched = all(row.get(key) is not None and row.get(key) >= value for key, value in operand.items())
+        elif operator == "@lte":
+            matched = all(row.get(key) is not None and row.get(key) <= value for key, value in operand.items())
+        else:
+            raise ValueError(f"Unsupported filter operator: {operator}")
+
+        if not matched:
+            return False
+
+    return True
@@ -0,0 +1,537 @@
+"""
+Process-wide pool of Snowpark sessions.
+
+Creating a Snowpark ``Session`` costs a network round trip and an authentication
+handshake, and every live session holds a Snowflake connection. ``SessionPool``
+shares a small number of sessions between all Streamlit browser sessions: callers
+check a session out for the duration of one Cortex or SQL call and return it
+afterwards. The pool keeps between ``min_size`` and ``max_size`` sessions, validates
+sessions that sat idle before handing them out, and reaps surplus idle sessions.
+
+Snowflake sessions expire and connections drop. ``SessionPool.run`` and
+``ManagedSession.run`` recognise those failures, replace the broken session and
+retry the call once, so callers must only pass idempotent calls to them.
+"""
+import logging
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+# Snowflake error numbers for expired or lost sessions and failed connections
+SESSION_ERROR_CODES = frozenset({250001, 250002, 250003, 390111, 390112, 390114})
+
+# Message fragments raised when a session or its connection is gone
+SESSION_ERROR_MARKERS = (
+    "token has expired",
+    "session no longer exists",
+    "session has been closed",
+    "connection is closed",
+    "connection closed",
+    "connection reset",
+    "could not connect",
+)
+
+
+class PoolExhaustedError(RuntimeError):
+    """Raised when no session becomes available within the checkout timeout."""
+
+
+def default_health_check(session: Any) -> None:
+    """Run a trivial query, raising if the session is no longer usable."""
+    session.sql("SELECT 1").collect()
+
+
+def is_session_error(error: BaseException) -> bool:
+    """
+    Return True if ``error`` means the session itself is unusable.
+
+    Such errors are fixed by reconnecting, unlike errors in the query or the
+    model call, which would fail again on a fresh session.
+    """
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    if getattr(error, "errno", None) in SESSION_ERROR_CODES:
+        return True
+    message = str(error).lower()
+    return any(marker in message for marker in SESSION_ERROR_MARKERS)
+
+
+class _PooledSession:
+    """A pooled session with its bookkeeping timestamps."""
+
+    __slots__ = ("session", "created_at", "last_used", "last_validated")
+
+    def __init__(self, session: Any):
+        self.session = session
+        self.created_at = time.monotonic()
+        self.last_used = self.created_at
+        self.last_validated = self.created_at
+
+    def idle_for(self, now: float) -> float:
+        """Seconds since the session was last used or validated."""
+        return now - max(self.last_used, self.last_validated)
+
+
+class SessionPool:
+    """Thread-safe pool of Snowpark sessions with checkout/return semantics."""
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        min_size: int = 1,
+        max_size: int = 8,
+        idle_timeout: float = 300.0,
+        checkout_timeout: float = 30.0,
+        validate_after: float = 60.0,
+        health_check: Callable[[Any], None] = default_health_check,
+        keepalive_interval: float = 0.0,
+    ):
+        """
+        Initialize an empty pool. No session is created until first use or ``prewarm``.
+
+        Args:
+            factory: Creates a new connected session
+            min_size: Idle sessions kept open by the reaper
+            max_size: Maximum sessions open at once, idle or checked out
+            idle_timeout: Seconds an idle session above ``min_size`` is kept before it is closed
+            checkout_timeout: Seconds ``checkout`` waits for a session when the pool is full
+            validate_after: Idle seconds after which a session is health checked before reuse
+            health_check: Raises if a session is unusable
+            keepalive_interval: Idle seconds after which the reaper pings a session, 0 to disable
+        """
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError(f"Invalid pool size bounds: min_size={min_size}, max_size={max_size}")
+        self._factory = factory
+        self.min_size = min_size
+        self.max_size = max_size
+        self._idle_timeout = idle_timeout
+        self._checkout_timeout = checkout_timeout
+        self._validate_after = validate_after
+        self._health_check = health_check
+        self._keepalive_interval = keepalive_interval
+
+        self._idle: List[_PooledSession] = []
+        self._in_use: Dict[int, _PooledSession] = {}
+        self._validating: List[_PooledSession] = []
+        self._opening = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._reaper: Optional[threading.Thread] = None
+        self._warming: Optional[threading.Thread] = None
+        self._counters = {
+            "created": 0,
+            "closed": 0,
+            "checkouts": 0,
+            "waits": 0,
+            "timeouts": 0,
+            "health_failures": 0,
+            "keepalives": 0,
+            "reconnects": 0,
+        }
+
+    @property
+    def size(self) -> int:
+        """Sessions open or being opened."""
+        return len(self._idle) + len(self._in_use) + len(self._validating) + self._opening
+
+    def _create(self) -> _PooledSession:
+        """Open a new session; the caller has reserved a slot in ``_opening``."""
+        try:
+            pooled = _PooledSession(self._factory())
+        except Exception:
+            with self._condition:
+                self._opening -= 1
+                self._condition.notify()
+            raise
+        with self._condition:
+            self._opening -= 1
+            self._counters["created"] += 1
+        logger.info("Opened pooled Snowflake session (%d/%d open)", self.size + 1, self.max_size)
+        return pooled
+
+    def _close(self, pooled: _PooledSession) -> None:
+        """Close a session outside the lock, ignoring errors."""
+        try:
+            pooled.session.close()
+        except Exception as e:
+            logger.warning("Error closing pooled session: %s", e)
+        with self._condition:
+            self._counters["closed"] += 1
+            self._condition.notify()
+
+    def _healthy(self, pooled: _PooledSession) -> bool:
+        """Health check a session that has been idle longer than ``validate_after``."""
+        if pooled.idle_for(time.monotonic()) < self._validate_after:
+            return True
+        try:
+            self._health_check(pooled.session)
+            pooled.last_validated = time.monotonic()
+            return True
+        except Exception as e:
+            logger.warning("Pooled session failed health check, replacing it: %s", e)
+            with self._condition:
+                self._counters["health_failures"] += 1
+            return False
+
+    def checkout(self, timeout: Optional[float] = None) -> Any:
+        """
+        Borrow a session, opening one if the pool is below ``max_size``.
+
+        Args:
+            timeout: Seconds to wait when the pool is full, defaults to ``checkout_timeout``
+
+        Returns:
+            A session that must be handed back with ``release``
+
+        Raises:
+            PoolExhaustedError: If no session became available in time
+        """
+        deadline = time.monotonic() + (self._checkout_timeout if timeout is None else timeout)
+        while True:
+            pooled = None
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("Session pool is closed")
+                waited = False
+                while not self._idle and self.size >= self.max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._counters["timeouts"] += 1
+                        raise PoolExhaustedError(f"No Snowflake session available after waiting; pool size {self.max_size}")
+                    waited = True
+                    self._condition.wait(remaining)
+                if waited:
+                    self._counters["waits"] += 1
+                if self._idle:
+                    # Most recently used first: it is the most likely to still be valid.
+                    # Counted in ``size`` while it is checked, so the pool cannot grow past max_size meanwhile
+                    pooled = self._idle.pop()
+                    self._validating.append(pooled)
+                else:
+                    self._opening += 1
+
+            reused = pooled is not None
+            if not reused:
+                pooled = self._create()
+            elif not self._healthy(pooled):
+                with self._condition:
+                    self._validating.remove(pooled)
+                self._close(pooled)
+                continue
+
+            with self._condition:
+                if reused:
+                    self._validating.remove(pooled)
+                pooled.last_used = time.monotonic()
+                self._in_use[id(pooled.session)] = pooled
+                self._counters["checkouts"] += 1
+            return pooled.session
+
+    def release(self, session: Any, discard: bool = False) -> None:
+        """
+        Return a checked out session to the pool.
+
+        Args:
+            session: Session obtained from ``checkout``
+            discard: Close the session instead of reusing it, e.g. after a connection error
+        """
+        with self._condition:
+            pooled = self._in_use.pop(id(session), None)
+            if pooled is None:
+                logger.warning("Released a session that was not checked out from this pool")
+                return
+            pooled.last_used = time.monotonic()
+            if not discard and not self._closed:
+                self._idle.append(pooled)
+                self._condition.notify()
+                return
+        self._close(pooled)
+
+    @contextmanager
+    def session(self, timeout: Optional[float] = None) -> Iterator[Any]:
+        """Check out a session for the duration of a ``with`` block, discarding it on a session error."""
+        session = self.checkout(timeout)
+        discard = False
+        try:
+            yield session
+        except Exception as e:
+            discard = is_session_error(e)
+            raise
+        finally:
+            self.release(session, discard=discard)
+
+    def run(self, call: Callable[[Any], Any], timeout: Optional[float] = None, retries: int = 1) -> Any:
+        """
+        Return ``call(session)`` on a checked out session, retrying on a fresh session after a session error.
+
+        Args:
+            call: Idempotent function of a session
+            timeout: Checkout timeout, defaults to ``checkout_timeout``
+            retries: Times to retry after the session turned out to be expired or disconnected
+
+        Raises:
+            Exception: Whatever ``call`` raises for other errors, or on the last attempt
+        """
+        for attempt in range(retries + 1):
+            session = self.checkout(timeout)
+            try:
+                result = call(session)
+            except Exception as e:
+                if not is_session_error(e):
+                    self.release(session)
+                    raise
+                self.release(session, discard=True)
+                if attempt == retries:
+                    raise
+                logger.warning("Snowflake session failed, retrying on a new session: %s", e)
+                with self._condition:
+                    self._counters["reconnects"] += 1
+                continue
+            self.release(session)
+            return result
+
+    def prewarm(self, count: Optional[int] = None) -> int:
+        """
+        Open idle sessions until ``count`` (default ``min_size``) are open.
+
+        Returns:
+            Number of sessions opened
+
+        Raises:
+            Exception: Whatever the factory raises when a connection cannot be made
+        """
+        target = min(self.min_size if count is None else count, self.max_size)
+        opened = 0
+        while True:
+            with self._condition:
+                if self._closed or self.size >= target:
+                    return opened
+                self._opening += 1
+            pooled = self._create()
+            with self._condition:
+                self._idle.append(pooled)
+                self._condition.notify()
+            opened += 1
+
+    def prewarm_async(self, count: Optional[int] = None) -> Optional[threading.Thread]:
+        """
+        Run ``prewarm`` on a daemon thread so callers do not wait for the connection.
+
+        Returns:
+            The warming thread, or None if a warm-up is already running
+        """
+        with self._condition:
+            if self._warming is not None and self._warming.is_alive():
+                return None
+
+            def run() -> None:
+                try:
+                    opened = self.prewarm(count)
+                    logger.info("Background warm-up opened %d Snowflake sessions", opened)
+                except Exception as e:
+                    logger.error("Background warm-up of Snowflake sessions failed: %s", e)
+
+            self._warming = threading.Thread(target=run, name="session-pool-warmup", daemon=True)
+            self._warming.start()
+            return self._warming
+
+    def reap_idle(self) -> int:
+        """
+        Close idle sessions unused for ``idle_timeout`` seconds, keeping ``min_size`` open.
+
+        Returns:
+            Number of sessions closed
+        """
+        now = time.monotonic()
+        expired = []
+        with self._condition:
+            # Oldest idle sessions sit at the front of the list
+            while self._idle and self.size > self.min_size and now - self._idle[0].last_used > self._idle_timeout:
+                expired.append(self._idle.pop(0))
+        for pooled in expired:
+            self._close(pooled)
+        if expired:
+            logger.info("Reaped %d idle Snowflake sessions; pool: %s", len(expired), self.stats())
+        return len(expired)
+
+    def keepalive(self) -> int:
+        """
+        Ping idle sessions unused for ``keepalive_interval`` seconds, closing those that fail.
+
+        Returns:
+            Number of sessions that failed and were closed
+        """
+        if not self._keepalive_interval:
+            return 0
+        now = time.monotonic()
+        with self._condition:
+            stale = [pooled for pooled in self._idle if pooled.idle_for(now) >= self._keepalive_interval]
+            self._idle = [pooled for pooled in self._idle if pooled not in stale]
+            self._validating.extend(stale)
+
+        failed = []
+        for pooled in stale:
+            try:
+                self._health_check(pooled.session)
+                pooled.last_validated = time.monotonic()
+            except Exception as e:
+                logger.warning("Idle Snowflake session failed keepalive, closing it: %s", e)
+                failed.append(pooled)
+
+        with self._condition:
+            for pooled in stale:
+                self._validating.remove(pooled)
+            self._counters["keepalives"] += len(stale)
+            self._counters["health_failures"] += len(failed)
+            healthy = [pooled for pooled in stale if pooled not in failed]
+            if self._closed:
+                failed.extend(healthy)
+            elif healthy:
+                # Keep the idle list ordered oldest first for the reaper
+                self._idle = sorted(self._idle + healthy, key=lambda pooled: pooled.last_used)
+                self._condition.notify(len(healthy))
+        for pooled in failed:
+            self._close(pooled)
+        return len(failed)
+
+    def start_reaper(self, interval: float = 60.0) -> None:
+        """Start a daemon thread that reaps and pings idle sessions and logs utilization every ``interval`` seconds."""
+        if self._reaper is not None:
+            return
+
+        def run() -> None:
+            while not self._closed:
+                time.sleep(interval)
+                try:
+                    self.reap_idle()
+                    self.keepalive()
+                    logger.info("Snowflake session pool utilization: %s", self.stats())
+                except Exception as e:
+                    logger.error("Session pool reaper failed: %s", e)
+
+        self._reaper = threading.Thread(target=run, name="session-pool-reaper", daemon=True)
+        self._reaper.start()
+
+    def stats(self) -> Dict[str, Any]:
+        """Return pool size, idle and in-use counts, utilization and lifetime counters."""
+        with self._condition:
+            in_use = len(self._in_use)
+            return {
+                "size": self.size,
+                "idle": len(self._idle),
+                "in_use": in_use,
+                "max_size": self.max_size,
+                "utilization": in_use / self.max_size,
+                **self._counters,
+            }
+
+    def close(self) -> None:
+        """Close idle sessions and refuse further checkouts; checked out sessions close on release."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._condition.notify_all()
+        for pooled in idle:
+            self._close(pooled)
+
+
+class ManagedSession:
+    """
+    A single long-lived session that validates itself and reconnects when it expires.
+
+    Used where one session is pinned for a long time instead of being borrowed
+    from a ``SessionPool``. The session is opened on first use.
+    """
+
+    def __init__(
+        self,
+        factory: Callable[[], Any],
+        validate_after: float = 60.0,
+        health_check: Callable[[Any], None] = default_health_check,
+    ):
+        """
+        Initialize the wrapper.
+
+        Args:
+            factory: Creates a new connected session
+            validate_after: Idle seconds after which the session is health checked before use
+            health_check: Raises if a session is unusable
+        """
+        self._factory = factory
+        self._validate_after = validate_after
+        self._health_check = health_check
+        self._session: Optional[Any] = None
+        self._last_used = 0.0
+        self._lock = threading.RLock()
+        self.reconnects = 0
+
+    @property
+    def session(self) -> Any:
+        """The current session, opened or revalidated if needed."""
+        with self._lock:
+            if self._session is None:
+                self._session = self._factory()
+            elif time.monotonic() - self._last_used >= self._validate_after and not self.keepalive():
+                self.reconnect()
+            self._last_used = time.monotonic()
+            return self._session
+
+    def keepalive(self) -> bool:
+        """Ping the session, returning False if it is gone or no longer usable."""
+        with self._lock:
+            if self._session is None:
+                return False
+            try:
+                self._health_check(self._session)
+            except Exception as e:
+                logger.warning("Snowflake session failed health check: %s", e)
+                return False
+            self._last_used = time.monotonic()
+            return True
+
+    def reconnect(self) -> Any:
+        """Close the current session and open a new one."""
+        with self._lock:
+            old, self._session = self._session, None
+            if old is not None:
+                try:
+                    old.close()
+                except Exception as e:
+                    logger.warning("Error closing expired session: %s", e)
+            self._session = self._factory()
+            self._last_used = time.monotonic()
+            self.reconnects += 1
+            logger.info("Reconnected Snowflake session (%d reconnects)", self.reconnects)
+            return self._session
+
+    def run(self, call: Callable[[Any], Any], retries: int = 1) -> Any:
+        """
+        Return ``call(session)``, reconnecting and retrying after a session error.
+
+        Args:
+            call: Idempotent function of a session
+            retries: Times to retry after the session turned out to be expired or disconnected
+        """
+        for attempt in range(retries + 1):
+            session = self.session
+            try:
+                return call(session)
+            except Exception as e:
+                if attempt == retries or not is_session_error(e):
+                    raise
+                logger.warning("Snowflake session failed, reconnecting and retrying: %s", e)
+                with self._lock:
+                    # Another thread may already have replaced the session
+                    if self._session is session:
+                        self.reconnect()
+
+    def close(self) -> None:
+        """Close the session if one is open."""
+        with self._lock:
+            if self._session is not None:
+                self._session.close()
+                self._session = None
@@ -0,0 +1,161 @@
+"""
+Structured logging off the request path.
+
+``configure_logging`` routes the root logger through a ``QueueHandler``: a script
+thread only builds the log record and puts it on an in-memory queue, and a
+``QueueListener`` thread formats and writes it. Records are not formatted on the
+calling thread, so ``%s`` arguments are only rendered when a record is written.
+``JsonFormatter`` writes one JSON object per line with size-capped fields, and
+``SamplingFilter`` keeps only every n-th high-volume DEBUG record.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import queue
+import sys
+import threading
+from typing import IO, Any, Dict, Optional
+
+# Attributes every LogRecord has; anything else was passed through ``extra``
+_RECORD_ATTRIBUTES = frozenset(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+
+TEXT_FORMAT = "%(asctime)s - %(levelname)s - %(message)s"
+
+
+def _cap(value: str, limit: int) -> str:
+    """Truncate ``value`` to ``limit`` characters, noting how much was cut."""
+    if limit and len(value) > limit:
+        return f"{value[:limit]}...[{len(value) - limit} more chars]"
+    return value
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as single-line JSON objects with size-capped fields."""
+
+    def __init__(self, max_field_chars: int = 1000):
+        """
+        Initialize the formatter.
+
+        Args:
+            max_field_chars: Longest message or extra field value written; 0 for no limit
+        """
+        super().__init__()
+        self.max_field_chars = max_field_chars
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": round(record.created, 6),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": _cap(record.getMessage(), self.max_field_chars),
+            "thread": record.threadName,
+        }
+        for key, value in vars(record).items():
+            if key not in _RECORD_ATTRIBUTES and not key.startswith("_"):
+                if not isinstance(value, (int, float, bool)) and value is not None:
+                    value = _cap(str(value), self.max_field_chars)
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = _cap(self.formatException(record.exc_info), 4 * self.max_field_chars)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """Passes one in ``sample_every`` records at or below ``max_level``; higher levels always pass."""
+
+    def __init__(self, sample_every: int = 1, max_level: int = logging.DEBUG):
+        super().__init__()
+        self.sample_every = max(1, sample_every)
+        self.max_level = max_level
+        self._seen = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > self.max_level or self.sample_every == 1:
+            return True
+        # Unlocked on purpose: a lost increment only shifts which record is kept
+        self._seen += 1
+        return self._seen % self.sample_every == 1
+
+
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """
+    Queue handler that never blocks or formats on the calling thread.
+
+    Records are enqueued as is and formatted by the listener. When the queue is
+    full the record is dropped and counted in ``dropped`` instead of waiting.
+    """
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener runs in this process, so the record needs no pickling-safe copy
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_lock = threading.Lock()
+_listener: Optional[logging.handlers.QueueListener] = None
+_handler: Optional[NonBlockingQueueHandler] = None
+
+
+def configure_logging(
+    level: int = logging.INFO,
+    json_format: bool = True,
+    max_field_chars: int = 1000,
+    debug_sample_every: int = 1,
+    queue_size: int = 10000,
+    stream: Optional[IO[str]] = None,
+) -> NonBlockingQueueHandler:
+    """
+    Route the root logger through a background writer thread.
+
+    Calling it again replaces the handler installed by the previous call.
+
+    Args:
+        level: Root logger level
+        json_format: Write JSON lines; otherwise the plain text format
+        max_field_chars: Longest message or extra field value written
+        debug_sample_every: Keep one in this many DEBUG records
+        queue_size: Records buffered before new ones are dropped
+        stream: Output stream, stderr by default
+
+    Returns:
+        The queue handler installed on the root logger
+    """
+    global _listener, _handler
+    with _lock:
+        stop_logging()
+        output = logging.StreamHandler(stream or sys.stderr)
+        output.setFormatter(JsonFormatter(max_field_chars) if json_format else logging.Formatter(TEXT_FORMAT))
+
+        handler = NonBlockingQueueHandler(queue.Queue(queue_size))
+        handler.addFilter(SamplingFilter(debug_sample_every))
+        root = logging.getLogger()
+        if _handler is not None:
+            root.removeHandler(_handler)
+        root.addHandler(handler)
+        root.setLevel(level)
+
+        _listener = logging.handlers.QueueListener(handler.queue, output, respect_handler_level=True)
+        _listener.start()
+        _handler = handler
+        return handler
+
+
+def stop_logging() -> None:
+    """Write out queued records and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+atexit.register(stop_logging)
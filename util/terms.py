@@ -0,0 +1,53 @@
+"""
+Lightweight term extraction shared by the local search stand-in and retrieval helpers.
+"""
+import re
+from collections import Counter
+from typing import List, Set
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+
+# Common English words that carry no topical signal
+STOPWORDS = frozenset(
+    """
+    a about above after again all am an and any are as at be because been before being below between both but by
+    can could did do does doing down during each few for from further had has have having he her here hers him his
+    how i if in into is it its itself just me more most my no nor not now of off on once only or other our ours out
+    over own same she should so some such than that the their theirs them then there these they this those through
+    to too under until up very was we were what when where which while who whom why will with would you your yours
+    also get got like tell please want know need much many make way ok okay thanks thank
+    """.split()
+)
+
+
+def tokenize(text: str) -> List[str]:
+    """Lower-case ``text`` and split it into alphanumeric tokens."""
+    return _TOKEN_PATTERN.findall(str(text).lower())
+
+
+def stem(term: str) -> str:
+    """Strip a plural ``s`` so "funds" and "fund" compare equal."""
+    if len(term) > 3 and term.endswith("s") and not term.endswith(("ss", "us", "is")):
+        return term[:-1]
+    return term
+
+
+def term_stems(text: str) -> Set[str]:
+    """Return the stems of the key terms of ``text``."""
+    return {stem(term) for term in key_terms(text)}
+
+
+def key_terms(text: str, limit: int = 0) -> List[str]:
+    """
+    Return the distinct non-stopword terms of ``text``, most frequent first.
+
+    Args:
+        text: Text to extract terms from
+        limit: Maximum number of terms to return, 0 for all
+
+    Returns:
+        List of terms ordered by frequency, then first occurrence
+    """
+    counts = Counter(token for token in tokenize(text) if token not in STOPWORDS and len(token) > 2)
+    terms = [term for term, _ in counts.most_common()]
+    return terms[:limit] if limit else terms
@@ -0,0 +1,278 @@
+"""
+Lightweight per-request tracing.
+
+A chat request is traced as a root span with one child span per pipeline stage
+(prompt creation, history rewrite, search, completion, rendering). Spans carry
+durations and attributes such as token counts, chunk counts and cache outcomes,
+and all spans of a request share its trace ID. Finished traces are kept in memory
+for inspection, can be exported as OpenTelemetry (OTLP) JSON lines and are passed
+to listeners such as ``util.metrics.TraceMetrics``.
+
+The module-level ``tracer`` is disabled by default. While disabled, ``span`` and
+``trace`` return a shared no-op span, so instrumented code pays one attribute
+check per stage.
+"""
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STATUS_UNSET, STATUS_OK, STATUS_ERROR = 0, 1, 2
+
+
+def approx_tokens(text: Any) -> int:
+    """Estimate the token count of ``text`` at roughly four characters per token."""
+    return (len(str(text)) + 3) // 4 if text else 0
+
+
+class _NoopSpan:
+    """Span returned while tracing is disabled or outside a traced request."""
+
+    __slots__ = ()
+
+    def __enter__(self) -> "_NoopSpan":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        return None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        pass
+
+    def set_attributes(self, **attributes: Any) -> None:
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_span: "ContextVar[Optional[Span]]" = ContextVar("current_span", default=None)
+
+
+class Trace:
+    """All spans of one request."""
+
+    __slots__ = ("trace_id", "spans", "root")
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List["Span"] = []
+        self.root: Optional["Span"] = None
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms if self.root is not None else 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        """Return the trace with its spans ordered by start time."""
+        return {
+            "trace_id": self.trace_id,
+            "duration_ms": round(self.duration_ms, 3),
+            "spans": [span.as_dict() for span in sorted(self.spans, key=lambda span: span.start_ns)],
+        }
+
+
+class Span:
+    """A timed stage of a request with attributes."""
+
+    __slots__ = ("tracer", "trace", "name", "span_id", "parent_id", "start_ns", "end_ns", "attributes", "status", "_token")
+
+    def __init__(self, tracer: "Tracer", trace: Trace, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.tracer = tracer
+        self.trace = trace
+        self.name = name
+        self.span_id = os.urandom(8).hex()
+        self.parent_id = parent.span_id if parent is not None else None
+        self.attributes = attributes
+        self.status = STATUS_UNSET
+        self.start_ns = 0
+        self.end_ns = 0
+        self._token = None
+
+    @property
+    def duration_ms(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e6 if self.end_ns else 0.0
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes: Any) -> None:
+        self.attributes.update(attributes)
+
+    def __enter__(self) -> "Span":
+        self.start_ns = time.time_ns()
+        self._token = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb) -> None:
+        self.end_ns = time.time_ns()
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.status = STATUS_ERROR
+            self.attributes["error"] = f"{exc_type.__name__}: {exc}"
+        elif self.status == STATUS_UNSET:
+            self.status = STATUS_OK
+        self.trace.spans.append(self)
+        if self.parent_id is None:
+            self.tracer._finish(self.trace)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "name": self.name,
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "start_ns": self.start_ns,
+            "duration_ms": round(self.duration_ms, 3),
+            "status": self.status,
+            "attributes": dict(self.attributes),
+        }
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    """Encode an attribute value as an OTLP ``AnyValue``."""
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        # OTLP JSON encodes 64-bit integers as strings
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def to_otlp(trace: Trace, service_name: str = "econo-genie") -> Dict[str, Any]:
+    """Encode a trace as an OTLP/JSON ``ExportTraceServiceRequest``."""
+    spans = []
+    for span in trace.spans:
+        encoded = {
+            "traceId": trace.trace_id,
+            "spanId": span.span_id,
+            "name": span.name,
+            "kind": 1,
+            "startTimeUnixNano": str(span.start_ns),
+            "endTimeUnixNano": str(span.end_ns),
+            "attributes": [{"key": key, "value": _otlp_value(value)} for key, value in span.attributes.items()],
+            "status": {"code": span.status},
+        }
+        if span.parent_id:
+            encoded["parentSpanId"] = span.parent_id
+        spans.append(encoded)
+    return {
+        "resourceSpans": [
+            {
+                "resource": {"attributes": [{"key": "service.name", "value": {"stringValue": service_name}}]},
+                "scopeSpans": [{"scope": {"name": __name__}, "spans": spans}],
+            }
+        ]
+    }
+
+
+class JsonLinesExporter:
+    """Appends each finished trace to a file as one line of OTLP JSON."""
+
+    def __init__(self, path: str, service_name: str = "econo-genie"):
+        self.path = path
+        self.service_name = service_name
+        self._lock = threading.Lock()
+
+    def export(self, trace: Trace) -> None:
+        line = json.dumps(to_otlp(trace, self.service_name), separators=(",", ":"))
+        with self._lock, open(self.path, "a", encoding="utf-8") as f:
+            f.write(line + "\n")
+
+
+class Tracer:
+    """Creates request traces and stage spans and keeps the most recent finished traces."""
+
+    def __init__(self, enabled: bool = False, exporter: Optional[JsonLinesExporter] = None, keep: int = 100):
+        """
+        Initialize the tracer.
+
+        Args:
+            enabled: Record spans; when False every span is a no-op
+            exporter: Receives each finished trace
+            keep: Finished traces kept in memory
+        """
+        self.enabled = enabled
+        self.exporter = exporter
+        self._recent: deque = deque(maxlen=keep)
+        self._listeners: List[Callable[[Trace], None]] = []
+
+    def configure(self, enabled: bool, exporter: Optional[JsonLinesExporter] = None, keep: Optional[int] = None) -> None:
+        """Enable or disable tracing and replace the exporter."""
+        self.enabled = enabled
+        self.exporter = exporter
+        if keep is not None:
+            self._recent = deque(self._recent, maxlen=keep)
+
+    def add_listener(self, listener: Callable[[Trace], None]) -> None:
+        """Call ``listener`` with every finished trace, e.g. to record metrics."""
+        if listener not in self._listeners:
+            self._listeners.append(listener)
+
+    def trace(self, name: str, **attributes: Any):
+        """Start a request trace whose root span is ``name``."""
+        if not self.enabled:
+            return NOOP_SPAN
+        return Span(self, Trace(os.urandom(16).hex()), name, None, attributes)
+
+    def span(self, name: str, **attributes: Any):
+        """Start a stage span inside the current request trace; a no-op outside one."""
+        if not self.enabled:
+            return NOOP_SPAN
+        parent = _current_span.get()
+        if parent is None:
+            return NOOP_SPAN
+        return Span(self, parent.trace, name, parent, attributes)
+
+    def current_span(self):
+        """Return the innermost active span, or the no-op span."""
+        return _current_span.get() or NOOP_SPAN
+
+    def recent(self, limit: Optional[int] = None) -> List[Trace]:
+        """Return finished traces, newest first."""
+        traces = list(reversed(self._recent))
+        return traces[:limit] if limit else traces
+
+    def _finish(self, trace: Trace) -> None:
+        """Keep and export a finished trace."""
+        trace.root = next(span for span in trace.spans if span.parent_id is None)
+        self._recent.append(trace)
+        if self.exporter is not None:
+            try:
+                self.exporter.export(trace)
+            except OSError as e:
+                logger.warning("Could not export trace %s: %s", trace.trace_id, e)
+        for listener in self._listeners:
+            try:
+                listener(trace)
+            except Exception as e:
+                logger.warning("Trace listener %r failed: %s", listener, e)
+
+
+# Process-wide tracer used by the app; configured at startup
+tracer = Tracer()
+
+
+def traced(name: Optional[str] = None):
+    """Run the decorated function in a stage span named ``name`` (default: the function name)."""
+
+    def decorator(func):
+        span_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not tracer.enabled:
+                return func(*args, **kwargs)
+            with tracer.span(span_name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
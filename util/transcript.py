@@ -0,0 +1,154 @@
+"""
+Chat transcripts with per-message caches.
+
+A ``ChatTranscript`` stores each message as a slotted ``ChatMessage`` record with
+an interned role. The token estimate and the form in which the message appears
+in a prompt's chat history are computed once, when the message is appended.
+Building the history part of a prompt then joins the cached strings of the last
+few messages, with no re-serialization or re-counting of the transcript.
+
+Transcripts keep the memory cap of ``util.bounded_history.BoundedHistory``, and
+round-trip through plain message dicts (``to_dicts``/``from_dicts``) for
+persistence.
+"""
+import sys
+from itertools import islice
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from util.bounded_history import BoundedHistory, Message
+from util.tracing import approx_tokens
+
+NO_HISTORY = "No previous context"
+
+
+class ChatMessage:
+    """One chat message with its prompt form and token estimate cached."""
+
+    __slots__ = ("role", "content", "citations", "prompt_text", "tokens")
+
+    def __init__(self, role: str, content: str, citations: Sequence[str] = ()):
+        self.role = sys.intern(role)
+        self.content = content
+        self.citations = tuple(citations) if citations else ()
+        # Citations are shown to the user but not fed back into prompts
+        self.prompt_text = repr({"role": self.role, "content": content})
+        self.tokens = approx_tokens(self.prompt_text)
+
+    @classmethod
+    def from_dict(cls, message: Message) -> "ChatMessage":
+        return cls(message["role"], message["content"], message.get("citations") or ())
+
+    def to_dict(self) -> Message:
+        message = {"role": self.role, "content": self.content}
+        if self.citations:
+            message["citations"] = list(self.citations)
+        return message
+
+    # Read access by key, so records can stand in for message dicts
+    def __getitem__(self, key: str) -> Any:
+        try:
+            return getattr(self, key) if key in self.__slots__ else self.to_dict()[key]
+        except AttributeError:
+            raise KeyError(key) from None
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, ChatMessage):
+            return (self.role, self.content, self.citations) == (other.role, other.content, other.citations)
+        if isinstance(other, dict):
+            return self.to_dict() == {key: value for key, value in other.items() if key != "citations" or value}
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return f"ChatMessage({self.role!r}, {self.content[:40]!r})"
+
+
+class ChatTranscript(BoundedHistory):
+    """A section's chat history of ``ChatMessage`` records, memory-capped like ``BoundedHistory``."""
+
+    def _prepare(self, message) -> Tuple[ChatMessage, int]:
+        record = message if isinstance(message, ChatMessage) else ChatMessage.from_dict(message)
+        return record, len(record.prompt_text) + sum(len(citation) for citation in record.citations)
+
+    def _encode(self, record: ChatMessage) -> Message:
+        return record.to_dict()
+
+    def _decode(self, message: Message) -> ChatMessage:
+        return ChatMessage.from_dict(message)
+
+    def window(self, count: int) -> List[ChatMessage]:
+        """Return the last ``count`` messages, oldest first."""
+        if count <= 0:
+            return []
+        if count <= len(self._tail):
+            recent = list(islice(reversed(self._tail), count))
+            recent.reverse()
+            return recent
+        return self[-count:]
+
+    def history(self, count: int) -> List[Message]:
+        """Return the last ``count`` messages as role/content dicts, without citations."""
+        return [{"role": record.role, "content": record.content} for record in self.window(count)]
+
+    def prompt_history(self, count: int) -> Tuple[str, int]:
+        """
+        Return the chat history section of a prompt and its token estimate.
+
+        Args:
+            count: Most recent messages to include
+
+        Returns:
+            The serialized history, or ``NO_HISTORY`` when empty, and its approximate token count
+        """
+        records = self.window(count)
+        if not records:
+            return NO_HISTORY, 0
+        # Same text as str() of the history dicts, joined from the cached forms
+        return "[" + ", ".join(record.prompt_text for record in records) + "]", sum(record.tokens for record in records)
+
+    def to_dicts(self) -> List[Message]:
+        """Return every message, including spilled ones, as plain dicts."""
+        return [record.to_dict() for record in self]
+
+    @classmethod
+    def from_dicts(cls, messages: Iterable[Message], **kwargs) -> "ChatTranscript":
+        """Build a transcript from plain message dicts; ``kwargs`` are the memory cap settings."""
+        transcript = cls(**kwargs)
+        transcript.extend(messages)
+        return transcript
+
+    def __getstate__(self) -> Dict[str, Any]:
+        # Spill files are process-local, so pickles carry every message inline
+        return {
+            "max_messages": self.max_messages,
+            "max_bytes": self.max_bytes,
+            "spill_dir": self.spill_dir,
+            "messages": self.to_dicts(),
+        }
+
+    def __setstate__(self, state: Dict[str, Any]) -> None:
+        self.__init__(state["max_messages"], state["max_bytes"], state["spill_dir"])
+        self.extend(state["messages"])
+
+    def __repr__(self) -> str:
+        return f"ChatTranscript({len(self)} messages, {self.spilled} spilled)"
+
+
+def prompt_history(messages, count: int) -> Tuple[str, int]:
+    """
+    Return the chat history section of a prompt for a transcript or a plain list of message dicts.
+
+    Plain lists are serialized on every call; transcripts use their cached forms.
+    """
+    if isinstance(messages, ChatTranscript):
+        return messages.prompt_history(count)
+    history = [{"role": message["role"], "content": message["content"]} for message in messages[-count:]] if count > 0 else []
+    if not history:
+        return NO_HISTORY, 0
+    text = str(history)
+    return text, approx_tokens(text)
@@ -0,0 +1,122 @@
+"""
+Process warm-up.
+
+The first user after a deploy otherwise pays for opening Snowflake connections,
+resolving Cortex Search services, resuming a suspended warehouse and an empty
+retrieval cache. ``start_warmup`` runs a list of named steps once on a background
+thread and records each step's duration and outcome in a ``WarmupReport``. A
+failing step is logged and does not stop the steps after it. The steps may be
+given as a function returning them, so that building them (reading secrets,
+importing Snowflake) also happens off the caller's thread.
+"""
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple, Union
+
+logger = logging.getLogger(__name__)
+
+WarmupStep = Tuple[str, Callable[[], Any]]
+WarmupSteps = Union[Sequence[WarmupStep], Callable[[], Sequence[WarmupStep]]]
+
+
+class StepResult:
+    """Outcome of one warm-up step."""
+
+    __slots__ = ("name", "seconds", "ok", "detail")
+
+    def __init__(self, name: str, seconds: float, ok: bool, detail: str = ""):
+        self.name = name
+        self.seconds = seconds
+        self.ok = ok
+        self.detail = detail
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {"name": self.name, "seconds": round(self.seconds, 3), "ok": self.ok, "detail": self.detail}
+
+
+class WarmupReport:
+    """Progress and timings of a warm-up run, safe to read while it runs."""
+
+    def __init__(self, step_names: Sequence[str] = ()):
+        self.step_names = list(step_names)
+        self.steps: List[StepResult] = []
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._done = threading.Event()
+
+    @property
+    def done(self) -> bool:
+        return self._done.is_set()
+
+    @property
+    def total_seconds(self) -> float:
+        """Seconds since the run started, or its full duration once finished."""
+        if self.started_at is None:
+            return 0.0
+        return (self.finished_at or time.monotonic()) - self.started_at
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the run finishes, returning False on timeout."""
+        return self._done.wait(timeout)
+
+    def summary(self) -> Dict[str, Any]:
+        """Return completed and total step counts, elapsed time and per-step results."""
+        return {
+            "done": self.done,
+            "completed": len(self.steps),
+            "total": len(self.step_names),
+            "seconds": round(self.total_seconds, 3),
+            "failed": [step.name for step in self.steps if not step.ok],
+            "steps": [step.as_dict() for step in self.steps],
+        }
+
+
+def run_warmup(steps: WarmupSteps, report: Optional[WarmupReport] = None) -> WarmupReport:
+    """
+    Run warm-up steps in order, timing each one.
+
+    Args:
+        steps: ``(name, step)`` pairs, or a function returning them; a step's return
+            value, if any, is kept as its detail
+        report: Report to fill in, a new one by default
+
+    Returns:
+        The filled in report
+    """
+    report = report or WarmupReport()
+    report.started_at = time.monotonic()
+    if callable(steps):
+        started = time.monotonic()
+        try:
+            steps = steps()
+        except Exception as e:
+            # Recorded as a failed step so the report still finishes
+            report.step_names = ["setup"]
+            report.steps.append(StepResult("setup", time.monotonic() - started, False, str(e)))
+            logger.warning("Warm-up setup failed: %s", e)
+            steps = []
+    if not report.step_names:
+        report.step_names = [name for name, _ in steps]
+    for index, (name, step) in enumerate(steps, start=1):
+        started = time.monotonic()
+        try:
+            detail = step()
+            result = StepResult(name, time.monotonic() - started, True, "" if detail is None else str(detail))
+        except Exception as e:
+            result = StepResult(name, time.monotonic() - started, False, str(e))
+            logger.warning("Warm-up step %s failed after %.2fs: %s", name, result.seconds, e)
+        report.steps.append(result)
+        if result.ok:
+            logger.info("Warm-up step %d/%d %s done in %.2fs %s", index, len(steps), name, result.seconds, result.detail)
+    report.finished_at = time.monotonic()
+    report._done.set()
+    logger.info("Warm-up finished in %.2fs: %s", report.total_seconds, report.summary()["failed"] or "all steps ok")
+    return report
+
+
+def start_warmup(steps: WarmupSteps) -> WarmupReport:
+    """Build and run ``steps`` on a daemon thread and return the report it fills in."""
+    report = WarmupReport([] if callable(steps) else [name for name, _ in steps])
+    threading.Thread(target=run_warmup, args=(steps, report), name="app-warmup", daemon=True).start()
+    return report
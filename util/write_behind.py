@@ -0,0 +1,132 @@
+"""
+Write-behind plumbing shared by the persistent stores.
+
+``BatchWriter`` takes items on an in-memory queue and hands them to a write
+function in batches from a background thread: a batch is written once it holds
+``batch_size`` items or its first item has waited ``flush_interval`` seconds, so
+callers never wait for the store. ``ThreadLocalSQLite`` gives each thread its own
+connection to one SQLite database in WAL mode, since SQLite connections are not
+shared across threads.
+"""
+import logging
+import queue
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, List
+
+logger = logging.getLogger(__name__)
+
+# Queued by close() to stop the writer after the items before it
+_STOP = object()
+
+
+class BatchWriter:
+    """Background thread writing queued items in batches."""
+
+    def __init__(
+        self,
+        write: Callable[[List[Any]], None],
+        name: str,
+        batch_size: int = 100,
+        flush_interval: float = 0.5,
+        queue_size: int = 10000,
+    ):
+        """
+        Start the writer thread.
+
+        Args:
+            write: Called on the writer thread with each batch; exceptions it raises are logged
+            name: Name of the writer thread
+            batch_size: Most items in one batch
+            flush_interval: Longest time, in seconds, a queued item waits before it is written
+            queue_size: Items queued before ``submit`` refuses new ones
+        """
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._write = write
+        self._queue: queue.Queue = queue.Queue(queue_size)
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    @property
+    def pending(self) -> int:
+        """Items queued and not yet taken into a batch."""
+        return self._queue.qsize()
+
+    def submit(self, item: Any) -> bool:
+        """Queue ``item`` for writing; returns False if the queue is full and it was not queued."""
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            return False
+        return True
+
+    def _run(self) -> None:
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                self._queue.task_done()
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.flush_interval
+            stop = False
+            while len(batch) < self.batch_size:
+                try:
+                    item = self._queue.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                batch.append(item)
+            try:
+                self._write(batch)
+            except Exception:
+                logger.exception("Background write of %d items failed", len(batch))
+            for _ in range(len(batch) + stop):
+                self._queue.task_done()
+            if stop:
+                return
+
+    def flush(self) -> None:
+        """Block until every queued item has been written."""
+        self._queue.join()
+
+    def close(self) -> None:
+        """Write the queued items and stop the writer."""
+        if self._closed:
+            return
+        self._closed = True
+        self._queue.put(_STOP)
+        self._thread.join()
+
+
+class ThreadLocalSQLite:
+    """Per-thread connections to one SQLite database in WAL mode."""
+
+    def __init__(self, path: str, schema: str = ""):
+        """
+        Open (and create) the database at ``path``.
+
+        Args:
+            path: Database file
+            schema: SQL script run once, e.g. ``CREATE TABLE IF NOT EXISTS`` statements
+        """
+        self.path = path
+        self._local = threading.local()
+        connection = self.connection()
+        connection.execute("PRAGMA journal_mode=WAL")
+        if schema:
+            connection.executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        """Return this thread's connection, opening it on first use."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            # WAL keeps durability across crashes with fewer fsyncs at NORMAL
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection